@@ -1,22 +1,25 @@
 from PyQt5.Qt import QCompleter, QStringListModel
 
+from global_variable import COMPLETION_LIMIT
+
 
 # ref: https://nachtimwald.com/2009/07/04/qcompleter-and-comma-separated-tags/
 
 class QueryCompleter(QCompleter):
 
-    def __init__(self, parent, all_terms, bigram_model):
-        QCompleter.__init__(self, all_terms, parent)
-        self.all_terms = all_terms
-        self.bigram_model = bigram_model
+    def __init__(self, parent, get_query_completion):
+        """
+        :param parent:
+        :param get_query_completion: returns the QueryCompletion of the corpus, it is replaced when documents are added
+        """
+        QCompleter.__init__(self, [], parent)
+        self.get_query_completion = get_query_completion
 
     def complete_following_term(self, query):
         last_term_in_query = query.split()[-1]
-        if last_term_in_query in self.bigram_model.keys():
-            candidate_lst = []
-            possible_following_terms = self.bigram_model[last_term_in_query]
-            for t in possible_following_terms:
-                candidate_lst.append(query + t)
+        following_terms = self.get_query_completion().get_following_terms(last_term_in_query.lower(), COMPLETION_LIMIT)
+        if following_terms:
+            candidate_lst = [query + t for t, _ in following_terms]
 
             model = QStringListModel(candidate_lst, self)
             self.setModel(model)
@@ -27,10 +30,10 @@ class QueryCompleter(QCompleter):
         incomplete_term = query.split()[-1]
 
         query_before_incomplete_term = '' if query.rfind(' ') == -1 else query[:query.rfind(' ') + 1]
-        candidate_lst = []
-        for term in self.all_terms:
-            if incomplete_term in term:
-                candidate_lst.append(query_before_incomplete_term + term)
+        # the completer only shows candidates starting with the query, the best ones are looked up by prefix
+        completion_index = self.get_query_completion().get_completion_index()
+        candidate_lst = [query_before_incomplete_term + term
+                         for term in completion_index.complete(incomplete_term.lower(), COMPLETION_LIMIT)]
 
         if candidate_lst:
             model = QStringListModel(candidate_lst, self)
@@ -0,0 +1,70 @@
+import traceback
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal, pyqtSlot
+
+
+class WorkerSignals(QObject):
+    result = pyqtSignal(int, object)  # generation, return value of the function
+    error = pyqtSignal(int, str)  # generation, error message
+    progress = pyqtSignal(int, int, str)  # done, total, message
+    finished = pyqtSignal()  # always emitted last, even if the request was skipped
+
+
+class Worker(QRunnable):
+    """
+    Run a function in a QThreadPool, the outcome is delivered to the GUI thread by signals
+    Every request carries a generation, a superseded request is skipped if it has not started yet, the generation is
+    also sent back with the result so that the receiver can drop the results of superseded requests
+    """
+
+    def __init__(self, fn, *args, generation: int = 0, is_superseded=None, with_progress: bool = False, **kwargs):
+        """
+        :param fn: function to run, with args and kwargs
+        :param generation:
+        :param is_superseded: called with generation before running, the request is skipped if True, never if None
+        :param with_progress: fn also gets a progress_callback(done, total, message) emitting the progress signal
+        """
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.generation = generation
+        self.is_superseded = is_superseded
+        self.signals = WorkerSignals()
+        if with_progress:
+            self.kwargs['progress_callback'] = self.signals.progress.emit
+
+    @pyqtSlot()
+    def run(self):
+        try:
+            if self.is_superseded is not None and self.is_superseded(self.generation):
+                return
+            result = self.fn(*self.args, **self.kwargs)
+        except Exception as e:
+            traceback.print_exc()
+            self.signals.error.emit(self.generation, str(e))
+        else:
+            self.signals.result.emit(self.generation, result)
+        finally:
+            self.signals.finished.emit()
+
+
+class WorkerPool:
+    """
+    QThreadPool keeping a reference to its workers until they are finished, otherwise the signals of a worker could be
+    garbage collected while it is still running
+    """
+
+    def __init__(self, max_thread_count: int):
+        self.__thread_pool__ = QThreadPool()
+        self.__thread_pool__.setMaxThreadCount(max_thread_count)
+        self.__workers__ = set()
+
+    def start(self, worker: Worker) -> None:
+        self.__workers__.add(worker)
+        worker.signals.finished.connect(lambda: self.__workers__.discard(worker))
+        self.__thread_pool__.start(worker)
+
+    def active_count(self) -> int:
+        """Number of workers started and not finished yet"""
+        return len(self.__workers__)
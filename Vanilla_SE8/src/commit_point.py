@@ -0,0 +1,68 @@
+import pickle
+from os import replace
+from os.path import exists
+
+from global_variable import INDEX_DIR, INDEX_FILE_EXTENSION, SEGMENT_FILE_EXTENSION, COMMIT_POINT_FILE_EXTENSION, \
+    QUERY_COMPLETION_FILE_EXTENSION
+
+"""
+Commit point of a corpus, the files its indexes and bigram language model are currently made of
+
+An index is made of components: the base, i.e. the .idx file of a full build or a merged segment, followed by the
+segments flushed since. A file is never rewritten once in use, a new version gets a new name and the commit point is
+switched to it. Readers which mapped the previous files are unaffected, files left out of the commit point are removed
+once no reader maps them any more.
+
+Commit point, a dict:
+    components: list of segment numbers, None for the .idx files, the base first
+    query_completion: version of the bigram language model, None for the .qc file of a full build
+    next_version: number of the next segment or bigram language model version
+    obsolete: files left out of the commit point but not removed yet
+    query_completion_pending: doc ids in segments but not yet counted by the bigram language model
+"""
+
+
+def read_commit_point(corpus_id: str, index_dir: str = INDEX_DIR) -> dict:
+    """Commit point of a corpus, that of a full build if none was saved"""
+    path = index_dir + corpus_id + COMMIT_POINT_FILE_EXTENSION
+    if not exists(path):
+        return {'components': [None], 'query_completion': None, 'next_version': 0, 'obsolete': [],
+                'query_completion_pending': []}
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def save_commit_point(commit_point: dict, corpus_id: str, index_dir: str = INDEX_DIR) -> None:
+    """Written aside and renamed, a reader never sees a partial commit point"""
+    path = index_dir + corpus_id + COMMIT_POINT_FILE_EXTENSION
+    with open(path + '.tmp', 'wb') as f:
+        pickle.dump(commit_point, f)
+    replace(path + '.tmp', path)
+
+
+def component_file(corpus_id: str, config: str, component, index_dir: str = INDEX_DIR) -> str:
+    """
+    :param config: str of an IndexConfiguration
+    :param component: segment number, None for the .idx file
+    """
+    if component is None:
+        return index_dir + '%s_%s%s' % (corpus_id, config, INDEX_FILE_EXTENSION)
+    return index_dir + '%s_%s.%s%s' % (corpus_id, config, component, SEGMENT_FILE_EXTENSION)
+
+
+def query_completion_file(corpus_id: str, version, index_dir: str = INDEX_DIR) -> str:
+    """:param version: None for the .qc file of a full build"""
+    if version is None:
+        return index_dir + corpus_id + QUERY_COMPLETION_FILE_EXTENSION
+    return index_dir + '%s.%s%s' % (corpus_id, version, QUERY_COMPLETION_FILE_EXTENSION)
+
+
+def get_index_files(index_name: str, index_dir: str = INDEX_DIR) -> list:
+    """Files of the components of an index, e.g. '1_111', the base first"""
+    corpus_id, config = index_name.split('_')
+    return [component_file(corpus_id, config, component, index_dir)
+            for component in read_commit_point(corpus_id, index_dir)['components']]
+
+
+def get_query_completion_file(corpus_id: str, index_dir: str = INDEX_DIR) -> str:
+    return query_completion_file(corpus_id, read_commit_point(corpus_id, index_dir)['query_completion'], index_dir)
@@ -15,31 +15,72 @@ TMP_AVAILABLE_CORPUS = {'course_corpus': COURSE_CORPUS, 'Reuters': REUTERS_CORPU
 INDEX_FILE_EXTENSION = '.idx'
 CORPUS_FILE_EXTENSION = '.csv'
 QUERY_COMPLETION_FILE_EXTENSION = '.qc'
+DOC_STORE_FILE_EXTENSION = '.docs'
+SEGMENT_FILE_EXTENSION = '.seg'
+TOMBSTONE_FILE_EXTENSION = '.tomb'
+COMMIT_POINT_FILE_EXTENSION = '.commit'
+
+"""Index file format, bump when the layout of index files changes"""
+INDEX_FORMAT_VERSION = 8
+
+"""Document store file format, bump when the layout of document store files changes"""
+DOC_STORE_FORMAT_VERSION = 1
+
+"""Posting lists, number of doc ids per compressed block"""
+POSTING_BLOCK_SIZE = 128
+
+"""Index loading, max number of index configurations kept in memory"""
+INDEX_CACHE_CAPACITY = 4
+
+"""Incremental index updates"""
+WRITE_BUFFER_SIZE = 256  # added documents buffered in memory before being written as a segment
+SEGMENT_MERGE_FACTOR = 10  # segments of the same size tier merged together, a tier holds 10 times more documents
+SEGMENT_MAX_DELETED_RATIO = 0.2  # a segment with a larger share of deleted documents is rewritten without them
 
 """Index configuration"""
 ALL_POSSIBLE_INDEX_CONFIGURATIONS = __get_all_possible_index_configurations__()
 TMP_ALL_POSSIBLE_INDEX_CONF_TUPLES = [tuple(e for e in ALL_POSSIBLE_INDEX_CONFIGURATIONS)]
 
+"""Text processing"""
+STEM_CACHE_SIZE = 2 ** 16
+
 """Retrieval model"""
 BOOLEAN_MODEL = 'boolean'
 VSM_MODEL = 'vsm'
 QUERY_MODELS = {VSM_MODEL, BOOLEAN_MODEL}
+RESULT_CACHE_CAPACITY = 256
 
 """VSM retrieval specific"""
 DOC_RETRIEVAL_LIMIT = 10
+VSM_EXHAUSTIVE = 'exhaustive'
+VSM_MAXSCORE = 'maxscore'
+VSM_EVALUATORS = {VSM_EXHAUSTIVE, VSM_MAXSCORE}
+QUERY_BATCH_SIZE = 256  # queries of a batch scored by one sparse matrix product
 
 """Boolean retrieval specific"""
 DUMMY_WORD = 'DUMMY_WORD'
 
 """Spelling correction"""
 UNFOUND_TERM_LIMIT = 3
+CORRECTION_CACHE_CAPACITY = 2 ** 12
+CORRECTION_CACHE_FILE = INDEX_DIR + 'spelling_correction.cache'
 
 """Bigram language model - Query completion"""
 BLM_THRESHOLD = 5
+QUERY_COMPLETION_FORMAT_VERSION = 2  # bump when the layout of query completion files changes
+COMPLETION_LIMIT = 10  # max number of completions of an incomplete term
+COMPLETION_PREFIX_LENGTH = 3  # best completions of prefixes up to this length are precomputed
 
 """Reuters - topic"""
 TOPIC_INVERTED_INDEX = CORPUS_DIR + 'topic.idx'
 
+"""HTTP server, localhost only"""
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 8000
+SERVER_WORKERS = 4  # pre-forked worker processes, each one serves a request at a time
+SERVER_BACKLOG = 64  # max connections waiting for a worker
+SERVER_REQUEST_TIMEOUT = 5  # seconds
+
 """Relevance feedback"""
 ALPHA = 1
 BETA = 0.75
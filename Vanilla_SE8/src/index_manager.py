@@ -0,0 +1,40 @@
+from index_v2 import Index_v2
+from index_reader import IndexReader
+from commit_point import get_index_files
+from util.lru_cache import LRUCache
+from global_variable import INDEX_DIR, INDEX_CACHE_CAPACITY
+
+
+class IndexManager:
+    """
+    Load indexes on demand, the first time a configuration is requested
+    At most `capacity` indexes are kept resident, the least recently used one is evicted beyond that
+    An index is read from the files of its commit point, its base and segments, see IndexReader
+    """
+
+    def __init__(self, index_dir: str = INDEX_DIR, capacity: int = INDEX_CACHE_CAPACITY):
+        self.index_dir = index_dir
+        self.__indexes__ = LRUCache(capacity=capacity)  # k: index name e.g. '1_111', v: IndexReader
+
+    def get(self, index_name: str) -> IndexReader:
+        """Get index by name, e.g. '1_111' for Reuters with stopwords removal, stemming and normalization"""
+        index = self.__indexes__.get(index_name)
+        if index is None:
+            index = IndexReader([Index_v2.load(index_file)
+                                 for index_file in get_index_files(index_name, self.index_dir)])
+            self.__indexes__.put(index_name, index)
+        return index
+
+    def clear(self) -> None:
+        self.__indexes__.clear()
+
+    def resident_indexes(self) -> list:
+        """Names of loaded indexes, from the least to the most recently used"""
+        return self.__indexes__.keys()
+
+    def memory_usage(self) -> dict:
+        """k: index name, v: size in bytes of the arrays of the index"""
+        return {index_name: index.memory_usage() for index_name, index in self.__indexes__.items()}
+
+    def stats(self) -> dict:
+        return self.__indexes__.stats()
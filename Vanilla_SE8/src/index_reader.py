@@ -0,0 +1,126 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from index_v2 import __idf__
+from util.spelling_candidates import build_spelling_candidates, SpellingCandidateIndex
+
+
+class IndexReader:
+    """
+    Search view of an index made of several components, the base index followed by the segments flushed since, see
+    index_writer
+    Term ids are those of the base, followed by the terms only found in segments. Statistics are those of all the
+    components together, as if they were one index: a query is scored by every component with its weights rescaled
+    from the idf of the component to the global idf. Deleted documents still count in the statistics until merged.
+    """
+
+    def __init__(self, components: list):
+        """:param components: list of Index_v2, the base first"""
+        self.components = components
+        base = components[0]
+        self.config = base.config
+        # changes with any component, spelling corrections of a previous reader are never served
+        self.build_id = '+'.join(component.build_id for component in components)
+
+        self.__new_terms__ = {}  # k: term only found in segments, v: term id
+        self.__term_ids__ = [None]  # by component, term id of every term of the component, None for the base
+        for segment in components[1:]:
+            term_ids = np.empty(len(segment.terms), dtype=np.int64)
+            for local_term_id, term in enumerate(segment.terms):
+                term_id = base.get_term_id(term)
+                if term_id == -1:
+                    term_id = self.__new_terms__.setdefault(term, len(base.terms) + len(self.__new_terms__))
+                term_ids[local_term_id] = term_id
+            self.__term_ids__.append(term_ids)
+        self.term_count = len(base.terms) + len(self.__new_terms__)
+
+        self.doc_count = sum(component.tf_idf_matrix.shape[0] for component in components)
+        if len(components) == 1:
+            self.tf_over_corpus = base.tf_over_corpus
+            self.document_frequency = base.document_frequency
+        else:
+            self.tf_over_corpus = np.zeros(self.term_count, dtype=np.int64)
+            self.tf_over_corpus[:len(base.terms)] = base.tf_over_corpus
+            self.document_frequency = np.zeros(self.term_count, dtype=np.int64)
+            self.document_frequency[:len(base.terms)] = base.document_frequency
+            for segment, term_ids in zip(components[1:], self.__term_ids__[1:]):
+                np.add.at(self.tf_over_corpus, term_ids, segment.tf_over_corpus)
+                np.add.at(self.document_frequency, term_ids, segment.document_frequency)
+        self.idf = __idf__(document_frequency=self.document_frequency, doc_count=self.doc_count)
+
+        # k: component, v: local term id of every term id, -1 if the component does not have the term
+        self.__local_term_ids__ = {}
+        self.__spelling_candidates__ = None  # (terms, SpellingCandidateIndex) of all components, built on demand
+
+    def __str__(self):
+        return str(self.components[0])
+
+    def memory_usage(self) -> int:
+        return sum(component.memory_usage() for component in self.components)
+
+    def max_doc_id(self) -> int:
+        """Largest integer doc id of all components, -1 if there is no document"""
+        return max(int(component.doc_id_values.max(initial=-1)) for component in self.components)
+
+    def get_term_id(self, term: str) -> int:
+        """Get term id, -1 if no component has the term"""
+        term_id = self.components[0].get_term_id(term)
+        return term_id if term_id != -1 else self.__new_terms__.get(term, -1)
+
+    def get_total_term_frequency(self, term: str) -> int:
+        """Term frequency over the documents of all components, 0 if term is not in index"""
+        term_id = self.get_term_id(term)
+        return int(self.tf_over_corpus[term_id]) if term_id != -1 else 0
+
+    def get_spelling_candidates(self) -> tuple:
+        """
+        Terms of all components in sorted order, as those of a full build, with their SpellingCandidateIndex
+        :return: (terms, SpellingCandidateIndex)
+        """
+        base = self.components[0]
+        if len(self.components) == 1:
+            return base.terms, base.spelling_candidates
+        if self.__spelling_candidates__ is None:
+            terms = sorted(list(base.terms) + list(self.__new_terms__.keys()))
+            self.__spelling_candidates__ = (terms, SpellingCandidateIndex(build_spelling_candidates(terms)))
+        return self.__spelling_candidates__
+
+    def localize(self, component: int, query_matrix: csr_matrix) -> csr_matrix:
+        """
+        Queries over the terms of a component, weighted so that its scores are those of the global idf
+        :param component: position in components
+        :param query_matrix: csr_matrix (number of queries, v), a query by row, over the term ids of the reader
+        :return: csr_matrix (number of queries, number of terms of the component)
+        """
+        if len(self.components) == 1 and query_matrix.shape[1] == self.term_count:
+            return query_matrix
+        index = self.components[component]
+        query_matrix = csr_matrix(query_matrix)
+        query_ids = np.repeat(np.arange(query_matrix.shape[0]), np.diff(query_matrix.indptr))
+        term_ids = query_matrix.indices.astype(np.int64)
+        local_term_ids = self.__get_local_term_ids__(component)
+
+        # vectors of relevance feedback may hold term ids of an older reader
+        known = term_ids < len(local_term_ids)
+        local = np.full(len(term_ids), -1, dtype=np.int64)
+        local[known] = local_term_ids[term_ids[known]]
+        kept = local != -1
+        query_ids, term_ids, local = query_ids[kept], term_ids[kept], local[kept]
+
+        idf = __idf__(document_frequency=index.document_frequency[local], doc_count=index.tf_idf_matrix.shape[0])
+        weights = query_matrix.data[kept].astype(np.float64) * (self.idf[term_ids] / idf)
+        return csr_matrix((weights, (query_ids, local)), shape=(query_matrix.shape[0], len(index.terms)))
+
+    def __get_local_term_ids__(self, component: int) -> np.ndarray:
+        local_term_ids = self.__local_term_ids__.get(component)
+        if local_term_ids is None:
+            local_term_ids = np.full(self.term_count, -1, dtype=np.int64)
+            if component == 0:
+                base_term_count = len(self.components[0].terms)
+                local_term_ids[:base_term_count] = np.arange(base_term_count)
+            else:
+                term_ids = self.__term_ids__[component]
+                local_term_ids[term_ids] = np.arange(len(term_ids))
+            self.__local_term_ids__[component] = local_term_ids
+        return local_term_ids
+
@@ -1,19 +1,21 @@
 import numpy as np
 import pandas as pd
-from math import log10, floor
-from scipy.sparse import csr_matrix
-from os import cpu_count
+from scipy.sparse import csr_matrix, csc_matrix
+from collections import Counter
+from os import replace
 from os.path import exists
 from time import time
-import ray
-import pickle
+from uuid import uuid4
 
 from intermediate_class.index_configuration import IndexConfiguration
 from intermediate_class.query_completion import QueryCompletion
-from util.text_processing import process
-from global_variable import COURSE_CORPUS, INDEX_DIR, INDEX_FILE_EXTENSION, QUERY_COMPLETION_FILE_EXTENSION, \
-    BLM_THRESHOLD, REUTERS_CORPUS
-from util.wildcard_handler import get_bigrams
+from util.text_processing import process_many, tokenize, stem, STOP_WORDS
+from commit_point import get_query_completion_file
+from global_variable import COURSE_CORPUS, INDEX_DIR, INDEX_FILE_EXTENSION, REUTERS_CORPUS, INDEX_FORMAT_VERSION
+from util.wildcard_handler import build_permuterm, PermutermIndex
+from util.spelling_candidates import build_spelling_candidates, SpellingCandidateIndex
+from util.binary_storage import save_arrays, load_arrays, read_header, StringTable, SortedStringTable
+from util.posting_compression import compress_postings, PostingList
 
 
 class Index_v2:
@@ -22,247 +24,298 @@ class Index_v2:
         self.__corpus__ = corpus
         self.__corpus_id__ = '0' if corpus == COURSE_CORPUS else '1'  # 0 for course corpus, 1 for Reuters
         self.config = index_conf
+        self.build_id = None  # changes every time the index is built
 
         # placeholders
         self.tf_idf_matrix = None  # csr_matrix
-        self.inverted_index = None  # k: term, v: doc_id list
-        self.terms = None  # set
-        self.tf_over_corpus = None
-        self.doc_ids = None
-        self.bigram_index = None  # mapping bigram to terms
-
-    def build(self):
-        """Build and save index"""
-        # ray.init(num_cpus=cpu_count())
-        _index = __build_index__(corpus_path=self.__corpus__, index_conf=self.config)
-        # ray.shutdown()
-        self.tf_idf_matrix = _index[0]
-        self.inverted_index = _index[1]
-        self.terms = sorted(list(_index[2]))
-        self.doc_ids = _index[3]
-        self.tf_over_corpus = _index[4]
-        self.bigram_index = _index[5]
-
-        out_path = INDEX_DIR + str(self) + INDEX_FILE_EXTENSION
-        with open(out_path, 'wb') as f:
-            pickle.dump(self, f)
+        self.tf_matrix = None  # csr_matrix, raw term frequencies, same layout as tf_idf_matrix
+        self.tf_idf_csc = None  # csc_matrix, same matrix in column layout for scoring only the query terms
+        self.tf_idf_max = None  # ndarray, max tf-idf value of every term, score upper bound for dynamic pruning
+        self.terms = None  # SortedStringTable, position of a term is its term id
+        self.doc_ids = None  # StringTable, doc id of every row of tf_idf_matrix
+        self.doc_id_values = None  # ndarray, doc_ids as integers
+        self.tf_over_corpus = None  # ndarray, term frequency over the entire corpus, by term id
+        self.postings = None  # dict of compressed posting arrays of all terms, see util.posting_compression
+        self.document_frequency = None  # ndarray, number of documents of every term, by term id
+        self.permuterm = None  # PermutermIndex, for wildcard queries
+        self.spelling_candidates = None  # SpellingCandidateIndex, for spelling correction
+
+    def build(self, processed_docs=None):
+        """
+        Build and save index
+        :param processed_docs: list of (doc_id, terms) already processed with this configuration, the corpus is read
+        and processed from scratch if not provided
+        """
+        if processed_docs is None:
+            corpus_df = __read_corpus__(corpus_path=self.__corpus__)
+            processed_docs = list(zip(corpus_df['doc_id'],
+                                      process_many(strings=corpus_df['to_be_processed'], config=self.config)))
+
+        tf_matrix, doc_ids, terms = __build_index__(processed_docs=processed_docs)
+        self.build_from_term_frequencies(tf_matrix=tf_matrix, doc_ids=doc_ids, terms=terms)
+
+    def build_from_term_frequencies(self, tf_matrix: csr_matrix, doc_ids: list, terms: list, out_path: str = None):
+        """
+        Build and save index from term frequencies, e.g. merged ones, see __build_index__
+        The file is written aside and then renamed over the previous one, indexes already mapping it remain valid
+        :param out_path: index file of this configuration in INDEX_DIR if not provided
+        """
+        arrays = __index_2_arrays__(tf_matrix=tf_matrix, doc_ids=doc_ids, terms=terms)
+        meta = {'corpus': self.__corpus__,
+                'config': {'stop_words_removal': self.config.stop_words_removal, 'stemming': self.config.stemming,
+                           'normalization': self.config.normalization},
+                'shape': list(tf_matrix.shape),
+                'build_id': uuid4().hex}
+
+        if out_path is None:
+            out_path = INDEX_DIR + str(self) + INDEX_FILE_EXTENSION
+        save_arrays(path=out_path + '.tmp', arrays=arrays, meta=meta, version=INDEX_FORMAT_VERSION)
+        replace(out_path + '.tmp', out_path)
+        self.__set_arrays__(arrays=arrays, meta=meta)
 
     @staticmethod
     def load(index_file: str):
-        with open(index_file, 'rb') as f:
-            index = pickle.load(f)
+        """Open an index file, arrays are memory-mapped rather than read"""
+        arrays, meta = load_arrays(path=index_file, version=INDEX_FORMAT_VERSION)
+        index = Index_v2(corpus=meta['corpus'], index_conf=IndexConfiguration(**meta['config']))
+        index.__set_arrays__(arrays=arrays, meta=meta)
         return index
 
+    @staticmethod
+    def is_valid_index_file(index_file: str) -> bool:
+        """Check if a file is an index of the current format version"""
+        return read_header(path=index_file, version=INDEX_FORMAT_VERSION) is not None
+
+    def __set_arrays__(self, arrays: dict, meta: dict):
+        self.build_id = meta.get('build_id', '')
+        self.tf_idf_matrix = csr_matrix((arrays['tf_idf_data'], arrays['tf_idf_indices'], arrays['tf_idf_indptr']),
+                                        shape=tuple(meta['shape']), copy=False)
+        self.tf_matrix = csr_matrix((arrays['tf_counts'], arrays['tf_idf_indices'], arrays['tf_idf_indptr']),
+                                    shape=tuple(meta['shape']), copy=False)
+        self.tf_idf_csc = csc_matrix((arrays['tf_idf_csc_data'], arrays['tf_idf_csc_indices'],
+                                      arrays['tf_idf_csc_indptr']), shape=tuple(meta['shape']), copy=False)
+        self.tf_idf_max = arrays['tf_idf_max']
+        self.terms = SortedStringTable.from_arrays(arrays, 'terms')
+        self.doc_ids = StringTable.from_arrays(arrays, 'doc_ids')
+        self.doc_id_values = arrays['doc_id_values']
+        self.tf_over_corpus = arrays['tf_over_corpus']
+        self.postings = {name: arr for name, arr in arrays.items() if name.startswith('postings_')}
+        self.document_frequency = self.postings['postings_df']
+        self.permuterm = PermutermIndex(arrays, terms=self.terms)
+        self.spelling_candidates = SpellingCandidateIndex(arrays)
+
     def __str__(self):
         return '%s_%s' % (str(self.__corpus_id__), str(self.config))
 
-    def get(self, term: str) -> list:
-        """Get postings list by term"""
-        if term in self.terms:
-            tmp = self.inverted_index[term]
-            tmp = [int(e) for e in tmp]
-            return tmp
+    def memory_usage(self) -> int:
+        """Size in bytes of all arrays of the index, for a loaded index this is the size mapped from the index file"""
+        matrix, csc = self.tf_idf_matrix, self.tf_idf_csc
+        arrays = [matrix.data, matrix.indices, matrix.indptr, self.tf_matrix.data, csc.data, csc.indices, csc.indptr,
+                  self.tf_idf_max, self.doc_id_values, self.tf_over_corpus] + list(self.postings.values())
+        string_tables = [self.terms, self.doc_ids]
+        return sum(arr.nbytes for arr in arrays) + sum(table.nbytes() for table in string_tables) + \
+            self.permuterm.nbytes() + self.spelling_candidates.nbytes()
+
+    def get_term_frequencies(self) -> (csr_matrix, list, list):
+        """(tf_matrix, doc_ids, terms) the index was built from, see __build_index__"""
+        return self.tf_matrix, list(self.doc_ids), list(self.terms)
+
+    def get_row_mask(self, doc_mask: np.ndarray) -> np.ndarray:
+        """Convert a bool array by integer doc id into a bool array by row of tf_idf_matrix"""
+        in_range = self.doc_id_values < len(doc_mask)
+        row_mask = np.zeros(len(self.doc_id_values), dtype=bool)
+        row_mask[in_range] = doc_mask[self.doc_id_values[in_range]]
+        return row_mask
+
+    def get_term_id(self, term: str) -> int:
+        """Get term id, i.e. column in tf_idf_matrix, -1 if term is not in index"""
+        return self.terms.find(term)
+
+    def get(self, term: str) -> np.ndarray:
+        """Get postings list by term, numerically sorted doc ids"""
+        term_id = self.get_term_id(term)
+        if term_id != -1:
+            return self.get_by_term_id(term_id)
         else:
-            return []
+            return np.empty(0, dtype=np.int64)
+
+    def get_by_term_id(self, term_id: int) -> np.ndarray:
+        """Get postings list by term id, numerically sorted doc ids"""
+        return self.get_posting_list(term_id).decode()
+
+    def get_posting_list(self, term_id: int) -> PostingList:
+        """Get compressed postings list by term id, for block-wise decoding"""
+        return PostingList(self.postings, term_id)
+
+    def get_document_frequency(self, term_id: int) -> int:
+        return int(self.document_frequency[term_id])
 
     def get_total_term_frequency(self, term: str) -> int:
         """Get term frequency over the entire corpus"""
-        return self.tf_over_corpus[term]
+        term_id = self.get_term_id(term)
+        return int(self.tf_over_corpus[term_id]) if term_id != -1 else 0
 
+    def get_term_ids_by_wildcard(self, pattern: str) -> np.ndarray:
+        """Get sorted ids of the terms matching a wildcard pattern, e.g. 'comp*', '*tion', 'c*ut*r'"""
+        return self.permuterm.lookup(pattern)
 
-def __build_index__(corpus_path: str, index_conf: IndexConfiguration):
-    def __df_p1__(term: str):
-        if term in raw_df.keys():
-            raw_df[term] += 1
-        else:
-            raw_df[term] = 1
 
-    def __tf_p1__(doc_id: str, term: str):
-        if doc_id in raw_tf.keys():
-            term_tf_dict = raw_tf[doc_id]
-            if term in term_tf_dict.keys():
-                term_tf_dict[term] += 1
-            else:
-                term_tf_dict[term] = 1
-        else:
-            raw_tf[doc_id] = {term: 1}
+def build_all_indexes(corpus_path: str, on_index_built=None) -> None:
+    """
+    Build and save the indexes of all possible configurations of a corpus
+    :param corpus_path:
+    :param on_index_built: called with the name of every index once saved, e.g. for reporting progress
+    """
+    corpus_df = __read_corpus__(corpus_path=corpus_path)
+    docs = list(zip(corpus_df['doc_id'], corpus_df['to_be_processed']))
+    for index_conf, processed_docs in process_all_configurations(docs):
+        index = Index_v2(corpus=corpus_path, index_conf=index_conf)
+        index.build(processed_docs=processed_docs)
+        if on_index_built is not None:
+            on_index_built(str(index))
 
-    def __update_inverted_index__(doc_id: str, term: str):
-        if term in inverted_index.keys():
-            inverted_index[term].add(doc_id)
-        else:
-            inverted_index[term] = {doc_id}
-
-    def __sort_inverted_index_posting_lists__() -> dict:
-        return {term: sorted(list(doc_id_set)) for term, doc_id_set in inverted_index.items()}
-
-    def __update_bigram_index__(term: str):
-        if term not in all_terms and (term.isalpha() and len(term) >= 2):
-            bigrams = get_bigrams(term)
-            for bigram in bigrams:
-                if bigram in bigram_index.keys():
-                    bigram_index[bigram].add(term)
-                else:
-                    bigram_index[bigram] = {term}
-
-    def __update_tf_over_corpus__(term: str):
-        if term in tf_over_corpus.keys():
-            tf_over_corpus[term] += 1
-        else:
-            tf_over_corpus[term] = 1
-
-    def __update_index__(docid: str, term: str):
-        __df_p1__(term)
-        __tf_p1__(doc_id=docid, term=term)
-        __update_inverted_index__(doc_id=docid, term=term)
-        __update_bigram_index__(term)
-        __update_tf_over_corpus__(term)
-
-    def __process_row__(string: str, index_conf: IndexConfiguration, doc_id: str):
-        terms = process(string=string, config=index_conf)
-        for term in terms:
-            __update_index__(docid=doc_id, term=term)
-        all_terms.update(terms)
-
-    def __get_tf_idf_matrix__() -> csr_matrix:
-
-        # tf_idf = {k: doc_id, v: {k: term, v: tf_idf value}}
-        tf_idf_dict = {doc_id: {term: (log10(1 + tf) * log10(doc_count / raw_df[term] + 1))
-                                for term, tf in v.items()}
-                       for doc_id, v in raw_tf.items()}
-
-        def __get_chunks__(lst, n):
-            chunk_size = floor(len(lst) / n)
-            r = []
-            ptr = 0
-            for i in range(0, n - 1):
-                r.append(lst[ptr:ptr + chunk_size])
-                ptr += chunk_size
-            r.append(lst[ptr:])
-            return r
-
-        @ray.remote
-        def __worker__(_tf_idf_dict, _terms, _raw_tf, doc_ids_chunk, shape):
-
-            tf_idf_matrix_piece = np.zeros((shape[0], shape[1]), dtype=np.float16)
-
-            for row, doc_id in enumerate(doc_ids_chunk):
-                terms_in_doc = _raw_tf[doc_id].keys()
-                for term in terms_in_doc:
-                    col = _terms.index(term)
-                    tf_idf_matrix_piece[row, col] = _tf_idf_dict[doc_id][term]
-            return tf_idf_matrix_piece
-
-        doc_ids = sorted(raw_tf.keys())
-        terms = sorted(raw_df.keys())
-
-        doc_ids_chunks = __get_chunks__(doc_ids, cpu_count())
-
-        _tf_idf_dict_id = ray.put(tf_idf_dict)
-        _terms_id = ray.put(terms)
-        _raw_tf_id = ray.put(raw_tf)
-
-        results = ray.get([
-            __worker__.remote(
-                _tf_idf_dict=_tf_idf_dict_id, _terms=_terms_id, _raw_tf=_raw_tf_id,
-                doc_ids_chunk=doc_ids_chunks[i],
-                shape=(len(doc_ids_chunks[i]), len(terms))
-            ) for i in range(len(doc_ids_chunks))
-        ])
-
-        tf_idf_matrix = np.concatenate(results, axis=0)
-
-        return csr_matrix(tf_idf_matrix)
 
+def process_all_configurations(docs: list):
     """
-    Main logic of constructing index
+    Process documents with all possible configurations
+    Every document is tokenized only once per normalization setting, stop words removal and stemming are derived from
+    that shared token stream
+    :param docs: list of (doc_id, string)
+    :return: generator of (IndexConfiguration, list of (doc_id, terms))
     """
-    all_terms = set()
-    raw_df = {}  # k: term, v: df value
-    raw_tf = {}  # k: doc_id, v: {k: term, v: tf value}
-    inverted_index = {}  # k: term, v: doc_id list
-    bigram_index = {}  # k: bigram, v: {terms}
-    tf_over_corpus = {}  # k: term, v: term frequency over the entire corpus
-
-    # Read corpus csv file
+    for normalization in [False, True]:
+        # Stage 1: tokenize
+        token_streams = [tokenize(string, normalization) for _, string in docs]
+
+        # Stage 2: stop words mask and stems, aligned with tokens
+        stop_words_masks = [[t in STOP_WORDS for t in tokens] for tokens in token_streams]
+        stem_streams = [stem(tokens) for tokens in token_streams]
+
+        # Stage 3: derive terms of every configuration sharing this normalization setting
+        for stop_words_removal in [False, True]:
+            for stemming in [False, True]:
+                processed_docs = []
+                for (doc_id, _), tokens, stems, mask in zip(docs, token_streams, stem_streams, stop_words_masks):
+                    terms = stems if stemming else tokens
+                    if stop_words_removal:
+                        terms = [t for t, is_stop_word in zip(terms, mask) if not is_stop_word]
+                    # In case document contains only stopwords and they are removed, same as process()
+                    processed_docs.append((doc_id, terms if len(terms) != 0 else ['']))
+
+                index_conf = IndexConfiguration(stop_words_removal=stop_words_removal, stemming=stemming,
+                                                normalization=normalization)
+                yield index_conf, processed_docs
+
+
+def __read_corpus__(corpus_path: str) -> pd.DataFrame:
+    """Read corpus csv file, also build the bigram language model of the corpus if not existing"""
     corpus_df = \
         pd.read_csv(corpus_path, names=['doc_id', 'title', 'content'], dtype=str, na_filter=False, index_col=False)
-    doc_count = len(corpus_df.index)
 
     # Building bigram language model
-    """
-    the model here is in the form of {term1: [other terms]}, other terms are sorted by frequency decreasingly
-    'other terms' are refer to those that have frequency more than the threshold
-    """
-    _blm_path = INDEX_DIR + ('0' if corpus_path == COURSE_CORPUS else '1') + QUERY_COMPLETION_FILE_EXTENSION
-    if not exists(_blm_path):
+    _blm_path = get_query_completion_file('0' if corpus_path == COURSE_CORPUS else '1')
+    if not exists(_blm_path) or not QueryCompletion.is_valid_file(_blm_path):
         __build_bigram_language_model__(blm_out_path=_blm_path, corpus_df=corpus_df)
 
     corpus_df['to_be_processed'] = corpus_df['title'] + ' ' + corpus_df['content']
     corpus_df.drop(columns=['title', 'content'], inplace=True)
+    return corpus_df
 
-    # Constructing index by going through all rows
-    corpus_df.apply(
-        lambda row: __process_row__(doc_id=row['doc_id'], string=row['to_be_processed'], index_conf=index_conf), axis=1)
-    inverted_index = __sort_inverted_index_posting_lists__()
-
-    tf_idf_matrix_csr = __get_tf_idf_matrix__()
 
-    return tf_idf_matrix_csr, inverted_index, all_terms, sorted(raw_tf.keys()), tf_over_corpus, bigram_index
-
-
-def bigrams_2_terms(index: Index_v2, bigrams: set) -> set:
-    terms_sets = []
-    for bigram in bigrams:
-        terms_sets.append(index.bigram_index[bigram])
-    terms_set = set.intersection(*terms_sets)
-    return terms_set
+def __build_index__(processed_docs: list) -> (csr_matrix, list, list):
+    """
+    Count term frequencies of processed documents, every other structure of the index is derived from them
+    :param processed_docs: list of (doc_id, terms)
+    :return: (tf_matrix, doc_ids, terms), tf_matrix is an int32 csr_matrix whose rows are the sorted doc ids and
+    columns the sorted terms
+    """
+    raw_tf = {}  # k: doc_id, v: Counter, k: term, v: tf value
+    for doc_id, terms in processed_docs:
+        if doc_id in raw_tf.keys():
+            raw_tf[doc_id].update(terms)
+        else:
+            raw_tf[doc_id] = Counter(terms)
+
+    doc_ids = sorted(raw_tf.keys())
+    terms = sorted(set(term for term_tf_dict in raw_tf.values() for term in term_tf_dict.keys()))
+    term_2_col = {term: col for col, term in enumerate(terms)}  # k: term, v: column in tf matrix
+
+    # built directly from (row, col, tf) triplets, memory stays proportional to the number of non-zero entries
+    nnz = sum(len(v) for v in raw_tf.values())
+    rows = np.empty(nnz, dtype=np.int32)
+    cols = np.empty(nnz, dtype=np.int32)
+    tfs = np.empty(nnz, dtype=np.int32)
+    ptr = 0
+    for row, doc_id in enumerate(doc_ids):
+        term_tf_dict = raw_tf[doc_id]
+        n = len(term_tf_dict)
+        rows[ptr:ptr + n] = row
+        cols[ptr:ptr + n] = [term_2_col[term] for term in term_tf_dict.keys()]
+        tfs[ptr:ptr + n] = list(term_tf_dict.values())
+        ptr += n
+
+    tf_matrix = csr_matrix((tfs, (rows, cols)), shape=(len(doc_ids), len(terms)), dtype=np.int32)
+    tf_matrix.sort_indices()
+    return tf_matrix, doc_ids, terms
+
+
+def __index_2_arrays__(tf_matrix: csr_matrix, doc_ids: list, terms: list) -> dict:
+    """
+    Derive all arrays of the index from term frequencies, see __build_index__
+    Idf, tf-idf weights, posting lists and tf over corpus all come from tf_matrix, so an index
+    rebuilt from merged term frequencies is the same as one built from scratch
+    """
+    tf_matrix = csr_matrix(tf_matrix)
+    tf_matrix.sort_indices()
+    doc_count, term_count = tf_matrix.shape
+    indices = tf_matrix.indices.astype(np.int32)
+    indptr = tf_matrix.indptr.astype(np.int64)
+    doc_id_values = np.asarray([int(doc_id) for doc_id in doc_ids], dtype=np.int64)
+
+    tf_over_corpus = np.bincount(indices, weights=tf_matrix.data, minlength=term_count).astype(np.int64)
+    idf = __idf__(document_frequency=np.bincount(indices, minlength=term_count), doc_count=doc_count)
+    weights = (np.log10(1 + tf_matrix.data.astype(np.float32)) * idf[indices]).astype(np.float32)
+    tf_idf_matrix = csr_matrix((weights, indices, indptr), shape=tf_matrix.shape, copy=False)
+
+    # posting lists are the columns of the tf matrix, with doc ids numerically sorted
+    tf_csc = tf_matrix.tocsc()
+    entry_terms = np.repeat(np.arange(term_count), np.diff(tf_csc.indptr))
+    postings = doc_id_values[tf_csc.indices][np.lexsort((doc_id_values[tf_csc.indices], entry_terms))]
+
+    tf_idf_csc = tf_idf_matrix.tocsc()
+    tf_idf_csc.sort_indices()
+    tf_idf_max = np.zeros(term_count, dtype=np.float32)
+    non_empty = np.diff(tf_idf_csc.indptr) > 0
+    if np.any(non_empty):
+        tf_idf_max[non_empty] = np.maximum.reduceat(tf_idf_csc.data, tf_idf_csc.indptr[:-1][non_empty])
+    arrays = {'tf_idf_data': weights,
+              'tf_idf_indices': indices,
+              'tf_idf_indptr': indptr,
+              'tf_counts': tf_matrix.data.astype(np.int32),  # shares indices and indptr with tf_idf
+              'tf_idf_csc_data': tf_idf_csc.data.astype(np.float32),
+              'tf_idf_csc_indices': tf_idf_csc.indices.astype(np.int32),
+              'tf_idf_csc_indptr': tf_idf_csc.indptr.astype(np.int64),
+              'tf_idf_max': tf_idf_max,
+              'doc_id_values': doc_id_values,
+              'tf_over_corpus': tf_over_corpus}
+    arrays.update(compress_postings(postings=postings, indptr=tf_csc.indptr))
+    arrays.update(StringTable.from_strings(terms).to_arrays('terms'))
+    arrays.update(StringTable.from_strings(doc_ids).to_arrays('doc_ids'))
+    arrays.update(build_permuterm(terms))
+    arrays.update(build_spelling_candidates(terms))
+    return arrays
+
+
+def __idf__(document_frequency: np.ndarray, doc_count: int) -> np.ndarray:
+    """Idf of terms from the number of documents they occur in"""
+    df = document_frequency.astype(np.float32)
+    return np.log10(doc_count / np.maximum(df, 1) + 1)
 
 
 def __build_bigram_language_model__(blm_out_path, corpus_df) -> None:
-    # during construction: k: term1, v: {k: term2, v: count of appearing after term1}
-    # at returning time, v should be stored in decreasing order by v.v, for every term
-    # v should also contain only term2 with v.v larger than threshold
-    #
-    # TODO v can be just sorted list of terms?
-
-    import nltk
-
-    def update_bigram_model(term1: str, term2: str):
-        if term1 in bigram_model.keys():
-            if term2 in bigram_model[term1].keys():
-                bigram_model[term1][term2] += 1
-            else:
-                bigram_model[term1][term2] = 1
-        else:
-            bigram_model[term1] = {term2: 1}
-
-    def finalize_bigram_model():
-        all_terms = list(bigram_model.keys())
-        tmp = {term1: sorted([(term2, count) for term2, count in v.items() if count >= BLM_THRESHOLD], reverse=True,
-                             key=lambda x: x[1]) for term1, v in bigram_model.items()}
-        tmp = {term1: [tpl[0] for tpl in v] for term1, v in tmp.items() if v != []}
-        return tmp, all_terms
-
-    def process_row(row_str):
-        sentence_tokens_list = [
-            [y for y in x.split()
-             if (y not in nltk.corpus.stopwords.words('english') and y.isalpha())]
-            for x in row_str.lower().split('.') if x != '']
-
-        for sentence_tokens in sentence_tokens_list:
-            for i in range(0, len(sentence_tokens) - 1):
-                update_bigram_model(sentence_tokens[i], sentence_tokens[i + 1])
-
-    bigram_model = {}
-    corpus_df['blm'] = corpus_df['title'] + '.' + corpus_df['content']
-    corpus_df['blm'].apply(lambda row: process_row(row))
-    corpus_df.drop(columns='blm', inplace=True)
-    bigram_model, all_terms = finalize_bigram_model()
-    query_completion = QueryCompletion(bigram_model=bigram_model, all_terms=all_terms)
-
-    with open(blm_out_path, 'wb') as f:
-        pickle.dump(query_completion, f)
+    """Build and save the bigram language model of a corpus, see QueryCompletion"""
+    texts = corpus_df['title'] + '.' + corpus_df['content']
+    QueryCompletion.build(texts, meta={'corpus_rows': len(corpus_df)}).save(blm_out_path)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,384 @@
+import csv
+import pickle
+import threading
+import numpy as np
+from os import remove, replace
+from os.path import exists
+from scipy.sparse import csr_matrix, vstack
+
+from index_v2 import Index_v2, process_all_configurations, __build_index__
+from intermediate_class.query_completion import QueryCompletion
+from commit_point import read_commit_point, save_commit_point, component_file, query_completion_file
+from global_variable import INDEX_DIR, TOMBSTONE_FILE_EXTENSION, WRITE_BUFFER_SIZE, SEGMENT_MERGE_FACTOR, \
+    SEGMENT_MAX_DELETED_RATIO, COURSE_CORPUS, ALL_POSSIBLE_INDEX_CONFIGURATIONS
+
+"""
+Incremental updates of the indexes of a corpus
+
+Added documents are buffered in memory, a full buffer is flushed: the documents are appended to the corpus csv and
+indexed, for every configuration, as a new segment, a small index searchable right away next to the base index, see
+IndexReader. Deleted documents are kept as tombstones, they are filtered out of the results right away.
+
+Segments are merged in the background on a size-tiered policy: the size tier of a component is the number of times
+SEGMENT_MERGE_FACTOR goes into its number of documents over WRITE_BUFFER_SIZE, once SEGMENT_MERGE_FACTOR components
+share a tier they are merged into one segment of the next tier. A document is thus rewritten a logarithmic number of
+times, the base index being merged in only once the segments add up to its size. A component whose share of deleted
+documents exceeds SEGMENT_MAX_DELETED_RATIO is rewritten on its own, tombstones of dropped documents are then removed
+along with their rows of the corpus csv. Counts of the bigram language model are updated in the background as well.
+
+Merged files get new names and are switched to through the commit point, see commit_point. Files left out of it are
+only removed once the readers mapping them are dropped, see remove_obsolete_files.
+"""
+
+
+class IndexWriter:
+
+    def __init__(self, corpus_path: str, index_dir: str = INDEX_DIR):
+        """Nothing is done in the background until the first flush, see SearchEngine.load_index"""
+        self.__corpus__ = corpus_path
+        self.__corpus_id__ = '0' if corpus_path == COURSE_CORPUS else '1'
+        self.index_dir = index_dir
+        self.generation = 0  # changes every time the searchable documents or the files in use change
+
+        self.__lock__ = threading.RLock()
+        self.__buffer__ = []  # (doc_id, title, content) not flushed yet
+        self.__doc_ids__ = __read_doc_ids__(corpus_path)  # doc ids of the corpus csv and of the buffer
+        self.__commit_point__ = read_commit_point(self.__corpus_id__, index_dir)
+        self.__component_doc_ids__ = {}  # k: component, v: set of its doc ids
+        self.__tombstones__ = set()  # doc ids deleted but still in the indexes
+        if exists(self.__tombstone_file__()):
+            with open(self.__tombstone_file__(), 'rb') as f:
+                self.__tombstones__ = pickle.load(f)
+        self.__deleted__ = __to_array__(self.__tombstones__)
+
+        self.__merge_thread__ = None
+        self.__merge_requested__ = False
+
+    def add_documents(self, documents: list) -> None:
+        """
+        :param documents: list of (doc_id, title, content), doc ids are integers as str and must be new
+        """
+        with self.__lock__:
+            new_doc_ids = set()
+            for doc_id, _, _ in documents:
+                if not doc_id.isdigit():
+                    raise ValueError('doc id %s is not an integer' % doc_id)
+                if doc_id in self.__doc_ids__ or doc_id in new_doc_ids:
+                    raise ValueError('document %s already exists' % doc_id)
+                new_doc_ids.add(doc_id)
+
+            self.__buffer__.extend(documents)
+            self.__doc_ids__.update(new_doc_ids)
+            if len(self.__buffer__) >= WRITE_BUFFER_SIZE:
+                self.flush()
+
+    def delete_documents(self, doc_ids: list) -> None:
+        with self.__lock__:
+            for doc_id in doc_ids:
+                if doc_id not in self.__doc_ids__:
+                    raise KeyError(doc_id)
+            for doc_id in doc_ids:
+                buffered = [doc for doc in self.__buffer__ if doc[0] == doc_id]
+                if len(buffered) != 0:
+                    self.__buffer__.remove(buffered[0])
+                    self.__doc_ids__.discard(doc_id)
+                else:
+                    self.__tombstones__.add(doc_id)
+            self.__save_tombstones__()
+            self.generation += 1
+        self.__schedule_merge__()
+
+    def flush(self) -> None:
+        """Write buffered documents as a segment, searchable right away, pending merges go on in the background"""
+        with self.__lock__:
+            if len(self.__buffer__) != 0:
+                documents, self.__buffer__ = self.__buffer__, []
+
+                # appended to the corpus first, a segment never refers to documents missing from the csv
+                __append_to_corpus__(self.__corpus__, documents)
+                docs = [(doc_id, title + ' ' + content) for doc_id, title, content in documents]
+                segment = self.__next_version__()
+                for index_conf, processed_docs in process_all_configurations(docs):
+                    tf_matrix, doc_ids, terms = __build_index__(processed_docs=processed_docs)
+                    Index_v2(corpus=self.__corpus__, index_conf=index_conf).build_from_term_frequencies(
+                        tf_matrix=tf_matrix, doc_ids=doc_ids, terms=terms,
+                        out_path=self.__component_file__(str(index_conf), segment))
+                self.__component_doc_ids__[segment] = set(doc_id for doc_id, _ in docs)
+                self.__commit_point__['components'].append(segment)
+                self.__commit_point__['query_completion_pending'].extend(doc_id for doc_id, _ in docs)
+                self.__commit__()
+        self.__schedule_merge__()
+
+    def wait(self) -> None:
+        """Block until background merging is done"""
+        while True:
+            with self.__lock__:
+                thread = self.__merge_thread__
+            if thread is None or not thread.is_alive():
+                return
+            thread.join()
+
+    def deleted_doc_ids(self) -> np.ndarray:
+        """Integer doc ids of the documents deleted but still in the indexes, sorted"""
+        return self.__deleted__
+
+    def reset(self) -> None:
+        """
+        Apply every pending change to the corpus csv and the bigram language model and drop segments and tombstones,
+        before a full rebuild of the indexes from the corpus
+        """
+        self.wait()
+        with self.__lock__:
+            __append_to_corpus__(self.__corpus__, self.__buffer__)
+            added_doc_ids = set(self.__commit_point__['query_completion_pending'])
+            added_doc_ids.update(doc_id for doc_id, _, _ in self.__buffer__)
+            self.__buffer__ = []
+            self.__update_query_completion__(added_doc_ids, self.__tombstones__)
+            __remove_from_corpus__(self.__corpus__, self.__tombstones__)
+
+            # the full rebuild writes the .idx files again
+            self.__make_obsolete__([component for component in self.__commit_point__['components']
+                                    if component is not None])
+            self.__commit_point__['components'] = [None]
+            self.__component_doc_ids__ = {}
+            self.__tombstones__ = set()
+            self.__save_tombstones__()
+            self.__doc_ids__ = __read_doc_ids__(self.__corpus__)
+            self.__commit__()
+
+    def remove_obsolete_files(self) -> None:
+        """
+        Remove the files left out of the commit point, to be called once no reader loaded before the last change is
+        used any more. Files still mapped cannot be removed on Windows, they are tried again at the next call.
+        """
+        with self.__lock__:
+            obsolete = []
+            for path in self.__commit_point__['obsolete']:
+                try:
+                    remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    obsolete.append(path)
+            if obsolete != self.__commit_point__['obsolete']:
+                self.__commit_point__['obsolete'] = obsolete
+                save_commit_point(self.__commit_point__, self.__corpus_id__, self.index_dir)
+
+    def stats(self) -> dict:
+        with self.__lock__:
+            return {'buffered': len(self.__buffer__), 'segments': len(self.__commit_point__['components']) - 1,
+                    'deleted': len(self.__tombstones__), 'generation': self.generation,
+                    'merging': self.__merge_thread__ is not None and self.__merge_thread__.is_alive()}
+
+    def __schedule_merge__(self) -> None:
+        with self.__lock__:
+            self.__merge_requested__ = True
+            if self.__merge_thread__ is None or not self.__merge_thread__.is_alive():
+                self.__merge_thread__ = threading.Thread(target=self.__merge_loop__, daemon=True)
+                self.__merge_thread__.start()
+
+    def __merge_loop__(self) -> None:
+        while True:
+            with self.__lock__:
+                if not self.__merge_requested__:
+                    self.__merge_thread__ = None
+                    return
+                self.__merge_requested__ = False
+                added_doc_ids = set(self.__commit_point__['query_completion_pending'])
+                if len(added_doc_ids) != 0:
+                    self.__update_query_completion__(added_doc_ids, set())
+                    self.__commit__()
+            while True:
+                with self.__lock__:
+                    components = self.__find_merge__()
+                    tombstones = set(self.__tombstones__)
+                if components is None:
+                    break
+                self.__merge__(components, tombstones)
+
+    def __find_merge__(self) -> list:
+        """
+        Components to merge next, in the order of the commit point, None if there is nothing to merge
+        A component with too many deleted documents first, then the smallest tier holding SEGMENT_MERGE_FACTOR
+        components
+        """
+        components = self.__commit_point__['components']
+        for component in components:
+            doc_ids = self.__get_doc_ids__(component)
+            if len(doc_ids & self.__tombstones__) > SEGMENT_MAX_DELETED_RATIO * len(doc_ids):
+                return [component]
+
+        tiers = {}  # k: size tier, v: components of the tier
+        for component in components:
+            tiers.setdefault(__size_tier__(len(self.__get_doc_ids__(component))), []).append(component)
+        for tier in sorted(tiers.keys()):
+            if len(tiers[tier]) >= SEGMENT_MERGE_FACTOR:
+                return tiers[tier]
+        return None
+
+    def __merge__(self, components: list, tombstones: set) -> None:
+        """Merge components into a new segment for all configurations, without the tombstoned documents"""
+        with self.__lock__:
+            segment = self.__next_version__()
+            is_base = components[0] == self.__commit_point__['components'][0]
+        doc_ids = []
+        for index_conf in ALL_POSSIBLE_INDEX_CONFIGURATIONS:
+            parts = [Index_v2.load(self.__component_file__(str(index_conf), component)).get_term_frequencies()
+                     for component in components]
+            tf_matrix, doc_ids, terms = __merge_term_frequencies__(parts, tombstones)
+            if len(doc_ids) == 0 and not is_base:
+                # only deleted documents, the components are dropped
+                break
+            Index_v2(corpus=self.__corpus__, index_conf=index_conf).build_from_term_frequencies(
+                tf_matrix=tf_matrix, doc_ids=doc_ids, terms=terms,
+                out_path=self.__component_file__(str(index_conf), segment))
+
+        with self.__lock__:
+            dropped = set(doc_id for component in components for doc_id in self.__get_doc_ids__(component)) & \
+                tombstones
+            # documents not counted by the bigram language model yet are not discounted either
+            pending = set(self.__commit_point__['query_completion_pending'])
+            self.__update_query_completion__(set(), dropped - pending)
+            self.__commit_point__['query_completion_pending'] = [doc_id for doc_id in
+                                                                 self.__commit_point__['query_completion_pending']
+                                                                 if doc_id not in dropped]
+            __remove_from_corpus__(self.__corpus__, dropped)
+
+            merged_components = self.__commit_point__['components']
+            position = merged_components.index(components[0])
+            merged_components = [component for component in merged_components if component not in components]
+            if len(doc_ids) != 0 or is_base:
+                merged_components.insert(position, segment)
+                self.__component_doc_ids__[segment] = set(doc_ids)
+            self.__commit_point__['components'] = merged_components
+            self.__make_obsolete__(components)
+            self.__tombstones__ -= dropped
+            self.__doc_ids__ -= dropped
+            self.__save_tombstones__()
+            self.__commit__()
+
+    def __update_query_completion__(self, added_doc_ids: set, removed_doc_ids: set) -> None:
+        """
+        Update counts of the bigram language model rather than recount them, as a new version of its file
+        Documents must still be in the corpus csv, the commit point is saved by the caller
+        """
+        qc_file = query_completion_file(self.__corpus_id__, self.__commit_point__['query_completion'], self.index_dir)
+        if exists(qc_file) and (len(added_doc_ids) != 0 or len(removed_doc_ids) != 0):
+            version = self.__next_version__()
+            QueryCompletion.load(qc_file).update(
+                added_texts=__read_texts__(self.__corpus__, added_doc_ids),
+                removed_texts=__read_texts__(self.__corpus__, removed_doc_ids)).save(
+                query_completion_file(self.__corpus_id__, version, self.index_dir))
+            self.__commit_point__['query_completion'] = version
+            self.__commit_point__['obsolete'].append(qc_file)
+        self.__commit_point__['query_completion_pending'] = [
+            doc_id for doc_id in self.__commit_point__['query_completion_pending'] if doc_id not in added_doc_ids]
+
+    def __commit__(self) -> None:
+        save_commit_point(self.__commit_point__, self.__corpus_id__, self.index_dir)
+        self.generation += 1
+
+    def __next_version__(self) -> int:
+        version = self.__commit_point__['next_version']
+        self.__commit_point__['next_version'] += 1
+        return version
+
+    def __make_obsolete__(self, components: list) -> None:
+        for component in components:
+            self.__component_doc_ids__.pop(component, None)
+            self.__commit_point__['obsolete'].extend(self.__component_file__(str(index_conf), component)
+                                                     for index_conf in ALL_POSSIBLE_INDEX_CONFIGURATIONS)
+
+    def __get_doc_ids__(self, component) -> set:
+        doc_ids = self.__component_doc_ids__.get(component)
+        if doc_ids is None:
+            doc_ids = set(Index_v2.load(self.__component_file__(str(ALL_POSSIBLE_INDEX_CONFIGURATIONS[0]),
+                                                                component)).doc_ids)
+            self.__component_doc_ids__[component] = doc_ids
+        return doc_ids
+
+    def __component_file__(self, config: str, component) -> str:
+        return component_file(self.__corpus_id__, config, component, self.index_dir)
+
+    def __tombstone_file__(self) -> str:
+        return self.index_dir + self.__corpus_id__ + TOMBSTONE_FILE_EXTENSION
+
+    def __save_tombstones__(self) -> None:
+        with open(self.__tombstone_file__(), 'wb') as f:
+            pickle.dump(self.__tombstones__, f)
+        self.__deleted__ = __to_array__(self.__tombstones__)
+
+
+def __size_tier__(doc_count: int) -> int:
+    """0 below WRITE_BUFFER_SIZE * SEGMENT_MERGE_FACTOR documents, one more for every SEGMENT_MERGE_FACTOR times more"""
+    tier = 0
+    size = WRITE_BUFFER_SIZE * SEGMENT_MERGE_FACTOR
+    while doc_count >= size:
+        tier += 1
+        size *= SEGMENT_MERGE_FACTOR
+    return tier
+
+
+def __to_array__(doc_ids: set) -> np.ndarray:
+    return np.asarray(sorted(int(doc_id) for doc_id in doc_ids), dtype=np.int64)
+
+
+def __merge_term_frequencies__(parts: list, tombstones: set) -> (csr_matrix, list, list):
+    """
+    Merge term frequencies of several parts, see Index_v2.get_term_frequencies
+    :param parts: list of (tf_matrix, doc_ids, terms), a document of a later part replaces the one of earlier parts
+    :param tombstones: doc ids left out
+    :return: (tf_matrix, doc_ids, terms), same layout as __build_index__
+    """
+    terms = sorted(set(term for _, _, part_terms in parts for term in part_terms))
+    term_2_col = {term: col for col, term in enumerate(terms)}  # k: term, v: column in merged tf matrix
+
+    matrices = []
+    all_doc_ids = []
+    for tf_matrix, doc_ids, part_terms in parts:
+        cols = np.asarray([term_2_col[term] for term in part_terms], dtype=np.int32)
+        matrices.append(csr_matrix((np.asarray(tf_matrix.data), cols[tf_matrix.indices], np.asarray(tf_matrix.indptr)),
+                                   shape=(tf_matrix.shape[0], len(terms))))
+        all_doc_ids.extend(doc_ids)
+    tf_matrix = vstack(matrices, format='csr') if len(matrices) != 0 else csr_matrix((0, 0), dtype=np.int32)
+
+    latest = {doc_id: row for row, doc_id in enumerate(all_doc_ids)}  # k: doc id, v: row of its last version
+    doc_ids = sorted(doc_id for doc_id in latest.keys() if doc_id not in tombstones)
+    tf_matrix = tf_matrix[[latest[doc_id] for doc_id in doc_ids]]
+
+    # terms only found in left out documents are dropped
+    used = np.flatnonzero(np.bincount(tf_matrix.indices, minlength=len(terms)) > 0)
+    tf_matrix = tf_matrix[:, used].astype(np.int32)
+    tf_matrix.sort_indices()
+    return tf_matrix, doc_ids, [terms[i] for i in used.tolist()]
+
+
+def __read_doc_ids__(corpus_path: str) -> set:
+    with open(corpus_path, 'r', newline='') as f:
+        return {row[0] for row in csv.reader(f)}
+
+
+def __read_texts__(corpus_path: str, doc_ids: set) -> list:
+    """Texts of documents for the bigram language model, same as __build_bigram_language_model__"""
+    if len(doc_ids) == 0:
+        return []
+    with open(corpus_path, 'r', newline='') as f:
+        return [row[1] + '.' + row[2] for row in csv.reader(f) if row[0] in doc_ids]
+
+
+def __append_to_corpus__(corpus_path: str, documents: list) -> None:
+    with open(corpus_path, 'a', newline='') as f:
+        writer = csv.writer(f)
+        for doc_id, title, content in documents:
+            # Reuters rows also hold the topics, added documents have none
+            writer.writerow([doc_id, title, content] if corpus_path == COURSE_CORPUS else [doc_id, title, content, []])
+
+
+def __remove_from_corpus__(corpus_path: str, doc_ids: set) -> None:
+    if len(doc_ids) == 0:
+        return
+    with open(corpus_path, 'r', newline='') as f:
+        rows = [row for row in csv.reader(f) if row[0] not in doc_ids]
+    with open(corpus_path + '.tmp', 'w', newline='') as f:
+        csv.writer(f).writerows(rows)
+    replace(corpus_path + '.tmp', corpus_path)
@@ -1,31 +1,90 @@
 import csv
+import numpy as np
+from os import replace
+from os.path import exists, getmtime
 
 from intermediate_class.document import _Document
+from util.binary_storage import save_arrays, load_arrays, read_header, StringTable, SortedStringTable
+from global_variable import DOC_STORE_FILE_EXTENSION, DOC_STORE_FORMAT_VERSION
+
+"""
+Document store of a corpus
+
+Titles and contents are kept in contiguous utf-8 buffers with offsets arrays, in a file next to the corpus csv which is
+memory-mapped rather than read, documents are ordered by doc id so that a doc id is found with a binary search. The end
+of the excerpt (first sentence) of every content is precomputed.
+"""
 
 
 class Corpus:
 
     def __init__(self, corpus_file: str):
-        self.documents = {}
         self.corpus_id = 0 if 'course' in corpus_file else 1
-        with open(corpus_file, 'r') as f:
-            reader = csv.reader(f)
-            for row in reader:
-                doc_id = row[0]
-                title = row[1]
-                content = row[2]
-                self.documents[doc_id] = (_Document(doc_id, title, content))
+        store_file = corpus_file + DOC_STORE_FILE_EXTENSION
+        if not __is_up_to_date__(store_file=store_file, corpus_file=corpus_file):
+            __build_doc_store__(corpus_file=corpus_file, store_file=store_file)
+
+        arrays, _ = load_arrays(path=store_file, version=DOC_STORE_FORMAT_VERSION)
+        self.doc_ids = SortedStringTable.from_arrays(arrays, 'doc_ids')
+        self.titles = StringTable.from_arrays(arrays, 'titles')
+        self.contents = StringTable.from_arrays(arrays, 'contents')
+        self.excerpt_ends = arrays['excerpt_ends']  # end of the excerpt of every content, in bytes of contents buffer
+
+    def __position__(self, doc_id: str) -> int:
+        i = self.doc_ids.find(doc_id)
+        if i == -1:
+            raise KeyError(doc_id)
+        return i
 
     def get_doc_excerpt(self, doc_id: str) -> str:
         """Return the first sentence as the excerpt"""
-        content = self.documents[doc_id].content
-        return content[:content.find('.') + 1]
+        i = self.__position__(doc_id)
+        return self.contents.buffer[self.contents.offsets[i]:self.excerpt_ends[i]].tobytes().decode('utf-8')
 
     def get_doc_title(self, doc_id: str) -> str:
-        return self.documents[doc_id].title
+        return self.titles[self.__position__(doc_id)]
 
     def get_doc_content(self, doc_id: str) -> str:
-        return self.documents[doc_id].content
+        return self.contents[self.__position__(doc_id)]
+
+    def get_doc_titles(self, doc_ids: list) -> list:
+        return [self.titles[self.__position__(doc_id)] for doc_id in doc_ids]
+
+    def get_documents(self, doc_ids: list) -> list:
+        """Documents of many doc ids in one call, list of _Document"""
+        positions = [self.__position__(doc_id) for doc_id in doc_ids]
+        return [_Document(doc_id, self.titles[i], self.contents[i]) for doc_id, i in zip(doc_ids, positions)]
+
+    def __len__(self):
+        return len(self.doc_ids)
 
     def __str__(self):
         return str(self.corpus_id)
+
+
+def __is_up_to_date__(store_file: str, corpus_file: str) -> bool:
+    return exists(store_file) and getmtime(store_file) >= getmtime(corpus_file) and \
+        read_header(path=store_file, version=DOC_STORE_FORMAT_VERSION) is not None
+
+
+def __build_doc_store__(corpus_file: str, store_file: str) -> None:
+    documents = {}  # k: doc_id, v: (title, content), the last row wins for duplicated doc ids
+    with open(corpus_file, 'r') as f:
+        reader = csv.reader(f)
+        for row in reader:
+            documents[row[0]] = (row[1], row[2])
+    doc_ids = sorted(documents.keys())
+
+    contents = StringTable.from_strings(documents[doc_id][1] for doc_id in doc_ids)
+    excerpt_lengths = []
+    for doc_id in doc_ids:
+        content = documents[doc_id][1]
+        excerpt_lengths.append(len(content[:content.find('.') + 1].encode('utf-8')))
+
+    arrays = {'excerpt_ends': contents.offsets[:-1] + np.asarray(excerpt_lengths, dtype=np.int64)}
+    arrays.update(StringTable.from_strings(doc_ids).to_arrays('doc_ids'))
+    arrays.update(StringTable.from_strings(documents[doc_id][0] for doc_id in doc_ids).to_arrays('titles'))
+    arrays.update(contents.to_arrays('contents'))
+    # written aside and renamed, a store mapped by another search engine is never seen half written
+    save_arrays(path=store_file + '.tmp', arrays=arrays, meta={'corpus': corpus_file}, version=DOC_STORE_FORMAT_VERSION)
+    replace(store_file + '.tmp', store_file)
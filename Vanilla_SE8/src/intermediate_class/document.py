@@ -1,4 +1,5 @@
 class _Document:
+    __slots__ = ('doc_id', 'title', 'content')
 
     def __init__(self, doc_id, title, content):
         self.doc_id = doc_id
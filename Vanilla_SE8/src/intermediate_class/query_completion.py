@@ -1,14 +1,162 @@
-import pickle
+import numpy as np
+from os import replace
+
+from util.text_processing import STOP_WORDS
+from util.completion_index import build_completion_index, CompletionIndex
+from util.binary_storage import save_arrays, load_arrays, read_header, StringTable, SortedStringTable
+from global_variable import QUERY_COMPLETION_FORMAT_VERSION, BLM_THRESHOLD, COMPLETION_LIMIT
+
+"""
+Bigram language model of a corpus, for query completion
+
+Terms are lower-cased alphabetic tokens that are not stop words, a term id is the position in the sorted vocabulary.
+Bigrams are consecutive terms of a sentence, their counts are kept as a CSR-style adjacency: the terms following term
+i are next_terms[indptr[i]:indptr[i + 1]], by decreasing count, with their counts in bigram_counts. All arrays are
+stored in a flat binary file, see util.binary_storage, and memory-mapped when loaded.
+"""
 
 
 class QueryCompletion:
 
-    def __init__(self, bigram_model, all_terms):
-        self.bigram_model = bigram_model
-        self.all_terms = all_terms
+    def __init__(self, arrays: dict, meta: dict = None):
+        self.__arrays__ = arrays
+        self.meta = meta if meta is not None else {}
+        self.terms = SortedStringTable.from_arrays(arrays, 'terms')
+        self.term_counts = arrays['term_counts']  # frequency over the corpus, by term id
+        self.bigram_indptr = arrays['bigram_indptr']
+        self.next_terms = arrays['bigram_next_terms']
+        self.bigram_counts = arrays['bigram_counts']
+        self.completion_index = CompletionIndex(arrays, terms=self.terms, counts=self.term_counts)
+
+    @staticmethod
+    def build(texts, meta: dict = None) -> 'QueryCompletion':
+        """
+        :param texts: iterable of str, sentences are separated by '.'
+        :param meta: json serializable dict saved along
+        """
+        return QueryCompletion(__counts_2_arrays__(*__count__(texts)), meta=meta)
+
+    def update(self, added_texts=(), removed_texts=()) -> 'QueryCompletion':
+        """New model with the counts of added texts added and the counts of removed texts subtracted"""
+        terms = list(self.terms)
+        first = np.repeat(np.arange(len(terms), dtype=np.int64), np.diff(self.bigram_indptr))
+        parts = [(terms, np.asarray(self.term_counts), first, np.asarray(self.next_terms, dtype=np.int64),
+                  np.asarray(self.bigram_counts, dtype=np.int64))]
+        for texts, sign in [(added_texts, 1), (removed_texts, -1)]:
+            part_terms, term_counts, part_first, part_second, counts = __count__(texts)
+            parts.append((part_terms, sign * term_counts, part_first, part_second, sign * counts))
+
+        # every part on the union of the vocabularies
+        all_terms = sorted(set(term for part in parts for term in part[0]))
+        term_2_id = {term: i for i, term in enumerate(all_terms)}  # k: term, v: term id in all_terms
+        n_terms = max(len(all_terms), 1)
+        term_counts = np.zeros(len(all_terms), dtype=np.int64)
+        keys, counts = [], []
+        for part_terms, part_term_counts, part_first, part_second, part_counts in parts:
+            ids = np.asarray([term_2_id[term] for term in part_terms], dtype=np.int64)
+            np.add.at(term_counts, ids, part_term_counts)
+            keys.append(ids[part_first] * n_terms + ids[part_second])
+            counts.append(part_counts)
+        keys, inverse = np.unique(np.concatenate(keys), return_inverse=True)
+        counts = np.bincount(inverse, weights=np.concatenate(counts), minlength=len(keys)).astype(np.int64)
+
+        # terms and bigrams whose count dropped to 0 are left out
+        kept_terms = np.flatnonzero(term_counts > 0)
+        new_ids = np.full(len(all_terms), -1, dtype=np.int64)
+        new_ids[kept_terms] = np.arange(len(kept_terms))
+        first, second = new_ids[keys // n_terms], new_ids[keys % n_terms]
+        kept = (counts > 0) & (first != -1) & (second != -1)
+        arrays = __counts_2_arrays__([all_terms[i] for i in kept_terms.tolist()], term_counts[kept_terms],
+                                     first[kept], second[kept], counts[kept])
+        return QueryCompletion(arrays, meta=self.meta)
+
+    def save(self, path: str) -> None:
+        """The file is written aside and then renamed, models already mapping the previous file remain valid"""
+        save_arrays(path=path + '.tmp', arrays=self.__arrays__, meta=self.meta,
+                    version=QUERY_COMPLETION_FORMAT_VERSION)
+        replace(path + '.tmp', path)
 
     @staticmethod
     def load(qc_file):
-        with open(qc_file, 'rb') as f:
-            qc = pickle.load(f)
-        return qc
+        arrays, meta = load_arrays(path=qc_file, version=QUERY_COMPLETION_FORMAT_VERSION)
+        return QueryCompletion(arrays, meta=meta)
+
+    @staticmethod
+    def is_valid_file(qc_file) -> bool:
+        """Check if a file is a query completion of the current format version"""
+        return read_header(path=qc_file, version=QUERY_COMPLETION_FORMAT_VERSION) is not None
+
+    def get_following_terms(self, term: str, k: int = COMPLETION_LIMIT, min_count: int = BLM_THRESHOLD) -> list:
+        """
+        Most likely terms following term
+        :param k: max number of terms
+        :param min_count: terms following term less often are left out
+        :return: list of (term, probability of following term), by decreasing probability
+        """
+        term_id = self.terms.find(term)
+        if term_id == -1:
+            return []
+        start, end = self.bigram_indptr[term_id], self.bigram_indptr[term_id + 1]
+        counts = self.bigram_counts[start:end]
+        # counts are sorted decreasingly
+        n = min(k, int(np.searchsorted(-counts, -min_count, side='right')))
+        total = float(counts.sum())
+        return [(self.terms[int(next_term)], float(count) / total)
+                for next_term, count in zip(self.next_terms[start:start + n].tolist(), counts[:n].tolist())]
+
+    def get_completion_index(self) -> CompletionIndex:
+        return self.completion_index
+
+    def nbytes(self) -> int:
+        return sum(arr.nbytes for arr in self.__arrays__.values())
+
+
+def __count__(texts) -> (list, np.ndarray, np.ndarray, np.ndarray, np.ndarray):
+    """
+    Count terms and bigrams of texts
+    Texts are only split into term ids here, the counting itself is done on the whole id stream at once
+    :return: (sorted terms, term counts, first term ids, second term ids, bigram counts)
+    """
+    vocabulary = {}  # k: term, v: id in order of appearance
+    ids = []  # ids of all terms of all texts
+    sentence_starts = []  # True for the first term of every sentence
+    for text in texts:
+        for sentence in text.lower().split('.'):
+            first = True
+            for token in sentence.split():
+                if token.isalpha() and token not in STOP_WORDS:
+                    ids.append(vocabulary.setdefault(token, len(vocabulary)))
+                    sentence_starts.append(first)
+                    first = False
+
+    terms = sorted(vocabulary.keys())
+    # from id in order of appearance to id in sorted terms
+    sorted_ids = np.empty(len(terms), dtype=np.int64)
+    sorted_ids[[vocabulary[term] for term in terms]] = np.arange(len(terms))
+    ids = sorted_ids[np.asarray(ids, dtype=np.int64)]
+    term_counts = np.bincount(ids, minlength=len(terms)).astype(np.int64)
+
+    # a bigram is any two consecutive ids unless the second one starts a sentence
+    n_terms = max(len(terms), 1)
+    within_sentence = ~np.asarray(sentence_starts, dtype=bool)[1:]
+    keys = ids[:-1][within_sentence] * n_terms + ids[1:][within_sentence]
+    keys, counts = np.unique(keys, return_counts=True)
+    return terms, term_counts, keys // n_terms, keys % n_terms, counts.astype(np.int64)
+
+
+def __counts_2_arrays__(terms: list, term_counts: np.ndarray, first: np.ndarray, second: np.ndarray,
+                        counts: np.ndarray) -> dict:
+    """Arrays of a model, bigrams are (first term id, second term id, count) triplets in any order"""
+    # by first term, then by decreasing count, then by second term
+    order = np.lexsort((second, -counts, first))
+    indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(first, minlength=len(terms)), out=indptr[1:])
+    term_counts = np.asarray(term_counts, dtype=np.int64)
+
+    arrays = {'term_counts': term_counts,
+              'bigram_indptr': indptr,
+              'bigram_next_terms': second[order].astype(np.int32),
+              'bigram_counts': counts[order].astype(np.int32)}
+    arrays.update(StringTable.from_strings(terms).to_arrays('terms'))
+    arrays.update(build_completion_index(terms, term_counts))
+    return arrays
@@ -8,6 +8,10 @@ class SearchResult:
         self.correction = correction
         self.result_scores = result_scores
 
+    def copy(self):
+        return SearchResult(doc_id_list=list(self.doc_id_list), correction=self.correction,
+                            result_scores=list(self.result_scores))
+
     def filter_by_doc_ids(self, selected_doc_id_range: set):
         remaining_idx = []
         remaining_ids = []
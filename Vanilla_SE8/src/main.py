@@ -4,7 +4,7 @@ import sys
 from PyQt5.Qt import Qt
 from PyQt5 import QtWidgets
 from PyQt5.QtWidgets import QWidget, QApplication, QLineEdit, QPushButton, QRadioButton, QMessageBox, QHBoxLayout, \
-    QVBoxLayout, QLabel, QButtonGroup, QTextEdit, QListView, QDialog, QCheckBox
+    QVBoxLayout, QLabel, QButtonGroup, QTextEdit, QListView, QDialog, QCheckBox, QProgressBar
 from PyQt5.QtGui import QIcon, QStandardItemModel, QStandardItem
 from PyQt5.QtCore import pyqtSlot
 
@@ -14,6 +14,7 @@ from util.corpus_preprocessing import preprocess_course_corpus, preprocess_reute
 from UI_component.query_line_edit import QueryLineEdit
 from UI_component.query_completer import QueryCompleter
 from UI_component.qcheckcombobox import CheckComboBox
+from UI_component.worker import Worker, WorkerPool
 
 BOOLEAN_MODEL_BUTTON_TEXT = 'Boolean Model'
 VSM_MODEL_BUTTON_TEXT = 'VSM Model'
@@ -44,6 +45,8 @@ class MainWindow(QWidget):
         self.relevance_memory = {}  # k: query, v:([positive doc ids], [negative doc ids])
         self.__current_query__ = ''
         self.__relevance_collection_enabled__ = True
+        if not self.__index_ready__:
+            self._build_index()
 
     def setup_se(self):
         # preprocess_reuters_corpus()  # TODO remove
@@ -53,12 +56,12 @@ class MainWindow(QWidget):
             preprocess_course_corpus()
 
         self.search_engine = SearchEngine(model='vsm')  # FIXME
-        if not SearchEngine.check_index_integrity():
-            self.__create_message_box('Please wait for the construction of index.\n'
-                                      'This may take about 1 minute.\n'
-                                      'Click OK to start.')
-            self.search_engine.build_index()
-        else:
+        # searches and every change of the search engine run in the background, one at a time and in order since the
+        # search engine is not thread safe
+        self.__thread_pool__ = WorkerPool(max_thread_count=1)
+        self.__generation__ = 0  # generation of the latest search, older searches are dropped
+        self.__index_ready__ = SearchEngine.check_index_integrity()
+        if self.__index_ready__:
             self.search_engine.load_index()
 
     def initUI(self):
@@ -82,12 +85,10 @@ class MainWindow(QWidget):
         searchLabel = QLabel('Query: ')
         searchLayout.addWidget(searchLabel)
         self.query_line_edit = QueryLineEdit()
-        qc_obj_0 = self.search_engine.get_query_completion_obj(0)
-        qc_obj_1 = self.search_engine.get_query_completion_obj(1)
-        self.query_completer_0 = QueryCompleter(self.query_line_edit, all_terms=qc_obj_0.all_terms,
-                                                bigram_model=qc_obj_0.bigram_model)
-        self.query_completer_1 = QueryCompleter(self.query_line_edit, all_terms=qc_obj_1.all_terms,
-                                                bigram_model=qc_obj_1.bigram_model)
+        self.query_completer_0 = QueryCompleter(
+            self.query_line_edit, get_query_completion=lambda: self.search_engine.get_query_completion_obj(0))
+        self.query_completer_1 = QueryCompleter(
+            self.query_line_edit, get_query_completion=lambda: self.search_engine.get_query_completion_obj(1))
         self.query_completer_0.setCaseSensitivity(Qt.CaseInsensitive)
         self.query_completer_1.setCaseSensitivity(Qt.CaseInsensitive)
         self.query_line_edit.to_complete_following_word.connect(self.query_completer_0.complete_following_term)
@@ -190,14 +191,10 @@ class MainWindow(QWidget):
         topic_label = QLabel('Topic selection:')
         cbhboxlayout = QHBoxLayout()
         self.topic_check_box = CheckComboBox(placeholderText="None")
-        model = self.topic_check_box.model()
-        for i, topic in enumerate(self.search_engine.get_all_topics()):
-            self.topic_check_box.addItem(topic)
-            model.item(i).setCheckable(True)
         self.topic_check_box.currentTextChanged.connect(
             lambda: self._topic_selection_changed(self.topic_check_box.get_selected_items()))
-        self.topic_check_box.select_all()
-        self._topic_selection_changed(self.topic_check_box.get_selected_items())
+        if self.__index_ready__:
+            self._load_topics()
         cbhboxlayout.addWidget(topic_label)
         cbhboxlayout.addWidget(self.topic_check_box)
         vbox.addLayout(cbhboxlayout)
@@ -238,19 +235,77 @@ class MainWindow(QWidget):
         # queryResultLayout.addStretch(1)
         vbox.addLayout(queryResultLayout)
 
+        # progress of the construction of index, only shown meanwhile
+        self.progress_bar = QProgressBar()
+        self.progress_bar.hide()
+        vbox.addWidget(self.progress_bar)
+
         # centerize main window
         self.center()
 
         self.show()
 
+    def _load_topics(self):
+        model = self.topic_check_box.model()
+        for i, topic in enumerate(self.search_engine.get_all_topics()):
+            self.topic_check_box.addItem(topic)
+            model.item(i).setCheckable(True)
+        self.topic_check_box.select_all()
+        self._topic_selection_changed(self.topic_check_box.get_selected_items())
+
+    def _build_index(self):
+        """Build index in the background, searching is disabled meanwhile"""
+        self.relevant_btn.setEnabled(False)
+        self.query_line_edit.setEnabled(False)
+        self.progress_bar.setFormat('Constructing index...')
+        self.progress_bar.show()
+
+        worker = Worker(self.search_engine.build_index, with_progress=True)
+        worker.signals.progress.connect(self._index_build_progress)
+        worker.signals.result.connect(self._index_built)
+        worker.signals.error.connect(self._index_build_failed)
+        self.__thread_pool__.start(worker)
+
+    def _index_build_progress(self, done, total, message):
+        self.progress_bar.setMaximum(total)
+        self.progress_bar.setValue(done)
+        self.progress_bar.setFormat('%s (%d/%d)' % (message, done, total))
+
+    def _index_built(self, generation, result):
+        self.progress_bar.hide()
+        self.__index_ready__ = True
+        self._load_topics()
+        self.relevant_btn.setEnabled(True)
+        self.query_line_edit.setEnabled(True)
+
+    def _index_build_failed(self, generation, message):
+        """Searching is enabled again, with the indexes left by the failed build, unless the build is retried"""
+        self.progress_bar.hide()
+        self.relevant_btn.setEnabled(True)
+        self.query_line_edit.setEnabled(True)
+        answer = QMessageBox.critical(self, 'Search engine', 'Construction of index failed.\n' + message,
+                                      QMessageBox.Retry | QMessageBox.Close)
+        if answer == QMessageBox.Retry:
+            self._build_index()
+
     def _topic_selection_changed(self, topic_list):
         print('topic selection changed')
         print('current selection: %s' % topic_list)
-        self.search_engine.set_selected_topics(topic_list)
+        self._run_engine_step(self.search_engine.set_selected_topics, list(topic_list))
 
     def switch_all_topic_selection(self):
         self.topic_check_box.switch_all_selection()
-        self.search_engine.switch_all_selection()
+        self._run_engine_step(self.search_engine.switch_all_selection)
+
+    def _run_engine_step(self, fn, *args):
+        """
+        Change the search engine in the background, after the searches already started and before the next ones
+        Results of searches started under the previous settings are dropped
+        """
+        self.__generation__ += 1
+        worker = Worker(fn, *args)
+        worker.signals.error.connect(lambda generation, message: self.__create_message_box('Failed.\n' + message))
+        self.__thread_pool__.start(worker)
 
     def _switch_completer(self, i):
         if i == 0:
@@ -268,11 +323,11 @@ class MainWindow(QWidget):
 
     def btnstate(self, b):
         if b.text() == 'Remove stopwords':
-            self.search_engine.switch_stop_words_removal()
+            self._run_engine_step(self.search_engine.switch_stop_words_removal)
         elif b.text() == 'Stemming':
-            self.search_engine.switch_stemming()
+            self._run_engine_step(self.search_engine.switch_stemming)
         elif b.text() == 'Normalization':
-            self.search_engine.switch_normalization()
+            self._run_engine_step(self.search_engine.switch_normalization)
         elif b.text() == 'Global query expansion':
             self.__query_expansion__ = not self.__query_expansion__
         else:
@@ -291,9 +346,8 @@ class MainWindow(QWidget):
     def click_search(self):
 
         if self.relevance_memory != {}:
-            for query, tpl in self.relevance_memory.items():
-                p_doc_ids, n_doc_ids = tpl[0], tpl[1]
-                self.search_engine.add_relevance_feedback(query, p_doc_ids, n_doc_ids)
+            # never dropped, the feedback applies to every later search
+            self.__thread_pool__.start(Worker(self._add_relevance_feedback, self.relevance_memory))
             self.relevance_memory = {}
 
         query_string = self.query_line_edit.text().strip()
@@ -302,41 +356,87 @@ class MainWindow(QWidget):
         if query_string == '':
             self.__create_message_box('Please enter your query')
         else:
+            # searches still waiting or running are superseded by this one
+            self.__generation__ += 1
             if self.__query_expansion__:
-                expanded = self.search_engine.expand_query_globally(query_string)
-                qm = QMessageBox()
-                reply = qm.question(
-                    self, 'Warning', 'Would you like to expand the query to: "%s" ?' % expanded,
-                                     QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes)
-                if reply == QMessageBox.Yes:
-                    query_string = expanded
-
-            self.__current_query__ = query_string
-            search_result = self.search_engine.query(query_string)
-            self.retrieved_doc_ids, corrections, scores = search_result.doc_id_list, search_result.correction, search_result.result_scores
-
-            model = QStandardItemModel()
-            for doc_id, score in zip(self.retrieved_doc_ids, scores):
-                doc_title = self.search_engine.get_doc_title(doc_id)
-                item = QStandardItem('[Score: %s] ' % round(score, 4) + doc_title)
-                model.appendRow(item)
-            self.queryResult.setModel(model)
-            self.queryResult.show()
-
-            if len(self.retrieved_doc_ids) == 0:
-                self.__create_message_box('Could not find anything.')
-
-            if corrections.correction_made():
-                self.__create_message_box('Did you mean ... ?\n' + str(corrections))
+                self._run_search_step(
+                    self.search_engine.expand_query_globally, query_string,
+                    on_result=lambda generation, expanded: self._confirm_expansion(generation, query_string, expanded))
+            else:
+                self._search(query_string)
+
+    def _run_search_step(self, fn, *args, on_result):
+        """Run fn in the background for the latest search, on_result gets (generation, return value of fn)"""
+        worker = Worker(fn, *args, generation=self.__generation__, is_superseded=self._is_superseded)
+        worker.signals.result.connect(on_result)
+        worker.signals.error.connect(self._search_failed)
+        self.__thread_pool__.start(worker)
+
+    def _is_superseded(self, generation):
+        return generation != self.__generation__
+
+    def _confirm_expansion(self, generation, query_string, expanded):
+        if self._is_superseded(generation):
+            return
+        qm = QMessageBox()
+        reply = qm.question(
+            self, 'Warning', 'Would you like to expand the query to: "%s" ?' % expanded,
+                             QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes)
+        if reply == QMessageBox.Yes:
+            query_string = expanded
+        self._search(query_string)
+
+    def _search(self, query_string):
+        self._run_search_step(self._query, query_string, on_result=self._show_search_result)
+
+    def _query(self, query_string):
+        """Run in the background: (query, search result, titles of the retrieved documents)"""
+        search_result = self.search_engine.query(query_string)
+        return query_string, search_result, self.search_engine.get_doc_titles(search_result.doc_id_list)
+
+    def _add_relevance_feedback(self, relevance_memory):
+        """Run in the background"""
+        for query, tpl in relevance_memory.items():
+            p_doc_ids, n_doc_ids = tpl[0], tpl[1]
+            self.search_engine.add_relevance_feedback(query, p_doc_ids, n_doc_ids)
+
+    def _show_search_result(self, generation, result):
+        if self._is_superseded(generation):
+            return
+        query_string, search_result, doc_titles = result
+        self.__current_query__ = query_string
+        self.retrieved_doc_ids, corrections, scores = search_result.doc_id_list, search_result.correction, search_result.result_scores
+
+        model = QStandardItemModel()
+        for doc_title, score in zip(doc_titles, scores):
+            item = QStandardItem('[Score: %s] ' % round(score, 4) + doc_title)
+            model.appendRow(item)
+        self.queryResult.setModel(model)
+        self.queryResult.show()
+
+        if len(self.retrieved_doc_ids) == 0:
+            self.__create_message_box('Could not find anything.')
+
+        if corrections.correction_made():
+            self.__create_message_box('Did you mean ... ?\n' + str(corrections))
+
+    def _clear_search_result(self):
+        """Results of another corpus can no longer be opened"""
+        self.retrieved_doc_ids = []
+        self.queryResult.setModel(QStandardItemModel())
+
+    def _search_failed(self, generation, message):
+        if not self._is_superseded(generation):
+            self.__create_message_box('Search failed.\n' + message)
 
     def changeChoiceState(self, button: QPushButton):
         if button.isChecked():
             if button.text() == BOOLEAN_MODEL_BUTTON_TEXT:
-                self.search_engine.switch_model('boolean')
+                self._run_engine_step(self.search_engine.switch_model, 'boolean')
                 self.__relevance_collection_enabled__ = False
                 print('Switched to boolean model')
             elif button.text() == VSM_MODEL_BUTTON_TEXT:
-                self.search_engine.switch_model('vsm')
+                self._run_engine_step(self.search_engine.switch_model, 'vsm')
                 self.__relevance_collection_enabled__ = True
                 print('Switched to vsm model')
             elif button.text() == 'UofO catalog':
@@ -346,11 +446,13 @@ class MainWindow(QWidget):
                 #     setup(html_file=CURRENT_DIR + '/../%s' % html_file)
                 # else:
                 #     raise Exception('Could not find '%s'' % html_file)
-                self.search_engine.switch_corpus('course_corpus')
+                self._run_engine_step(self.search_engine.switch_corpus, 'course_corpus')
+                self._clear_search_result()
                 self._switch_completer(0)
                 print('Switched to course_corpus')
             elif button.text() == 'Reuters':
-                self.search_engine.switch_corpus('Reuters')
+                self._run_engine_step(self.search_engine.switch_corpus, 'Reuters')
+                self._clear_search_result()
                 self._switch_completer(1)
                 print('Switched to Reuters')
 
@@ -441,4 +543,5 @@ if __name__ == '__main__':
     # TODO
     app = QApplication(sys.argv)
     mainWindow = MainWindow()
+    app.aboutToQuit.connect(mainWindow.search_engine.save_correction_cache)
     sys.exit(app.exec_())
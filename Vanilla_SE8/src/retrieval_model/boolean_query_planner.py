@@ -0,0 +1,189 @@
+import numpy as np
+
+from index_v2 import Index_v2
+from retrieval_model.boolean_retrieval import and_operation, and_not_operation, or_many, _is_operand, \
+    _is_wildcard_query_operand
+
+"""
+Cost-based planning of Boolean queries
+
+The postfix expression is turned into a tree of TERM, AND and OR nodes. 'a AND_NOT b' becomes an AND node with 'a' as
+positive and 'b' as negative child, a wildcard operand becomes an OR node over the ids of the matching terms, nested
+ANDs and nested ORs are flattened. Children of an AND are ordered by estimated size (document frequency for terms),
+the rarest one is materialized and the others only filter its doc ids: terms are probed through the skip pointers of
+their compressed posting list, so only the blocks that may contain a candidate are decoded and large lists are never
+materialized.
+"""
+
+
+class _PlanNode:
+
+    def __init__(self, operator: str, children: list = None, negatives: list = None, term: str = None,
+                 term_id: int = -1, df: int = 0):
+        self.operator = operator  # 'TERM', 'AND' or 'OR'
+        self.children = children if children is not None else []  # positive children
+        self.negatives = negatives if negatives is not None else []  # AND only, children excluded with AND_NOT
+        self.term = term
+        self.term_id = term_id
+        self.df = df
+        self.estimate = 0  # estimated number of documents
+        self.cost = 0  # estimated number of doc ids decoded or compared
+
+
+class QueryPlan:
+
+    def __init__(self, index: Index_v2, postfix_expr_tokens: list):
+        self.index = index
+        # a query of stop words only has no operand, it matches nothing
+        self.root = self.__optimize__(self.__build_tree__(postfix_expr_tokens)) if len(postfix_expr_tokens) != 0 \
+            else None
+
+    def __build_tree__(self, postfix_expr_tokens: list) -> _PlanNode:
+        stack = []
+        for token in postfix_expr_tokens:
+            if _is_wildcard_query_operand(token):
+                term_ids = self.index.get_term_ids_by_wildcard(token).tolist()
+                stack.append(_PlanNode('OR', children=[self.__term_node__(self.index.terms[term_id], term_id)
+                                                       for term_id in term_ids]))
+            elif _is_operand(token):
+                stack.append(self.__term_node__(token, self.index.get_term_id(token)))
+            else:
+                # an operand removed by text processing, a stop word, matches nothing
+                right = stack.pop() if len(stack) != 0 else self.__term_node__('', -1)
+                left = stack.pop() if len(stack) != 0 else self.__term_node__('', -1)
+                if token == 'AND_NOT':
+                    stack.append(_PlanNode('AND', children=[left], negatives=[right]))
+                else:
+                    stack.append(_PlanNode(token, children=[left, right]))
+        return stack.pop()
+
+    def __term_node__(self, term: str, term_id: int) -> _PlanNode:
+        df = self.index.get_document_frequency(term_id) if term_id != -1 else 0
+        return _PlanNode('TERM', term=term, term_id=term_id, df=df)
+
+    def __optimize__(self, node: _PlanNode) -> _PlanNode:
+        """Flatten nested operators of the same kind, order AND children by size and estimate costs"""
+        if node.operator == 'TERM':
+            node.estimate = node.df
+            node.cost = node.df
+            return node
+
+        children = [self.__optimize__(c) for c in node.children]
+        negatives = [self.__optimize__(c) for c in node.negatives]
+
+        flattened, flattened_negatives = [], list(negatives)
+        for c in children:
+            if c.operator == node.operator:
+                flattened.extend(c.children)
+                flattened_negatives.extend(c.negatives)
+            else:
+                flattened.append(c)
+        node.children = flattened
+        node.negatives = flattened_negatives
+
+        if node.operator == 'OR':
+            node.estimate = sum(c.estimate for c in node.children)
+            node.cost = sum(c.cost for c in node.children)
+        else:
+            # rarest first, it drives the intersection
+            node.children.sort(key=lambda c: c.estimate)
+            node.negatives.sort(key=lambda c: c.estimate)
+            driver = node.children[0]
+            node.estimate = driver.estimate
+            node.cost = driver.cost + sum(self.__filter_cost__(c, driver.estimate)
+                                          for c in node.children[1:] + node.negatives)
+        return node
+
+    def __filter_cost__(self, node: _PlanNode, n_candidates: int) -> int:
+        """Estimated cost of filtering n candidates with a node"""
+        if node.operator == 'TERM':
+            # at most one block decoded per candidate, never more than the whole list
+            n_blocks = self.index.get_posting_list(node.term_id).n_blocks() if node.term_id != -1 else 0
+            return min(node.df, n_candidates * (node.df // max(n_blocks, 1)))
+        return sum(self.__filter_cost__(c, n_candidates) for c in node.children + node.negatives)
+
+    def execute(self) -> np.ndarray:
+        """Sorted doc ids matching the query"""
+        if self.root is None:
+            return np.empty(0, dtype=np.int64)
+        return self.__evaluate__(self.root)
+
+    def __evaluate__(self, node: _PlanNode) -> np.ndarray:
+        if node.operator == 'TERM':
+            return self.index.get_by_term_id(node.term_id) if node.term_id != -1 else np.empty(0, dtype=np.int64)
+        elif node.operator == 'OR':
+            return or_many([self.__evaluate__(c) for c in node.children])
+        else:
+            candidates = self.__evaluate__(node.children[0])
+            return self.__filter_and__(node.children[1:], node.negatives, candidates)
+
+    def __filter_and__(self, children: list, negatives: list, candidates: np.ndarray) -> np.ndarray:
+        for c in children:
+            if len(candidates) == 0:
+                break
+            candidates = self.__filter__(c, candidates)
+        for c in negatives:
+            if len(candidates) == 0:
+                break
+            candidates = and_not_operation(candidates, self.__filter__(c, candidates))
+        return candidates
+
+    def __filter__(self, node: _PlanNode, candidates: np.ndarray) -> np.ndarray:
+        """Candidates which also match the node"""
+        if node.operator == 'TERM':
+            return self.__probe_term__(node, candidates)
+        elif node.operator == 'OR':
+            matched = []
+            remaining = candidates
+            for c in node.children:
+                if len(remaining) == 0:
+                    break
+                hit = self.__filter__(c, remaining)
+                matched.append(hit)
+                remaining = and_not_operation(remaining, hit)
+            return or_many(matched)
+        else:
+            return self.__filter_and__(node.children, node.negatives, candidates)
+
+    def __probe_term__(self, node: _PlanNode, candidates: np.ndarray) -> np.ndarray:
+        """Intersect candidates with a posting list, decoding only the blocks candidates fall into"""
+        if node.term_id == -1:
+            return np.empty(0, dtype=np.int64)
+        posting_list = self.index.get_posting_list(node.term_id)
+        blocks = np.searchsorted(posting_list.block_last, candidates, side='left')
+        in_range = blocks < posting_list.n_blocks()
+        candidates, blocks = candidates[in_range], blocks[in_range]
+
+        matched = []
+        block_bounds = np.flatnonzero(np.diff(blocks)) + 1
+        for group in np.split(np.arange(len(candidates)), block_bounds):
+            if len(group) == 0:
+                continue
+            block_doc_ids = posting_list.decode_block(int(blocks[group[0]]))
+            matched.append(and_operation(candidates[group], block_doc_ids))
+        if len(matched) == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(matched)
+
+    def explain(self) -> str:
+        """Human readable plan with estimated sizes and costs"""
+        if self.root is None:
+            return 'EMPTY'
+        lines = []
+
+        def __explain__(node: _PlanNode, depth: int, role: str):
+            indent = '  ' * depth
+            if node.operator == 'TERM':
+                lines.append('%s%sTERM %s (df=%s)' % (indent, role, node.term, node.df))
+                return
+            lines.append('%s%s%s (estimate=%s, cost=%s)' % (indent, role, node.operator, node.estimate, node.cost))
+            for i, c in enumerate(node.children):
+                child_role = ''
+                if node.operator == 'AND':
+                    child_role = 'driver: ' if i == 0 else 'filter: '
+                __explain__(c, depth + 1, child_role)
+            for c in node.negatives:
+                __explain__(c, depth + 1, 'exclude: ')
+
+        __explain__(self.root, 0, '')
+        return '\n'.join(lines)
@@ -1,10 +1,12 @@
 import re
+import numpy as np
 
 from util import text_processing
-from index_v2 import Index_v2, bigrams_2_terms
+from index_reader import IndexReader
+from intermediate_class.index_configuration import IndexConfiguration
 from intermediate_class.search_result import SearchResult
-from util.wildcard_handler import get_bigrams
-from util.spelling_correction import SpellingCorrection, get_closest_term
+from util.spelling_correction import SpellingCorrection
+from util.correction_cache import CORRECTION_CACHE
 from global_variable import DUMMY_WORD, UNFOUND_TERM_LIMIT
 
 
@@ -51,55 +53,58 @@ def infix_2_postfix(infix_expr: str) -> str:
     return ' '.join(postfix_expr)
 
 
-def and_operation(l1: list, l2: list) -> list:
-    result = []
-    ptr_1, ptr_2 = 0, 0
-    while ptr_1 < len(l1) and ptr_2 < len(l2):
-        if l1[ptr_1] == l2[ptr_2]:
-            result.append(l1[ptr_1])
-            ptr_1 += 1
-            ptr_2 += 1
-        elif l1[ptr_1] > l2[ptr_2]:
-            ptr_2 += 1
-        else:
-            ptr_1 += 1
+def _in_sorted(values: np.ndarray, sorted_arr: np.ndarray) -> np.ndarray:
+    """Membership mask of values in a sorted array, binary search of every value"""
+    if len(sorted_arr) == 0:
+        return np.zeros(len(values), dtype=bool)
+    pos = np.searchsorted(sorted_arr, values)
+    pos[pos == len(sorted_arr)] = 0
+    return sorted_arr[pos] == values
 
-    return result
 
+def and_operation(l1: np.ndarray, l2: np.ndarray) -> np.ndarray:
+    l1, l2 = np.asarray(l1, dtype=np.int64), np.asarray(l2, dtype=np.int64)
+    if len(l1) > len(l2):
+        l1, l2 = l2, l1
+    # search the shorter list in the longer one
+    return l1[_in_sorted(l1, l2)]
 
-def or_operation(l1: list, l2: list) -> list:
-    result = []
-    for e in l1:
-        result.append(e)
-    for e in l2:
-        if e not in result:
-            result.append(e)
-    return result
 
+def or_operation(l1: np.ndarray, l2: np.ndarray) -> np.ndarray:
+    return or_many([l1, l2])
 
-def and_not_operation(l1: list, l2: list) -> list:
-    result = []
-    ptr_1, ptr_2 = 0, 0
-    while ptr_1 < len(l1) and ptr_2 < len(l2):
 
-        if l1[ptr_1] > l2[ptr_2]:
-            ptr_2 += 1
-        elif l1[ptr_1] == l2[ptr_2]:
-            ptr_1 += 1
-            ptr_2 += 1
-        else:
-            result.append(l1[ptr_1])
-            ptr_1 += 1
+def and_not_operation(l1: np.ndarray, l2: np.ndarray) -> np.ndarray:
+    l1, l2 = np.asarray(l1, dtype=np.int64), np.asarray(l2, dtype=np.int64)
+    return l1[~_in_sorted(l1, l2)]
 
-    if ptr_1 < len(l1):
-        while ptr_1 < len(l1):
-            result.append(l1[ptr_1])
-            ptr_1 += 1
 
+def and_many(lists: list) -> np.ndarray:
+    """Intersection of many sorted lists, from the shortest one"""
+    if len(lists) == 0:
+        return np.empty(0, dtype=np.int64)
+    lists = sorted(lists, key=len)
+    result = np.asarray(lists[0], dtype=np.int64)
+    for lst in lists[1:]:
+        if len(result) == 0:
+            break
+        result = and_operation(result, lst)
     return result
 
 
-def perform_bool_operation(operator: str, operand_1: list, operand_2: list) -> list:
+def or_many(lists: list) -> np.ndarray:
+    """Union of many sorted lists in a single merge"""
+    lists = [np.asarray(lst, dtype=np.int64) for lst in lists if len(lst) != 0]
+    if len(lists) == 0:
+        return np.empty(0, dtype=np.int64)
+    # stable sort is a timsort which merges the already sorted runs in linear time
+    merged = np.sort(np.concatenate(lists), kind='stable')
+    keep = np.ones(len(merged), dtype=bool)
+    keep[1:] = merged[1:] != merged[:-1]
+    return merged[keep]
+
+
+def perform_bool_operation(operator: str, operand_1: np.ndarray, operand_2: np.ndarray) -> np.ndarray:
     if operator == 'OR':
         r = or_operation(operand_1, operand_2)
     elif operator == 'AND':
@@ -109,32 +114,28 @@ def perform_bool_operation(operator: str, operand_1: list, operand_2: list) -> l
     return r
 
 
-# FIXME problem?
-def equivalences_2_query(equivalent_words: set, original_wildcard_query: str) -> str:
-    regex = original_wildcard_query.replace('*', '[a-zA-Z]*')
-    t = set()
-    for word in equivalent_words:
-        if re.search(regex, word) is not None:
-            t.add(word)
-    return '( ' + ' OR '.join(t) + ' )'
-
-
-def query(index: Index_v2, raw_query: str) -> SearchResult:
+def process_query_tokens(raw_query: str, config: IndexConfiguration) -> list:
+    """
+    Split a query into operators, parentheses and processed operands
+    Wildcard operands are kept as is, they are expanded into term ids by the query plan
+    """
     raw_query = raw_query.replace('(', '( ')
     raw_query = raw_query.replace(')', ' )')
 
     tmp = []
     for t in raw_query.split():
-        if _is_operand(t):
-            if _is_wildcard_query_operand(t):
-                bigrams = get_bigrams(t)
-                unchecked_equivalences = bigrams_2_terms(index, bigrams)
-                t = equivalences_2_query(unchecked_equivalences, t)
-            else:
-                t = text_processing.process(string=t, config=index.config)[0]
+        if _is_operand(t) and not _is_wildcard_query_operand(t):
+            t = text_processing.process(string=t, config=config)[0]
         tmp.append(t)
+    return tmp
+
 
-    processed_query = ' '.join(tmp)
+def _parse_query(index: IndexReader, raw_query: str) -> (list, SpellingCorrection):
+    """
+    Process operands, convert to postfix and correct spelling
+    :return: (postfix expression tokens, spelling correction object)
+    """
+    processed_query = ' '.join(process_query_tokens(raw_query, config=index.config))
     processed_query = re.sub(r'\(\s+\)', '( ' + DUMMY_WORD + ' )', processed_query)
     postfix_expr_tokens = infix_2_postfix(processed_query).split()
 
@@ -142,8 +143,10 @@ def query(index: Index_v2, raw_query: str) -> SearchResult:
     spelling_correction_obj = SpellingCorrection(mapping={})
     correction_candidates = []
     for idx, tkn in enumerate(postfix_expr_tokens):
-        if _is_operand(tkn) and tkn not in index.terms and tkn != DUMMY_WORD:
-            correction_candidates.append([idx, tkn, get_closest_term(word=tkn, terms=index.terms)])
+        if _is_operand(tkn) and not _is_wildcard_query_operand(tkn) and index.get_term_id(tkn) == -1 and \
+                tkn != DUMMY_WORD:
+            correction = CORRECTION_CACHE.get_correction(index, tkn)
+            correction_candidates.append([idx, tkn, correction])
     correction_made = sorted(correction_candidates, key=lambda x: index.get_total_term_frequency(x[2]), reverse=True)[
                       :UNFOUND_TERM_LIMIT]
     for e in correction_made:
@@ -153,37 +156,33 @@ def query(index: Index_v2, raw_query: str) -> SearchResult:
         postfix_expr_tokens[idx] = correction
         spelling_correction_obj.mapping[old_term] = correction
 
-    # Single word query
-    if len(postfix_expr_tokens) == 1:
-        retrieved_doc_ids = index.get(postfix_expr_tokens.pop())
-        retrieved_doc_ids = [str(e) for e in retrieved_doc_ids]
-        tmp = SearchResult(doc_id_list=retrieved_doc_ids, correction=spelling_correction_obj,
-                           result_scores=[1] * len(retrieved_doc_ids))
-        return tmp
-
-    operand_stack = []
-    result = []
-    for expr_token in postfix_expr_tokens:
-
-        if _is_operand(expr_token):  # token is keyword
-            operand_stack.append(expr_token)
+    return postfix_expr_tokens, spelling_correction_obj
 
-        else:  # token is bool operator
 
-            if type(operand_stack[-1]) is str:
-                operand_2 = index.get(operand_stack.pop())
-            else:
-                operand_2 = operand_stack.pop()
+def query(index: IndexReader, raw_query: str, doc_mask: np.ndarray = None) -> SearchResult:
+    """
+    :param doc_mask: bool array by integer doc id, only allowed documents are returned, all if None
+    """
+    from retrieval_model.boolean_query_planner import QueryPlan
 
-            if type(operand_stack[-1]) is str:
-                operand_1 = index.get(operand_stack.pop())
-            else:
-                operand_1 = operand_stack.pop()
+    postfix_expr_tokens, spelling_correction_obj = _parse_query(index, raw_query)
 
-            result = perform_bool_operation(expr_token, operand_1, operand_2)
-            operand_stack.append(result)
+    # Evaluate with a cost-based plan, rarest terms first
+    # components hold different documents, every one of them is evaluated on its own
+    result = or_many([QueryPlan(component, postfix_expr_tokens).execute() for component in index.components])
+    if doc_mask is not None:
+        in_range = result < len(doc_mask)
+        result = result[in_range][doc_mask[result[in_range]]]
 
     result = [str(e) for e in result]
     search_result = SearchResult(doc_id_list=result, correction=spelling_correction_obj,
                                  result_scores=[1] * len(result))
     return search_result
+
+
+def explain(index: IndexReader, raw_query: str) -> str:
+    """Show the plan chosen for a query, with estimated sizes and costs, by component of the index"""
+    from retrieval_model.boolean_query_planner import QueryPlan
+
+    postfix_expr_tokens, _ = _parse_query(index, raw_query)
+    return '\n'.join(QueryPlan(component, postfix_expr_tokens).explain() for component in index.components)
@@ -1,33 +1,35 @@
 import numpy as np
+from scipy.sparse import csr_matrix, vstack
 
 from util import text_processing
-from util.spelling_correction import SpellingCorrection, get_closest_term
-from global_variable import DOC_RETRIEVAL_LIMIT, UNFOUND_TERM_LIMIT
+from util.spelling_correction import SpellingCorrection
+from util.correction_cache import CORRECTION_CACHE
+from global_variable import DOC_RETRIEVAL_LIMIT, UNFOUND_TERM_LIMIT, VSM_EXHAUSTIVE, VSM_MAXSCORE, \
+    QUERY_BATCH_SIZE
 from index_v2 import Index_v2
+from index_reader import IndexReader
 from intermediate_class.search_result import SearchResult
 from util.relevance_feedback import RelevanceFeedbackSession
 
 
-def vectorize_query(index: Index_v2, raw_query: str) -> (np.ndarray, SpellingCorrection):
+def vectorize_query(index: IndexReader, raw_query: str) -> (csr_matrix, SpellingCorrection):
     """
     Vectorize query
     If there is any unfound term, perform spelling correction
     :param index:
     :param raw_query:
-    :return: (ndarray (v,), spelling_correction_obj)
+    :return: (csr_matrix (1, v), spelling_correction_obj)
     """
-    tokens = []
-    for t in raw_query.split():
-        tokens.append(text_processing.process(string=t, config=index.config)[0])
+    processed_tokens = text_processing.process_many(strings=raw_query.split(), config=index.config)
+    tokens = [processed[0] for processed in processed_tokens]
 
-    terms = index.terms
-    vectorized_query = [0] * len(terms)
+    query_term_ids = []
 
     terms_not_found = []
     for tk in tokens:
-        if tk in terms:
-            i = terms.index(tk)
-            vectorized_query[i] += 1
+        term_id = index.get_term_id(tk)
+        if term_id != -1:
+            query_term_ids.append(term_id)
         else:
             terms_not_found.append(tk)
 
@@ -37,7 +39,7 @@ def vectorize_query(index: Index_v2, raw_query: str) -> (np.ndarray, SpellingCor
 
         unfound_terms_correction = []
         for term_not_found in terms_not_found:
-            correction = get_closest_term(word=term_not_found, terms=terms)
+            correction = CORRECTION_CACHE.get_correction(index, term_not_found)
             unfound_terms_correction.append((term_not_found, correction))
 
         # Take top N most likely candidates
@@ -47,36 +49,240 @@ def vectorize_query(index: Index_v2, raw_query: str) -> (np.ndarray, SpellingCor
 
         for unfound_term, correction in unfound_terms_correction:
             spelling_correction_obj.mapping[unfound_term] = correction
-            # Add correction back to query vector
-            index = terms.index(correction)
-            vectorized_query[index] += 1
+            # Add correction back to query vector, an index without any term has no correction
+            correction_term_id = index.get_term_id(correction)
+            if correction_term_id != -1:
+                query_term_ids.append(correction_term_id)
 
-    return np.asarray(vectorized_query), spelling_correction_obj
+    term_ids, counts = np.unique(np.asarray(query_term_ids, dtype=np.int64), return_counts=True)
+    vectorized_query = csr_matrix((counts.astype(np.float32), (np.zeros(len(term_ids), dtype=np.int64), term_ids)),
+                                  shape=(1, index.term_count))
+    return vectorized_query, spelling_correction_obj
 
 
-def query(index: Index_v2, query: str, rf_session: RelevanceFeedbackSession) -> SearchResult:
-    if rf_session.exists_rf(query):
-        # for the same misspelled query, only provides/shows spelling correction for the first time
-        spelling_correction_obj = SpellingCorrection(mapping={})
-        vectorized_query = rf_session.get_expanded_query(query)
+def _column(index: Index_v2, term_id: int, row_mask: np.ndarray = None) -> (np.ndarray, np.ndarray):
+    """(rows, tf-idf values) of a term, restricted to the allowed rows if a mask is given"""
+    csc = index.tf_idf_csc
+    start, end = csc.indptr[term_id], csc.indptr[term_id + 1]
+    rows, values = csc.indices[start:end], csc.data[start:end]
+    if row_mask is not None:
+        allowed = row_mask[rows]
+        rows, values = rows[allowed], values[allowed]
+    return rows, values
+
+
+def score(index: Index_v2, vectorized_query: csr_matrix, row_mask: np.ndarray = None) -> (np.ndarray, np.ndarray):
+    """
+    Score documents against a sparse query, only the columns of the query terms are touched
+    :param row_mask: bool array by row of tf_idf_matrix, only allowed documents are scored, all if None
+    :return: (rows of tf_idf_matrix, scores), documents with score 0 are left out
+    """
+    vectorized_query = csr_matrix(vectorized_query)
+    row_pieces = []
+    score_pieces = []
+    for term_id, weight in zip(vectorized_query.indices.tolist(), vectorized_query.data.tolist()):
+        rows, values = _column(index, term_id, row_mask)
+        row_pieces.append(rows)
+        # float64 products, as max_score
+        score_pieces.append(values.astype(np.float64) * weight)
+
+    if len(row_pieces) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+    # accumulate scores of the same document
+    rows, inverse = np.unique(np.concatenate(row_pieces), return_inverse=True)
+    scores = np.bincount(inverse, weights=np.concatenate(score_pieces), minlength=len(rows))
+
+    nonzero = scores != 0
+    return rows[nonzero], scores[nonzero]
+
+
+def top_k(rows: np.ndarray, scores: np.ndarray, k: int) -> (np.ndarray, np.ndarray):
+    """Select k highest scores, sorted decreasingly, ties are broken by row"""
+    if len(scores) > k:
+        # every score tied with the k-th one is kept, so that the smallest rows are selected among them
+        kth = scores[np.argpartition(-scores, k - 1)[k - 1]]
+        selected = scores >= kth
+        rows, scores = rows[selected], scores[selected]
+    order = np.lexsort((rows, -scores))[:k]
+    return rows[order], scores[order]
+
+
+def max_score(index: Index_v2, vectorized_query: csr_matrix, k: int,
+              row_mask: np.ndarray = None) -> (np.ndarray, np.ndarray):
+    """
+    Top k evaluation with MaxScore dynamic pruning
+    Query terms are ordered by their score upper bound (query weight * max tf-idf of the term). The k-th largest
+    weight of the term with the largest bound is a lower bound of the final k-th score, terms whose bounds add up to
+    less than it are non-essential: a document only containing them cannot enter the top k. Only the documents of the
+    essential terms are candidates, then non-essential terms are looked up from the largest bound, after dropping the
+    candidates which cannot reach the k-th partial score even with the bounds of the remaining terms.
+    Same result as top_k(*score(...)), falls back to it if any weight is negative since bounds would not hold, and
+    for short columns since pruning then costs more than it saves.
+    :param row_mask: bool array by row of tf_idf_matrix, only allowed documents are scored, all if None
+    :return: (rows of tf_idf_matrix, scores), sorted decreasingly
+    """
+    vectorized_query = csr_matrix(vectorized_query)
+    weights = vectorized_query.data.astype(np.float64)
+    if np.any(weights < 0):
+        return top_k(*score(index, vectorized_query, row_mask=row_mask), k=k)
+
+    columns = []  # (rows, tf-idf values, query weight, upper bound)
+    for term_id, weight in zip(vectorized_query.indices.tolist(), weights.tolist()):
+        if weight > 0:
+            # the max over all rows is still an upper bound over the allowed ones
+            rows, values = _column(index, term_id, row_mask)
+            if len(rows) != 0:
+                columns.append((rows, values, weight, weight * float(index.tf_idf_max[term_id])))
+    if len(columns) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    if sum(len(c[0]) for c in columns) * 8 < index.tf_idf_csc.shape[0]:
+        return top_k(*score(index, vectorized_query, row_mask=row_mask), k=k)
+    columns.sort(key=lambda x: x[3])
+    cumulative_bounds = np.cumsum([c[3] for c in columns])  # bound of a document only containing terms 0..i
+
+    def __kth__(scores: np.ndarray) -> float:
+        return scores[np.argpartition(-scores, k - 1)[k - 1]] if len(scores) >= k else 0.0
+
+    # strictly less, a document scoring the k-th score may still enter the top k by a smaller row
+    threshold = __kth__(columns[-1][1].astype(np.float64) * columns[-1][2])
+    first_essential = int(np.searchsorted(cumulative_bounds, threshold, side='left')) if threshold > 0 else 0
+
+    # documents of the essential terms are the candidates, accumulated in a dense array by row unless they are few
+    essential = columns[first_essential:]
+    if sum(len(c[0]) for c in essential) * 8 < index.tf_idf_csc.shape[0]:
+        candidates, inverse = np.unique(np.concatenate([c[0] for c in essential]), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate([c[1].astype(np.float64) * c[2] for c in essential]),
+                             minlength=len(candidates))
     else:
-        vectorized_query, spelling_correction_obj = vectorize_query(index, query)
-
-    ranking = index.tf_idf_matrix.dot(vectorized_query).tolist()
-    full_results = []
-    for i, score in enumerate(ranking):
-        if score != 0:
-            doc_id = index.doc_ids[i]
-            pair = (doc_id, score)
-            full_results.append(pair)
-
-    full_results = sorted(full_results, key=lambda tpl: tpl[1], reverse=True)
-    top_results_doc_ids = []
-    top_results_scores = []
-    for i in range(0, min(len(full_results), DOC_RETRIEVAL_LIMIT)):
-        top_results_doc_ids.append(full_results[i][0])
-        top_results_scores.append(full_results[i][1])
+        dense = np.zeros(index.tf_idf_csc.shape[0], dtype=np.float64)
+        for rows, values, weight, _ in essential:
+            dense[rows] += values.astype(np.float64) * weight
+        candidates = np.flatnonzero(dense)
+        scores = dense[candidates]
+
+    for i in range(first_essential - 1, -1, -1):
+        # partial scores are lower bounds of the final scores, so is their k-th one
+        threshold = max(threshold, __kth__(scores))
+        kept = scores + cumulative_bounds[i] >= threshold
+        candidates, scores = candidates[kept], scores[kept]
+
+        # binary search of the shorter of the candidates and the column in the other
+        rows, values, weight, _ = columns[i]
+        if len(candidates) < len(rows):
+            positions = np.minimum(np.searchsorted(rows, candidates), len(rows) - 1)
+            found = rows[positions] == candidates
+            scores[found] += values[positions[found]].astype(np.float64) * weight
+        else:
+            positions = np.minimum(np.searchsorted(candidates, rows), len(candidates) - 1)
+            found = candidates[positions] == rows
+            scores[positions[found]] += values[found].astype(np.float64) * weight
+    return top_k(candidates, scores, k=k)
+
+
+def score_batch(index: Index_v2, query_matrix: csr_matrix, k: int,
+                row_mask: np.ndarray = None) -> list:
+    """
+    Top k evaluation of many queries, QUERY_BATCH_SIZE queries at a time are scored by one sparse matrix product
+    Same result as top_k(*score(...)) of every query, up to float rounding
+    :param query_matrix: csr_matrix (number of queries, v), a query by row
+    :param row_mask: bool array by row of tf_idf_matrix, only allowed documents are scored, all if None
+    :return: list of (rows of tf_idf_matrix, scores) by query, sorted decreasingly
+    """
+    # (v, number of documents), the column layout transposed is a row layout, no copy
+    term_doc_matrix = index.tf_idf_csc.T
+    results = []
+    for start in range(0, query_matrix.shape[0], QUERY_BATCH_SIZE):
+        scores = csr_matrix(query_matrix[start:start + QUERY_BATCH_SIZE].dot(term_doc_matrix))
+        n_queries = scores.shape[0]
+        query_ids = np.repeat(np.arange(n_queries), np.diff(scores.indptr))
+        rows, values = scores.indices.astype(np.int64), scores.data.astype(np.float64)
+        kept = values != 0
+        if row_mask is not None:
+            kept &= row_mask[rows]
+        query_ids, rows, values = query_ids[kept], rows[kept], values[kept]
+
+        # by query, then by decreasing score, ties are broken by row, the first k of every query are selected
+        order = np.lexsort((rows, -values, query_ids))
+        query_ids, rows, values = query_ids[order], rows[order], values[order]
+        counts = np.bincount(query_ids, minlength=n_queries)
+        ranks = np.arange(len(query_ids)) - np.repeat(np.cumsum(counts) - counts, counts)
+        selected = ranks < k
+        ends = np.cumsum(np.minimum(counts, k))[:-1]
+        results.extend(zip(np.split(rows[selected], ends), np.split(values[selected], ends)))
+    return results
+
+
+def query(index: IndexReader, query: str, rf_session: RelevanceFeedbackSession,
+          evaluator: str = VSM_EXHAUSTIVE, doc_mask: np.ndarray = None) -> SearchResult:
+    """
+    Every component of the index ranks its documents, the top k of all of them are kept
+    :param doc_mask: bool array by integer doc id, only allowed documents are ranked, all if None
+    """
+    vectorized_query, spelling_correction_obj = _vectorize(index, query, rf_session)
+
+    results = []  # (rows, scores) by component
+    for i, component in enumerate(index.components):
+        component_query = index.localize(i, vectorized_query)
+        row_mask = component.get_row_mask(doc_mask) if doc_mask is not None else None
+        if evaluator == VSM_MAXSCORE:
+            results.append(max_score(component, component_query, k=DOC_RETRIEVAL_LIMIT, row_mask=row_mask))
+        else:
+            # exhaustive evaluation, also serves as reference to verify the pruning evaluator
+            results.append(top_k(*score(component, component_query, row_mask=row_mask), k=DOC_RETRIEVAL_LIMIT))
+    top_results_doc_ids, top_results_scores = _merge_top_k(index, results, k=DOC_RETRIEVAL_LIMIT)
 
     search_result = SearchResult(doc_id_list=top_results_doc_ids, correction=spelling_correction_obj,
                                  result_scores=top_results_scores)
     return search_result
+
+
+def query_batch(index: IndexReader, queries: list, rf_session: RelevanceFeedbackSession,
+                doc_mask: np.ndarray = None) -> list:
+    """
+    Same results as query() of every query, all queries are vectorized into one sparse matrix scored by score_batch
+    :param doc_mask: bool array by integer doc id, only allowed documents are ranked, all if None
+    :return: list of SearchResult, by query
+    """
+    if len(queries) == 0:
+        return []
+    vectorized_queries = [_vectorize(index, query, rf_session) for query in queries]
+    query_matrix = vstack([csr_matrix(vectorized_query) for vectorized_query, _ in vectorized_queries], format='csr')
+
+    results = []  # list of (rows, scores) by query, by component
+    for i, component in enumerate(index.components):
+        row_mask = component.get_row_mask(doc_mask) if doc_mask is not None else None
+        results.append(score_batch(component, index.localize(i, query_matrix), k=DOC_RETRIEVAL_LIMIT,
+                                   row_mask=row_mask))
+    search_results = []
+    for query_results, (_, spelling_correction_obj) in zip(zip(*results), vectorized_queries):
+        doc_ids, scores = _merge_top_k(index, list(query_results), k=DOC_RETRIEVAL_LIMIT)
+        search_results.append(SearchResult(doc_id_list=doc_ids, correction=spelling_correction_obj,
+                                           result_scores=scores))
+    return search_results
+
+
+def _merge_top_k(index: IndexReader, results: list, k: int) -> (list, list):
+    """
+    Top k of the results of the components
+    :param results: list of (rows, scores) by component, sorted decreasingly
+    :return: (doc ids, scores), ties are broken by component then by row
+    """
+    if len(results) == 1:
+        rows, scores = results[0]
+        return [index.components[0].doc_ids[row] for row in rows.tolist()], scores.tolist()
+    components = np.concatenate([np.full(len(rows), i, dtype=np.int64) for i, (rows, _) in enumerate(results)])
+    rows = np.concatenate([rows for rows, _ in results])
+    scores = np.concatenate([scores for _, scores in results])
+    order = np.lexsort((rows, components, -scores))[:k]
+    return [index.components[component].doc_ids[row] for component, row in
+            zip(components[order].tolist(), rows[order].tolist())], scores[order].tolist()
+
+
+def _vectorize(index: IndexReader, query: str,
+               rf_session: RelevanceFeedbackSession) -> (csr_matrix, SpellingCorrection):
+    """Query vector, expanded by relevance feedback if any"""
+    if rf_session.exists_rf(query):
+        # for the same misspelled query, only provides/shows spelling correction for the first time
+        return rf_session.get_expanded_query(query), SpellingCorrection(mapping={})
+    return vectorize_query(index, query)
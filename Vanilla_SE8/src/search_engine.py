@@ -1,25 +1,35 @@
-from os import listdir, makedirs, cpu_count
-from os.path import isfile, join, exists
+from os import makedirs
+from os.path import exists
 from time import time
-import ray
+import numpy as np
 
 from intermediate_class.index_configuration import IndexConfiguration
 from retrieval_model import boolean_retrieval, vsm_retrieval
 from intermediate_class.corpus import Corpus
-from global_variable import INDEX_DIR, INDEX_FILE_EXTENSION, ALL_POSSIBLE_INDEX_CONFIGURATIONS, TMP_AVAILABLE_CORPUS, \
-    VSM_MODEL, BOOLEAN_MODEL, QUERY_MODELS, COURSE_CORPUS, REUTERS_CORPUS, QUERY_COMPLETION_FILE_EXTENSION
-from index_v2 import Index_v2
+from global_variable import INDEX_DIR, TMP_AVAILABLE_CORPUS, \
+    VSM_MODEL, BOOLEAN_MODEL, QUERY_MODELS, COURSE_CORPUS, REUTERS_CORPUS, \
+    VSM_MAXSCORE, VSM_EXHAUSTIVE, VSM_EVALUATORS, CORRECTION_CACHE_FILE, RESULT_CACHE_CAPACITY, \
+    ALL_POSSIBLE_INDEX_CONFIGURATIONS
+from index_v2 import Index_v2, build_all_indexes
+from index_manager import IndexManager
+from index_reader import IndexReader
+from index_writer import IndexWriter
+from commit_point import get_index_files, get_query_completion_file
 from intermediate_class.search_result import SearchResult
+from util.spelling_correction import SpellingCorrection
 from util.global_query_expansion import expand_query_globally
 from intermediate_class.query_completion import QueryCompletion
 from util.topic_handler import TopicHandler
 from util.relevance_feedback import RelevanceFeedbackSession, RelevanceFeedback
+from util.correction_cache import CORRECTION_CACHE
+from util.lru_cache import LRUCache
+from util.text_processing import process_many
 
 
 class SearchEngine:
 
     def __init__(self, model=VSM_MODEL, index_conf=None):
-        self.indexes = []
+        self.index_manager = IndexManager()
         self.current_se_conf = _SearchEngineConf(model=model, index_conf=index_conf)
         self.corpus_lst = [Corpus(corpus_file=COURSE_CORPUS), Corpus(corpus_file=REUTERS_CORPUS)]
         self.query_completion_lst = []
@@ -27,13 +37,35 @@ class SearchEngine:
         self.currently_selected_topics = []
         self.__topic_handler__ = TopicHandler()
         self.rf_session = RelevanceFeedbackSession()
+        self.__feedbacks__ = []  # (index name, query, p_doc_ids, n_doc_ids) of every feedback added to rf_session
+        # k: (__query_key__, selected topics, index writer generation[, 'batch']), v: SearchResult
+        self.__result_cache__ = LRUCache(capacity=RESULT_CACHE_CAPACITY)
+        self.__index_writers__ = {}  # k: corpus, v: IndexWriter, incremental updates of its indexes
+        self.__index_writer_generations__ = {}  # k: corpus, v: generation of its IndexWriter the indexes were loaded at
 
-    def build_index(self) -> None:
+    def build_index(self, progress_callback=None) -> None:
         """
         Build, save and load index
+        :param progress_callback: called with (number of indexes built, number of indexes to build, message)
         """
+        total = len(TMP_AVAILABLE_CORPUS) * len(ALL_POSSIBLE_INDEX_CONFIGURATIONS)
+        built = []
+        if not exists(INDEX_DIR):
+            makedirs(INDEX_DIR)
+
+        def __on_index_built__(index_name: str):
+            built.append(index_name)
+            if progress_callback is not None:
+                progress_callback(len(built), total, 'Index %s built' % index_name)
+
         for corpus, corpus_path in TMP_AVAILABLE_CORPUS.items():
-            __build_index__(corpus_path=corpus_path)
+            # pending incremental updates are applied to the corpus, the rebuild covers them
+            if corpus not in self.__index_writers__.keys():
+                self.__index_writers__[corpus] = IndexWriter(corpus_path=corpus_path)
+            self.__index_writers__[corpus].reset()
+            __build_index__(corpus_path=corpus_path, on_index_built=__on_index_built__)
+        # corrections of the previous indexes can no longer be hit
+        CORRECTION_CACHE.invalidate()
         self.load_index()
 
     def load_index(self) -> None:
@@ -41,36 +73,106 @@ class SearchEngine:
         Load existing indexes
         """
 
-        # load inverted index and tf-idf index
+        # indexes are loaded on demand, only the one of the current configuration is loaded at startup
         assert self.check_index_integrity()
-        self.indexes = []
-        index_files = [f for f in listdir(INDEX_DIR) if isfile(join(INDEX_DIR, f)) and f.endswith(INDEX_FILE_EXTENSION)]
-        index_files = sorted(index_files, reverse=True)
-        for index_file in index_files:
-            self.indexes.append(Index_v2.load(INDEX_DIR + index_file))
+        self.index_manager.clear()
+        self.__result_cache__.clear()
+        for corpus, corpus_path in TMP_AVAILABLE_CORPUS.items():
+            if corpus not in self.__index_writers__.keys():
+                self.__index_writers__[corpus] = IndexWriter(corpus_path=corpus_path)
+            # merges left over by a previous run are resumed
+            self.__index_writers__[corpus].flush()
+        self.__index_writer_generations__ = self.__get_index_writer_generations__()
+        self._get_current_index()
+        # a full rebuild first applies the pending changes to the corpus
+        self.corpus_lst = [Corpus(corpus_file=COURSE_CORPUS), Corpus(corpus_file=REUTERS_CORPUS)]
+        self.__reload_relevance_feedbacks__()
+
+        # warm spelling corrections of the previous run
+        CORRECTION_CACHE.load(CORRECTION_CACHE_FILE)
 
         # load query completion data
-        query_completion_files = [f for f in listdir(INDEX_DIR)
-                                  if isfile(join(INDEX_DIR, f)) and f.endswith(QUERY_COMPLETION_FILE_EXTENSION)]
-        query_completion_files = sorted(query_completion_files)
-        for qc_file_name in query_completion_files:
-            qc_obj = QueryCompletion.load(INDEX_DIR + qc_file_name)
-            self.query_completion_lst.append(qc_obj)
+        self.__load_query_completions__()
+        # files of a previous run or of the indexes dropped above
+        for index_writer in self.__index_writers__.values():
+            index_writer.remove_obsolete_files()
 
         # load reuters topics
         self.all_topics = self.__topic_handler__.get_all_topics()
         self.currently_selected_topics = self.all_topics
         pass
 
+    def add_documents(self, documents: list, corpus: str = None) -> None:
+        """
+        Add documents to a corpus without rebuilding its indexes, they become searchable once flushed as a segment
+        :param documents: list of (doc_id, title, content)
+        :param corpus: current corpus if not provided
+        """
+        self.__get_index_writer__(corpus).add_documents(documents)
+
+    def delete_documents(self, doc_ids: list, corpus: str = None) -> None:
+        """Delete documents of a corpus, they are left out of the results right away"""
+        self.__get_index_writer__(corpus).delete_documents(doc_ids)
+
+    def refresh(self, corpus: str = None) -> None:
+        """Make every added document searchable now, blocks until background merging is done"""
+        index_writer = self.__get_index_writer__(corpus)
+        index_writer.flush()
+        index_writer.wait()
+
+    def get_index_writer_stats(self) -> dict:
+        return {corpus: index_writer.stats() for corpus, index_writer in self.__index_writers__.items()}
+
+    def __get_index_writer__(self, corpus: str = None) -> IndexWriter:
+        return self.__index_writers__[corpus if corpus is not None else self.current_se_conf.current_corpus]
+
+    def __get_index_writer_generations__(self) -> dict:
+        return {corpus: index_writer.generation for corpus, index_writer in self.__index_writers__.items()}
+
+    def __sync__(self) -> None:
+        """
+        Pick up the segments, merges and corpus changes of the index writers
+        Only called at the start of the operations of the thread running the queries, never while one of them runs
+        """
+        generations = self.__get_index_writer_generations__()
+        if generations != self.__index_writer_generations__:
+            self.__index_writer_generations__ = generations
+            self.index_manager.clear()
+            self.corpus_lst = [Corpus(corpus_file=COURSE_CORPUS), Corpus(corpus_file=REUTERS_CORPUS)]
+            self.__load_query_completions__()
+            self.__reload_relevance_feedbacks__()
+            # the previous indexes and bigram language models are no longer used
+            for index_writer in self.__index_writers__.values():
+                index_writer.remove_obsolete_files()
+
+    def __load_query_completions__(self) -> None:
+        self.query_completion_lst = [QueryCompletion.load(get_query_completion_file(corpus_id))
+                                     for corpus_id in ['0', '1']]
+
     def add_relevance_feedback(self, query: str, p_doc_ids: list, n_doc_ids: list):
-        def vectorize_doc(doc_id):
-            content = self.get_doc_content(doc_id)
-            vec = vsm_retrieval.vectorize_query(self._get_current_index(), content)[0]
-            return vec
-
-        p_doc_vecs = [vectorize_doc(doc_id) for doc_id in p_doc_ids]
-        n_doc_vecs = [vectorize_doc(doc_id) for doc_id in n_doc_ids]
-        query_vec = vsm_retrieval.vectorize_query(self._get_current_index(), query)[0]
+        self.__sync__()
+        index_name = self.current_se_conf.get_index_name()
+        self.__feedbacks__.append((index_name, query, p_doc_ids, n_doc_ids))
+        self.__add_relevance_feedback__(index_name, query, p_doc_ids, n_doc_ids)
+
+    def __reload_relevance_feedbacks__(self) -> None:
+        """Term ids of the feedback vectors are those of the previous indexes, feedback is vectorized again"""
+        self.rf_session = RelevanceFeedbackSession()
+        for index_name, query, p_doc_ids, n_doc_ids in self.__feedbacks__:
+            self.__add_relevance_feedback__(index_name, query, p_doc_ids, n_doc_ids)
+
+    def __add_relevance_feedback__(self, index_name: str, query: str, p_doc_ids: list, n_doc_ids: list):
+        """Documents deleted from the corpus since the feedback was given are left out"""
+        index = self.index_manager.get(index_name)
+        corpus = self.corpus_lst[int(index_name.split('_')[0])]
+
+        def vectorize_docs(doc_ids):
+            return [vsm_retrieval.vectorize_query(index, corpus.get_doc_content(doc_id))[0]
+                    for doc_id in doc_ids if corpus.doc_ids.find(doc_id) != -1]
+
+        p_doc_vecs = vectorize_docs(p_doc_ids)
+        n_doc_vecs = vectorize_docs(n_doc_ids)
+        query_vec = vsm_retrieval.vectorize_query(index, query)[0]
         rf = RelevanceFeedback(query_vec, p_doc_vecs, n_doc_vecs)
         self.rf_session.add_relevance_feedback(query, rf)
 
@@ -90,9 +192,21 @@ class SearchEngine:
         # qc_idx = 0 if self.current_se_conf.current_corpus == 'course_corpus' else 1
         return self.query_completion_lst[i]
 
-    def _get_current_index(self):
-        tmp = int(str(self.current_se_conf), base=2)
-        return self.indexes[15 - tmp]
+    def _get_current_index(self) -> IndexReader:
+        return self.index_manager.get(self.current_se_conf.get_index_name())
+
+    def get_index_memory_usage(self) -> dict:
+        """k: name of loaded index, v: size in bytes"""
+        return self.index_manager.memory_usage()
+
+    @staticmethod
+    def save_correction_cache() -> None:
+        """Persist spelling corrections next to the index files, for the next run"""
+        CORRECTION_CACHE.save(CORRECTION_CACHE_FILE)
+
+    @staticmethod
+    def get_correction_cache_stats() -> dict:
+        return CORRECTION_CACHE.stats()
 
     def switch_stop_words_removal(self) -> None:
         """Switch stopwords removal"""
@@ -114,25 +228,101 @@ class SearchEngine:
         """Switch corpus"""
         self.current_se_conf.switch_corpus(corpus=corpus)
 
+    def switch_vsm_evaluator(self, evaluator=None) -> None:
+        """Switch between MaxScore and exhaustive evaluation of VSM queries"""
+        self.current_se_conf.switch_vsm_evaluator(evaluator=evaluator)
+
     def query(self, query: str) -> SearchResult:
         """
         :param query:
         :return: (list of document id, spelling correction object indicating which words are corrected if applicable)
         """
+        self.__sync__()
+        doc_mask, selected_topics = self.__doc_mask__()
+        key = (self.__query_key__(query), selected_topics, self.__get_index_writer__().generation)
+        cached_result = self.__result_cache__.get(key)
+        if cached_result is None:
+            if self.current_se_conf.current_model == VSM_MODEL:
+                cached_result = vsm_retrieval.query(self._get_current_index(), query, self.rf_session,
+                                                    evaluator=self.current_se_conf.current_vsm_evaluator,
+                                                    doc_mask=doc_mask)
+            else:
+                cached_result = boolean_retrieval.query(self._get_current_index(), query, doc_mask=doc_mask)
+            self.__result_cache__.put(key, cached_result)
+        return cached_result.copy()
+
+    def query_batch(self, queries: list) -> list:
+        """
+        Results of many queries, same as query() of every query
+        VSM queries not cached yet are scored together, by sparse matrix products instead of one evaluation per query
+        :param queries: list of str
+        :return: list of SearchResult, by query
+        """
+        self.__sync__()
+        doc_mask, selected_topics = self.__doc_mask__()
+        generation = self.__get_index_writer__().generation
+        # VSM batch scores are not computed by the evaluator of __query_key__, they are cached apart
+        marker = ('batch',) if self.current_se_conf.current_model == VSM_MODEL else ()
+        keys = [(self.__query_key__(query), selected_topics, generation) + marker for query in queries]
+        results = [self.__result_cache__.get(key) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
 
         if self.current_se_conf.current_model == VSM_MODEL:
-            query_result = vsm_retrieval.query(self._get_current_index(), query, self.rf_session)
+            missing_results = vsm_retrieval.query_batch(self._get_current_index(), [queries[i] for i in missing],
+                                                        self.rf_session, doc_mask=doc_mask)
         else:
-            query_result = boolean_retrieval.query(self._get_current_index(), query)
-
-        # filter results by topic, Reuters only
+            missing_results = [boolean_retrieval.query(self._get_current_index(), queries[i], doc_mask=doc_mask)
+                               for i in missing]
+        for i, result in zip(missing, missing_results):
+            results[i] = result
+            self.__result_cache__.put(keys[i], result)
+        return [result.copy() for result in results]
+
+    def __doc_mask__(self) -> (np.ndarray, tuple):
+        """
+        Documents allowed in the results of the current corpus
+        :return: (bool array by integer doc id or None if all are allowed, selected topics or None if not filtered)
+        """
+        # filter results by topic, Reuters only, documents of other topics are left out before ranking
+        doc_mask = None
+        selected_topics = None
         if self.current_se_conf.current_corpus == 'Reuters':
             if len(self.currently_selected_topics) < len(self.all_topics):
-                selected_doc_id_range = self.__topic_handler__.get_docids_with_topics(
-                    self.currently_selected_topics)
-                query_result.filter_by_doc_ids(selected_doc_id_range)
+                doc_mask = self.__topic_handler__.get_topic_mask(self.currently_selected_topics)
+                selected_topics = tuple(sorted(self.currently_selected_topics))
+
+        # deleted documents not merged yet are filtered out the same way
+        index_writer = self.__get_index_writer__()
+        deleted_doc_ids = index_writer.deleted_doc_ids()
+        if len(deleted_doc_ids) != 0:
+            if doc_mask is None:
+                doc_mask = np.ones(self._get_current_index().max_doc_id() + 1, dtype=bool)
+            else:
+                doc_mask = doc_mask.copy()
+            doc_mask[deleted_doc_ids[deleted_doc_ids < len(doc_mask)]] = False
+        return doc_mask, selected_topics
+
+    def get_spelling_correction(self, query: str) -> SpellingCorrection:
+        """Corrections of the query terms missing from the current index"""
+        self.__sync__()
+        return vsm_retrieval.vectorize_query(self._get_current_index(), query)[1]
+
+    def __query_key__(self, query: str) -> tuple:
+        """Queries with the same key have the same result for the same topic selection"""
+        conf = self.current_se_conf
+        if conf.current_model == VSM_MODEL:
+            terms = tuple(processed[0] for processed in process_many(strings=query.split(),
+                                                                     config=conf.current_index_conf))
+            # relevance feedback is recorded by raw query
+            feedback = (query, self.rf_session.get_feedback_version(query)) if self.rf_session.exists_rf(query) \
+                else None
+            return conf.current_model, str(conf), conf.current_vsm_evaluator, terms, feedback
+        else:
+            terms = tuple(boolean_retrieval.process_query_tokens(query, config=conf.current_index_conf))
+            return conf.current_model, str(conf), terms
 
-        return query_result
+    def get_result_cache_stats(self) -> dict:
+        return self.__result_cache__.stats()
 
     @staticmethod
     def expand_query_globally(query: str) -> str:
@@ -148,6 +338,11 @@ class SearchEngine:
             (lambda x: 0 if x == 'course_corpus' else 1)(self.current_se_conf.current_corpus)]
         return current_corpus.get_doc_title(doc_id)
 
+    def get_doc_titles(self, doc_ids: list) -> list:
+        current_corpus = self.corpus_lst[
+            (lambda x: 0 if x == 'course_corpus' else 1)(self.current_se_conf.current_corpus)]
+        return current_corpus.get_doc_titles(doc_ids)
+
     def get_doc_excerpt(self, doc_id: str):
         current_corpus = self.corpus_lst[
             (lambda x: 0 if x == 'course_corpus' else 1)(self.current_se_conf.current_corpus)]
@@ -159,22 +354,19 @@ class SearchEngine:
     @staticmethod
     def check_index_integrity() -> bool:
         if exists(INDEX_DIR):
-            index_files = [f for f in listdir(INDEX_DIR) if
-                           isfile(join(INDEX_DIR, f)) and f.endswith(INDEX_FILE_EXTENSION)]
-            return len(index_files) == 16
+            # files of the commit points, files of an older format need to be rebuilt
+            index_files = [index_file for corpus_id in ['0', '1'] for index_conf in ALL_POSSIBLE_INDEX_CONFIGURATIONS
+                           for index_file in get_index_files('%s_%s' % (corpus_id, str(index_conf)))]
+            query_completion_files = [get_query_completion_file(corpus_id) for corpus_id in ['0', '1']]
+            return all(exists(f) and Index_v2.is_valid_index_file(f) for f in index_files) and \
+                all(exists(f) and QueryCompletion.is_valid_file(f) for f in query_completion_files)
         else:
             return False
 
 
-def __build_index__(corpus_path):
-    if not exists(INDEX_DIR):
-        makedirs(INDEX_DIR)
-
+def __build_index__(corpus_path, on_index_built=None):
     start = time()
-    ray.init(num_cpus=cpu_count())
-    for ic in ALL_POSSIBLE_INDEX_CONFIGURATIONS:
-        Index_v2(corpus=corpus_path, index_conf=ic).build()
-    ray.shutdown()
+    build_all_indexes(corpus_path=corpus_path, on_index_built=on_index_built)
     print('Total time building index %s: %s' % (time() - start, '0' if 'course' in corpus_path else '1'))
 
 
@@ -188,6 +380,7 @@ class _SearchEngineConf:
 
         self.current_model = model
         self.current_corpus = corpus
+        self.current_vsm_evaluator = VSM_MAXSCORE
 
     def switch_corpus(self, corpus=None) -> None:
         assert (corpus in TMP_AVAILABLE_CORPUS.keys())
@@ -204,6 +397,16 @@ class _SearchEngineConf:
             assert (model in QUERY_MODELS)
             self.current_model = model
 
+    def switch_vsm_evaluator(self, evaluator=None) -> None:
+        if evaluator is None:
+            if self.current_vsm_evaluator == VSM_MAXSCORE:
+                self.current_vsm_evaluator = VSM_EXHAUSTIVE
+            else:
+                self.current_vsm_evaluator = VSM_MAXSCORE
+        else:
+            assert (evaluator in VSM_EVALUATORS)
+            self.current_vsm_evaluator = evaluator
+
     def switch_stop_words_removal(self) -> None:
         current_state = self.current_index_conf.stop_words_removal
         self.current_index_conf.stop_words_removal = not current_state
@@ -216,6 +419,11 @@ class _SearchEngineConf:
         current_state = self.current_index_conf.normalization
         self.current_index_conf.normalization = not current_state
 
+    def get_index_name(self) -> str:
+        """Name of the index of the current configuration, same as str(Index_v2)"""
+        corpus = '0' if self.current_corpus == 'course_corpus' else '1'
+        return '%s_%s' % (corpus, str(self.current_index_conf))
+
     def __str__(self):
         corpus = '0' if self.current_corpus == 'course_corpus' else '1'
         return corpus + str(self.current_index_conf)
@@ -0,0 +1,238 @@
+import os
+import json
+import signal
+import argparse
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+from search_engine import SearchEngine
+from global_variable import SERVER_HOST, SERVER_PORT, SERVER_WORKERS, SERVER_BACKLOG, SERVER_REQUEST_TIMEOUT, \
+    TMP_AVAILABLE_CORPUS, VSM_MODEL, QUERY_MODELS, VSM_EVALUATORS, VSM_MAXSCORE, COMPLETION_LIMIT
+
+"""
+Headless HTTP/JSON search service, the counterpart of main.py for other systems
+
+The indexes are loaded once by the parent process, which then forks a pool of worker processes sharing its listening
+socket, the memory-mapped index files are thus shared by all workers. Every worker serves one request at a time,
+connections waiting for a worker are queued by the kernel up to SERVER_BACKLOG. A request taking longer than the
+timeout is interrupted by an alarm and answered with 503, the worker then exits since the interruption may have left
+its caches half updated, and the parent forks a clean one. The server only listens on localhost.
+
+Endpoints, all GET, parameters in the query string, responses are json:
+    /query?q=...[&corpus=course_corpus|Reuters][&model=vsm|boolean][&evaluator=...][&topics=acq,earn]
+    /complete?q=...[&corpus=...], completes the last term, or the next term if q ends with a space
+    /spelling?q=...[&corpus=...]
+    /topics
+"""
+
+
+class RequestTimeout(Exception):
+    pass
+
+
+class BadRequest(Exception):
+    pass
+
+
+class SearchServer(HTTPServer):
+
+    def __init__(self, port: int, search_engine: SearchEngine, timeout: float = SERVER_REQUEST_TIMEOUT,
+                 backlog: int = SERVER_BACKLOG):
+        # read by server_activate() to listen()
+        self.request_queue_size = backlog
+        HTTPServer.__init__(self, (SERVER_HOST, port), SearchRequestHandler)
+        # workers share the socket, a worker woken up for a connection accepted by another one must not block
+        self.socket.setblocking(False)
+        self.search_engine = search_engine
+        self.request_timeout = timeout
+
+
+class SearchRequestHandler(BaseHTTPRequestHandler):
+
+    def setup(self):
+        # slow clients cannot hold a worker forever
+        self.timeout = self.server.request_timeout
+        BaseHTTPRequestHandler.setup(self)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        handler = {'/query': self.__query__,
+                   '/complete': self.__complete__,
+                   '/spelling': self.__spelling__,
+                   '/topics': self.__topics__}.get(url.path)
+        if handler is None:
+            self.__send__(404, {'error': 'unknown endpoint %s' % url.path})
+            return
+
+        signal.setitimer(signal.ITIMER_REAL, self.server.request_timeout)
+        try:
+            status, body = 200, handler(parse_qs(url.query))
+        except RequestTimeout:
+            status, body = 503, {'error': 'request timed out'}
+        except BadRequest as e:
+            status, body = 400, {'error': str(e)}
+        except Exception as e:
+            self.log_error('%s failed: %r', self.path, e)
+            status, body = 500, {'error': 'internal error'}
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        self.__send__(status, body)
+        if status == 503:
+            self.wfile.flush()
+            os._exit(0)
+
+    def log_request(self, code='-', size='-'):
+        # one line per request would flood the output under load, errors are still logged
+        pass
+
+    def __query__(self, params: dict) -> dict:
+        query = __get_param__(params, 'q')
+        search_engine = self.__select_corpus__(params)
+        model = __get_param__(params, 'model', VSM_MODEL)
+        evaluator = __get_param__(params, 'evaluator', VSM_MAXSCORE)
+        if model not in QUERY_MODELS:
+            raise BadRequest('unknown model %s' % model)
+        if evaluator not in VSM_EVALUATORS:
+            raise BadRequest('unknown evaluator %s' % evaluator)
+        search_engine.switch_model(model=model)
+        search_engine.switch_vsm_evaluator(evaluator=evaluator)
+
+        all_topics = search_engine.get_all_topics()
+        topics = __get_param__(params, 'topics', None)
+        topics = all_topics if topics is None else [topic for topic in topics.split(',') if topic]
+        unknown_topics = set(topics) - set(all_topics)
+        if len(unknown_topics) != 0:
+            raise BadRequest('unknown topics %s' % ','.join(sorted(unknown_topics)))
+        search_engine.set_selected_topics(topics)
+
+        result = search_engine.query(query)
+        titles = search_engine.get_doc_titles(result.doc_id_list)
+        return {'query': query,
+                'results': [{'doc_id': doc_id, 'title': title, 'score': score}
+                            for doc_id, title, score in zip(result.doc_id_list, titles, result.result_scores)],
+                'correction': result.correction.mapping}
+
+    def __complete__(self, params: dict) -> dict:
+        query = __get_param__(params, 'q')
+        search_engine = self.__select_corpus__(params)
+        query_completion = search_engine.get_query_completion_obj(
+            0 if search_engine.current_se_conf.current_corpus == 'course_corpus' else 1)
+
+        # same candidates as the completers of main.py
+        if len(query.split()) == 0:
+            completions = []
+        elif query[-1].isspace():
+            completions = [query + term
+                           for term, _ in query_completion.get_following_terms(query.split()[-1].lower(),
+                                                                               COMPLETION_LIMIT)]
+        else:
+            query_before_incomplete_term = query[:len(query) - len(query.split()[-1])]
+            completions = [query_before_incomplete_term + term
+                           for term in query_completion.get_completion_index().complete(query.split()[-1].lower(),
+                                                                                         COMPLETION_LIMIT)]
+        return {'query': query, 'completions': completions}
+
+    def __spelling__(self, params: dict) -> dict:
+        query = __get_param__(params, 'q')
+        search_engine = self.__select_corpus__(params)
+        return {'query': query, 'correction': search_engine.get_spelling_correction(query).mapping}
+
+    def __topics__(self, params: dict) -> dict:
+        return {'topics': self.server.search_engine.get_all_topics()}
+
+    def __select_corpus__(self, params: dict) -> SearchEngine:
+        corpus = __get_param__(params, 'corpus', 'course_corpus')
+        if corpus not in TMP_AVAILABLE_CORPUS.keys():
+            raise BadRequest('unknown corpus %s' % corpus)
+        self.server.search_engine.switch_corpus(corpus=corpus)
+        return self.server.search_engine
+
+    def __send__(self, status: int, body: dict) -> None:
+        content = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        if status == 503:
+            self.send_header('Retry-After', '1')
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def __get_param__(params: dict, name: str, default: str = ''):
+    """
+    Value of a query string parameter
+    :param default: the parameter is required if ''
+    """
+    values = params.get(name)
+    if values is None:
+        if default == '':
+            raise BadRequest('missing parameter %s' % name)
+        return default
+    return values[0]
+
+
+def __raise_timeout__(signum, frame):
+    raise RequestTimeout()
+
+
+def __stop__(signum, frame):
+    raise KeyboardInterrupt()
+
+
+def __fork_worker__(server: SearchServer) -> int:
+    pid = os.fork()
+    if pid == 0:
+        # the parent stops the workers, an interrupt of the terminal is handled by the parent only
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGALRM, __raise_timeout__)
+        try:
+            server.serve_forever()
+        finally:
+            os._exit(0)
+    return pid
+
+
+def serve(port: int = SERVER_PORT, workers: int = SERVER_WORKERS, timeout: float = SERVER_REQUEST_TIMEOUT) -> None:
+    search_engine = SearchEngine(model=VSM_MODEL)
+    if search_engine.check_index_integrity():
+        search_engine.load_index()
+    else:
+        search_engine.build_index()
+    # pending updates are merged before forking, no merging thread is running in a worker
+    for corpus in TMP_AVAILABLE_CORPUS.keys():
+        search_engine.refresh(corpus=corpus)
+    # indexes of the default configuration are loaded before forking, shared by all workers
+    for corpus in TMP_AVAILABLE_CORPUS.keys():
+        search_engine.switch_corpus(corpus=corpus)
+        search_engine._get_current_index()
+
+    server = SearchServer(port=port, search_engine=search_engine, timeout=timeout)
+    signal.signal(signal.SIGTERM, __stop__)
+    pids = set()
+    try:
+        for _ in range(workers):
+            pids.add(__fork_worker__(server))
+        print('Serving on http://%s:%d with %d workers' % (SERVER_HOST, server.server_port, workers))
+        # a worker that died is replaced
+        while True:
+            pid, _ = os.wait()
+            pids.discard(pid)
+            pids.add(__fork_worker__(server))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid in pids:
+            os.kill(pid, signal.SIGTERM)
+        for pid in pids:
+            os.waitpid(pid, 0)
+        server.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the search engine over HTTP on %s' % SERVER_HOST)
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--workers', type=int, default=SERVER_WORKERS)
+    parser.add_argument('--timeout', type=float, default=SERVER_REQUEST_TIMEOUT, help='seconds per request')
+    args = parser.parse_args()
+    serve(port=args.port, workers=args.workers, timeout=args.timeout)
@@ -0,0 +1,58 @@
+import random
+import sys
+from os import makedirs
+from os.path import abspath, dirname, join
+
+import pytest
+
+# modules are imported from src, as when running main.py from there
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from index_v2 import Index_v2
+from intermediate_class.index_configuration import IndexConfiguration
+from global_variable import INDEX_DIR, INDEX_FILE_EXTENSION, REUTERS_CORPUS
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    """
+    Empty src, corpus and index directories, the current directory is src so that the paths of global_variable, which
+    are relative to it, point into them
+    """
+    for directory in ['src', 'corpus', 'index']:
+        makedirs(join(str(tmp_path), directory))
+    monkeypatch.chdir(join(str(tmp_path), 'src'))
+    return tmp_path
+
+
+@pytest.fixture
+def build_index(workspace):
+    """Build an index from processed documents and open its file"""
+
+    def __build_index__(processed_docs: list, index_conf: IndexConfiguration = None) -> Index_v2:
+        if index_conf is None:
+            index_conf = IndexConfiguration(stop_words_removal=False, stemming=False, normalization=False)
+        index = Index_v2(corpus=REUTERS_CORPUS, index_conf=index_conf)
+        index.build(processed_docs=processed_docs)
+        return Index_v2.load(INDEX_DIR + str(index) + INDEX_FILE_EXTENSION)
+
+    return __build_index__
+
+
+def random_terms(rng: random.Random, count: int) -> list:
+    """Distinct lowercase terms of 2 to 9 letters, sorted"""
+    terms = set()
+    while len(terms) < count:
+        terms.add(''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(2, 9))))
+    return sorted(terms)
+
+
+def random_documents(rng: random.Random, terms: list, doc_count: int, max_length: int = 40) -> list:
+    """
+    Processed documents whose terms follow a Zipf distribution, so that some terms are in most documents and many in
+    a few only
+    :return: list of (doc_id, terms), doc ids are the integers from 1
+    """
+    weights = [1 / (rank + 1) for rank in range(len(terms))]
+    return [(str(doc_id), rng.choices(terms, weights=weights, k=rng.randint(1, max_length)))
+            for doc_id in range(1, doc_count + 1)]
@@ -0,0 +1,95 @@
+import random
+
+import numpy as np
+import pytest
+
+from conftest import random_terms, random_documents
+from util.binary_storage import save_arrays, load_arrays, read_header, StringTable, SortedStringTable, ALIGNMENT
+
+
+def test_arrays_round_trip(tmp_path):
+    path = str(tmp_path / 'arrays.bin')
+    arrays = {'int32': np.arange(10, dtype=np.int32),
+              'float32': np.linspace(0, 1, 7, dtype=np.float32),
+              'matrix': np.arange(12, dtype=np.int64).reshape(3, 4),
+              'empty': np.empty(0, dtype=np.int64),
+              'bytes': np.frombuffer(b'abc', dtype=np.uint8)}
+    save_arrays(path=path, arrays=arrays, meta={'name': 'test', 'shape': [3, 4]}, version=3)
+
+    loaded, meta = load_arrays(path=path, version=3)
+    assert meta == {'name': 'test', 'shape': [3, 4]}
+    assert set(loaded.keys()) == set(arrays.keys())
+    for name, arr in arrays.items():
+        assert loaded[name].dtype == arr.dtype and loaded[name].shape == arr.shape
+        assert np.array_equal(loaded[name], arr)
+    # arrays are mapped from the file at aligned offsets, not read
+    header, data_start = read_header(path=path, version=3)
+    assert data_start % ALIGNMENT == 0
+    assert all(h['offset'] % ALIGNMENT == 0 for h in header['arrays'].values())
+    assert isinstance(loaded['matrix'], np.memmap)
+
+
+def test_other_version_or_format_is_rejected(tmp_path):
+    path = str(tmp_path / 'arrays.bin')
+    save_arrays(path=path, arrays={'a': np.arange(3)}, meta={}, version=3)
+    assert read_header(path=path, version=4) is None
+    with pytest.raises(ValueError):
+        load_arrays(path=path, version=4)
+
+    pickled = str(tmp_path / 'index.pkl')
+    with open(pickled, 'wb') as f:
+        f.write(b'\x80\x04not a binary container')
+    assert read_header(path=pickled, version=3) is None
+
+
+def test_string_table():
+    strings = ['oil', '', 'prix', 'café', 'U.S.', 'oil']
+    table = StringTable.from_strings(strings)
+    assert len(table) == len(strings)
+    assert list(table) == strings
+    assert [table[i] for i in range(len(strings))] == strings
+    assert table[-1] == 'oil'
+    with pytest.raises(IndexError):
+        table[len(strings)]
+
+    same = StringTable.from_arrays(table.to_arrays('strings'), 'strings')
+    assert list(same) == strings
+    assert same.index('café') == 3 and 'prix' in same and 'price' not in same
+
+
+def test_sorted_string_table_lookups():
+    terms = random_terms(random.Random(0), 500) + ['café', 'cafe', 'ça']
+    table = SortedStringTable.from_strings(terms)
+    assert list(table) == sorted(terms)
+    for i, term in enumerate(sorted(terms)):
+        assert table.find(term) == i
+    for missing in ['', 'zzzzzzzzzz', 'caf', 'a' * 12]:
+        assert table.find(missing) == (sorted(terms).index(missing) if missing in terms else -1)
+
+    for prefix in ['', 'a', 'ca', 'caf', 'qu', 'zzz', 'ç']:
+        lo, hi = table.prefix_range(prefix)
+        assert [table[i] for i in range(lo, hi)] == [t for t in sorted(terms) if t.startswith(prefix)]
+
+
+def test_index_file_round_trip(build_index):
+    rng = random.Random(1)
+    docs = random_documents(rng, random_terms(rng, 200), doc_count=50)
+    index = build_index(docs)
+
+    terms = sorted({term for _, doc_terms in docs for term in doc_terms})
+    assert list(index.terms) == terms
+    assert sorted(index.doc_ids) == sorted(doc_id for doc_id, _ in docs)
+    assert index.tf_idf_matrix.shape == (len(docs), len(terms))
+    for term in terms:
+        expected = sorted(int(doc_id) for doc_id, doc_terms in docs if term in doc_terms)
+        assert np.array_equal(index.get(term), expected)
+        assert index.get_total_term_frequency(term) == sum(doc_terms.count(term) for _, doc_terms in docs)
+
+    # tf-idf weights, idf of a term from the number of documents it occurs in
+    rows = {doc_id: row for row, doc_id in enumerate(index.doc_ids)}
+    for doc_id, doc_terms in docs:
+        row = index.tf_idf_matrix[rows[doc_id]].toarray().ravel()
+        for term in set(doc_terms):
+            df = sum(term in other for _, other in docs)
+            expected = np.log10(1 + doc_terms.count(term)) * np.log10(len(docs) / df + 1)
+            assert row[terms.index(term)] == pytest.approx(expected, rel=1e-5)
@@ -0,0 +1,72 @@
+import random
+
+import numpy as np
+import pytest
+
+from conftest import random_terms, random_documents
+from retrieval_model.boolean_query_planner import QueryPlan
+from retrieval_model.boolean_retrieval import infix_2_postfix
+
+
+@pytest.fixture(scope='module')
+def corpus():
+    rng = random.Random(4)
+    # posting lists of frequent terms span many blocks
+    return random_documents(rng, random_terms(rng, 150), doc_count=3000)
+
+
+@pytest.fixture
+def index(build_index, corpus):
+    return build_index(corpus)
+
+
+def __random_expression__(rng: random.Random, terms: list, depth: int) -> (str, tuple):
+    """Fully parenthesized infix expression and its tree, leaves are terms or a term not in the index"""
+    if depth == 0 or rng.random() < 0.3:
+        term = rng.choice(terms) if rng.random() < 0.9 else 'notindexed'
+        return term, ('TERM', term)
+    operator = rng.choice(['AND', 'OR', 'AND_NOT'])
+    left, left_tree = __random_expression__(rng, terms, depth - 1)
+    right, right_tree = __random_expression__(rng, terms, depth - 1)
+    return '( %s %s %s )' % (left, operator, right), (operator, left_tree, right_tree)
+
+
+def __evaluate__(tree: tuple, postings: dict) -> set:
+    if tree[0] == 'TERM':
+        return postings.get(tree[1], set())
+    left, right = __evaluate__(tree[1], postings), __evaluate__(tree[2], postings)
+    if tree[0] == 'AND':
+        return left & right
+    if tree[0] == 'OR':
+        return left | right
+    return left - right
+
+
+def test_plan_has_set_semantics(index, corpus):
+    postings = {}  # k: term, v: set of integer doc ids
+    for doc_id, doc_terms in corpus:
+        for term in doc_terms:
+            postings.setdefault(term, set()).add(int(doc_id))
+    # frequent terms as often as rare ones, so that intersections are not all empty
+    terms = sorted(postings.keys(), key=lambda t: -len(postings[t]))
+    terms = terms[:10] + terms[-10:] + random.Random(5).sample(terms, 10)
+
+    rng = random.Random(6)
+    for _ in range(300):
+        infix, tree = __random_expression__(rng, terms, depth=4)
+        result = QueryPlan(index, infix_2_postfix(infix).split()).execute()
+        assert np.all(np.diff(result) > 0), infix
+        assert set(result.tolist()) == __evaluate__(tree, postings), infix
+
+
+def test_flattened_and_is_ordered_by_document_frequency(index, corpus):
+    frequent, rare = index.terms[0], index.terms[1]
+    if index.get_document_frequency(0) < index.get_document_frequency(1):
+        frequent, rare = rare, frequent
+    plan = QueryPlan(index, infix_2_postfix('%s AND ( %s AND %s )' % (frequent, rare, frequent)).split())
+    assert plan.root.operator == 'AND'
+    assert [c.term for c in plan.root.children] == [rare, frequent, frequent]
+
+
+def test_empty_query_matches_nothing(index):
+    assert len(QueryPlan(index, []).execute()) == 0
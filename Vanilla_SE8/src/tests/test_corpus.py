@@ -0,0 +1,53 @@
+import csv
+import os
+import random
+
+import pytest
+
+from intermediate_class.corpus import Corpus
+from global_variable import DOC_STORE_FILE_EXTENSION
+
+
+def __write_corpus__(path: str, rows: list) -> None:
+    with open(path, 'w', newline='') as f:
+        csv.writer(f).writerows(rows)
+
+
+def test_store_serves_the_csv(tmp_path):
+    rng = random.Random(10)
+    rows = [[str(doc_id), 'title %d' % doc_id, ' '.join(rng.choice(['oil', 'prix', 'café', 'U.S.', 'rose.', 'a'])
+                                                        for _ in range(rng.randint(0, 12)))]
+            for doc_id in rng.sample(range(1, 5000), 300)]
+    # a duplicated doc id, the last row wins as with the csv reader of the previous Corpus
+    rows.append([rows[0][0], 'updated title', 'updated content. More.'])
+    path = str(tmp_path / 'reuters_corpus.csv')
+    __write_corpus__(path, rows)
+
+    corpus = Corpus(corpus_file=path)
+    documents = {doc_id: (title, content) for doc_id, title, content in rows}
+    assert len(corpus) == len(documents)
+    for doc_id, (title, content) in documents.items():
+        assert corpus.get_doc_title(doc_id) == title
+        assert corpus.get_doc_content(doc_id) == content
+        assert corpus.get_doc_excerpt(doc_id) == content[:content.find('.') + 1]
+    doc_ids = list(documents.keys())[:20]
+    assert corpus.get_doc_titles(doc_ids) == [documents[doc_id][0] for doc_id in doc_ids]
+    assert [(d.doc_id, d.title, d.content) for d in corpus.get_documents(doc_ids)] == \
+           [(doc_id,) + documents[doc_id] for doc_id in doc_ids]
+    with pytest.raises(KeyError):
+        corpus.get_doc_title('0')
+
+
+def test_store_is_rebuilt_when_the_csv_changes(tmp_path):
+    path = str(tmp_path / 'course_corpus.csv')
+    __write_corpus__(path, [['1', 'oil', 'Oil prices.']])
+    assert Corpus(corpus_file=path).get_doc_title('1') == 'oil'
+    assert sorted(os.listdir(str(tmp_path))) == ['course_corpus.csv', 'course_corpus.csv' + DOC_STORE_FILE_EXTENSION]
+
+    __write_corpus__(path, [['1', 'oil', 'Oil prices.'], ['2', 'wheat', 'Wheat harvest.']])
+    store_mtime = os.path.getmtime(path + DOC_STORE_FILE_EXTENSION)
+    os.utime(path, (store_mtime + 10, store_mtime + 10))
+    corpus = Corpus(corpus_file=path)
+    assert len(corpus) == 2 and corpus.get_doc_excerpt('2') == 'Wheat harvest.'
+    # written aside and renamed
+    assert not any(name.endswith('.tmp') for name in os.listdir(str(tmp_path)))
@@ -0,0 +1,153 @@
+import csv
+import pickle
+import random
+
+import numpy as np
+import pytest
+
+import index_writer
+from search_engine import SearchEngine
+from commit_point import read_commit_point
+from global_variable import COURSE_CORPUS, REUTERS_CORPUS, TOPIC_INVERTED_INDEX, VSM_MODEL, BOOLEAN_MODEL
+
+WORDS = ['oil', 'price', 'prices', 'wheat', 'harvest', 'bank', 'rate', 'trade', 'deficit', 'japan', 'exports',
+         'computer', 'computing', 'sugar', 'cocoa', 'merger', 'profit', 'dollar', 'yen', 'shipping', 'the', 'of']
+
+
+def __text__(rng: random.Random, length: int, words: list = WORDS) -> str:
+    return ' '.join(rng.choice(words) for _ in range(length)) + '.'
+
+
+@pytest.fixture
+def search_engine(workspace, monkeypatch):
+    """Search engine over two small corpora, documents are flushed as a segment every 20 documents"""
+    monkeypatch.setattr(index_writer, 'WRITE_BUFFER_SIZE', 20)
+    monkeypatch.setattr(index_writer, 'SEGMENT_MERGE_FACTOR', 3)
+    rng = random.Random(11)
+    topics = {}
+    for corpus_path in [COURSE_CORPUS, REUTERS_CORPUS]:
+        with open(corpus_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            for doc_id in range(1, 81):
+                topic = rng.choice(['acq', 'earn', 'crude'])
+                row = [str(doc_id), __text__(rng, 3), __text__(rng, rng.randint(5, 30))]
+                # Reuters rows end with the list of topics
+                writer.writerow(row if corpus_path == COURSE_CORPUS else row + [[topic]])
+                topics.setdefault(topic, []).append(str(doc_id))
+    with open(TOPIC_INVERTED_INDEX, 'wb') as f:
+        pickle.dump(topics, f)
+
+    engine = SearchEngine(model=VSM_MODEL)
+    engine.build_index()
+    engine.switch_corpus('Reuters')
+    yield engine
+    for corpus in ['course_corpus', 'Reuters']:
+        engine.refresh(corpus)
+
+
+def __new_documents__(rng: random.Random, first_doc_id: int, count: int) -> list:
+    """Documents with terms of the corpus and new ones, e.g. 'novelterm3'"""
+    words = WORDS + ['novelterm%d' % i for i in range(5)]
+    return [(str(doc_id), __text__(rng, 3, words), __text__(rng, rng.randint(5, 30), words))
+            for doc_id in range(first_doc_id, first_doc_id + count)]
+
+
+QUERIES = {VSM_MODEL: ['oil price', 'novelterm3', 'noveltrm3 wheat', 'computr', 'japan exports deficit'],
+           BOOLEAN_MODEL: ['oil AND price', 'novelterm3 OR wheat', 'noveltrm3', 'comput* AND_NOT oil',
+                           '( novelterm1 OR novelterm2 ) AND sugar']}
+
+
+def __results__(search_engine: SearchEngine) -> dict:
+    """k: (model, query), v: (doc ids, scores sorted decreasingly, spelling corrections)"""
+    results = {}
+    for model, queries in QUERIES.items():
+        search_engine.switch_model(model)
+        for query in queries:
+            result = search_engine.query(query)
+            doc_ids, scores = result.doc_id_list, []
+            if model == VSM_MODEL:
+                scores = sorted(result.result_scores, reverse=True)
+                # documents of equal scores may be ranked in another order, those tied with the last one may be cut
+                doc_ids = [d for d, s in zip(result.doc_id_list, result.result_scores) if s > scores[-1] * (1 + 1e-5)]
+            results[model, query] = (sorted(doc_ids), scores, result.correction.mapping)
+    search_engine.switch_model(VSM_MODEL)
+    return results
+
+
+def test_added_documents_are_searched_as_after_a_full_rebuild(search_engine):
+    rng = random.Random(12)
+    for i in range(5):
+        search_engine.add_documents(__new_documents__(rng, 1000 + 25 * i, 25))
+    search_engine.refresh()
+    assert len(search_engine._get_current_index().components) > 1
+    incremental = __results__(search_engine)
+    assert len(incremental[VSM_MODEL, 'novelterm3'][0]) != 0
+    assert incremental[VSM_MODEL, 'noveltrm3 wheat'][2] == {'noveltrm3': 'novelterm3'}
+
+    search_engine.build_index()
+    assert len(search_engine._get_current_index().components) == 1
+    full = __results__(search_engine)
+    for key, (doc_ids, scores, corrections) in full.items():
+        assert incremental[key][0] == doc_ids, key
+        assert np.allclose(incremental[key][1], scores, rtol=1e-5), key
+        assert incremental[key][2] == corrections, key
+
+
+def test_deleted_documents_are_left_out_at_once(search_engine, monkeypatch):
+    rng = random.Random(13)
+    search_engine.add_documents(__new_documents__(rng, 2000, 50))
+    search_engine.refresh()
+    deleted = search_engine.query('oil price').doc_id_list[:3] + ['2001']
+    search_engine.delete_documents(deleted)
+    for refreshed in [False, True]:
+        if refreshed:
+            search_engine.refresh()
+        for model in [VSM_MODEL, BOOLEAN_MODEL]:
+            search_engine.switch_model(model)
+            for query in ['oil price', 'oil OR price', 'novelterm0', 'novelterm1']:
+                assert not set(search_engine.query(query).doc_id_list) & set(deleted)
+
+    # a component with too many deleted documents is rewritten without them, they leave the corpus
+    monkeypatch.setattr(index_writer, 'SEGMENT_MAX_DELETED_RATIO', 0)
+    search_engine.delete_documents(['2002'])
+    search_engine.refresh()
+    assert search_engine.query('oil price').doc_id_list
+    for doc_id in deleted + ['2002']:
+        with pytest.raises(KeyError):
+            search_engine.get_doc_content(doc_id)
+    assert search_engine.get_doc_content('2003') != ''
+
+
+def test_relevance_feedback_across_a_refresh(search_engine):
+    rng = random.Random(14)
+    doc_ids = search_engine.query('oil price').doc_id_list
+    search_engine.add_relevance_feedback('oil price', doc_ids[:2], doc_ids[-1:])
+    search_engine.add_documents(__new_documents__(rng, 3000, 30))
+    search_engine.refresh()
+
+    # feedback vectors are over the terms of the new indexes, new documents can be given as feedback
+    search_engine.add_relevance_feedback('oil price', ['3001'], [])
+    expanded = search_engine.rf_session.get_expanded_query('oil price')
+    assert expanded.shape == (1, search_engine._get_current_index().term_count)
+    assert search_engine.rf_session.get_feedback_version('oil price') == 2
+    assert len(search_engine.query('oil price').doc_id_list) != 0
+
+
+def test_restart_reads_the_commit_point(search_engine):
+    rng = random.Random(15)
+    documents = __new_documents__(rng, 4000, 30)
+    search_engine.add_documents(documents)
+    search_engine.delete_documents(['1'])
+    search_engine.refresh()
+    components = read_commit_point('1')['components']
+    assert len(components) > 1
+
+    restarted = SearchEngine(model=VSM_MODEL)
+    restarted.load_index()
+    restarted.switch_corpus('Reuters')
+    assert len(restarted._get_current_index().components) == len(components)
+    restarted.switch_model(BOOLEAN_MODEL)
+    assert set(restarted.query('novelterm2').doc_id_list) == \
+        {doc_id for doc_id, title, content in documents if 'novelterm2' in title + ' ' + content}
+    assert '1' not in restarted.query('oil OR price OR wheat OR bank').doc_id_list
+    restarted.refresh('Reuters')
@@ -0,0 +1,62 @@
+import random
+
+import numpy as np
+from strsimpy.weighted_levenshtein import WeightedLevenshtein, CharacterSubstitutionInterface
+
+from conftest import random_terms
+from util.spelling_candidates import build_spelling_candidates, SpellingCandidateIndex
+from util.spelling_correction import distances, get_closest_term, KEYBOARD_COOR, WEIGHTS
+
+
+class __KeyboardSubstitution__(CharacterSubstitutionInterface):
+    """Reference cost, as computed before the distances were vectorized"""
+
+    def cost(self, c0, c1):
+        if c0 in KEYBOARD_COOR.keys() and c1 in KEYBOARD_COOR.keys():
+            return WEIGHTS[(c0, c1)]
+        return 1
+
+
+WEIGHTED_LEVENSHTEIN = WeightedLevenshtein(__KeyboardSubstitution__())
+
+
+def __misspell__(rng: random.Random, term: str) -> str:
+    chars = list(term)
+    for _ in range(rng.randint(0, 3)):
+        i = rng.randrange(len(chars) + 1)
+        edit = rng.choice(['insert', 'delete', 'substitute'])
+        if edit == 'insert' or len(chars) == 0:
+            chars.insert(i, rng.choice('abcdefghijklmnopqrstuvwxyz-1é'))
+        elif i < len(chars):
+            if edit == 'delete':
+                del chars[i]
+            else:
+                chars[i] = rng.choice('abcdefghijklmnopqrstuvwxyz')
+    return ''.join(chars)
+
+
+def test_distances_match_weighted_levenshtein():
+    rng = random.Random(8)
+    terms = random_terms(rng, 300) + ['', 'u.s.', 'café', 'low-cost']
+    for word in [__misspell__(rng, rng.choice(terms)) for _ in range(100)] + ['', 'é', 'mn']:
+        expected = np.asarray([WEIGHTED_LEVENSHTEIN.distance(word, term) for term in terms])
+        assert np.allclose(distances(word, terms), expected)
+
+        # farther candidates are abandoned, the others are exact
+        max_cost = rng.choice([0.5, 1, 2.5])
+        bounded = distances(word, terms, max_cost=max_cost)
+        within = expected <= max_cost
+        assert np.allclose(bounded[within], expected[within])
+        assert np.all(np.isinf(bounded[expected > max_cost + 1e-9]))
+
+
+def test_closest_term_with_candidate_index_matches_scan():
+    rng = random.Random(9)
+    terms = sorted(random_terms(rng, 400) + ['computer', 'computing', 'oil'])
+    candidate_index = SpellingCandidateIndex(build_spelling_candidates(terms))
+    for word in [__misspell__(rng, rng.choice(terms)) for _ in range(60)] + ['comptuer', 'oli', 'x', 'zzzzzzzzzzzzzz']:
+        expected = [WEIGHTED_LEVENSHTEIN.distance(word, term) for term in terms]
+        # the first closest term in terms order
+        closest = terms[int(np.argmin(expected))]
+        assert get_closest_term(word=word, terms=terms, candidate_index=candidate_index) == closest, word
+        assert get_closest_term(word=word, terms=terms) == closest, word
@@ -0,0 +1,62 @@
+import random
+
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+
+from conftest import random_terms, random_documents
+from retrieval_model.vsm_retrieval import score, top_k, max_score
+
+
+@pytest.fixture
+def index(build_index):
+    rng = random.Random(2)
+    return build_index(random_documents(rng, random_terms(rng, 300), doc_count=3000))
+
+
+def __random_queries__(rng: random.Random, term_count: int, count: int) -> list:
+    """Queries of frequent terms, whose columns are long enough to be pruned, and of any terms"""
+    queries = []
+    for i in range(count):
+        n = rng.randint(1, 6)
+        term_ids = rng.sample(range(20), n) if i % 2 == 0 else rng.sample(range(term_count), n)
+        weights = [rng.choice([1.0, 2.0, rng.random()]) for _ in term_ids]
+        queries.append(csr_matrix((weights, ([0] * n, term_ids)), shape=(1, term_count)))
+    return queries
+
+
+@pytest.mark.parametrize('k', [1, 10, 100])
+def test_max_score_is_exhaustive(index, k):
+    rng = random.Random(k)
+    for query in __random_queries__(rng, len(index.terms), count=100):
+        expected_rows, expected_scores = top_k(*score(index, query), k=k)
+        rows, scores = max_score(index, query, k=k)
+        assert np.array_equal(rows, expected_rows)
+        assert np.allclose(scores, expected_scores)
+
+
+def test_max_score_with_row_mask(index):
+    rng = random.Random(3)
+    row_mask = np.asarray([rng.random() < 0.3 for _ in range(index.tf_idf_matrix.shape[0])])
+    for query in __random_queries__(rng, len(index.terms), count=50):
+        expected_rows, expected_scores = top_k(*score(index, query, row_mask=row_mask), k=10)
+        rows, scores = max_score(index, query, k=10, row_mask=row_mask)
+        assert np.all(row_mask[rows])
+        assert np.array_equal(rows, expected_rows)
+        assert np.allclose(scores, expected_scores)
+
+
+def test_max_score_with_negative_weights(index):
+    # expanded queries of negative relevance feedback have negative weights, bounds do not hold for them
+    query = csr_matrix(([1.0, -0.5, 0.2], ([0, 0, 0], [0, 1, 2])), shape=(1, len(index.terms)))
+    expected_rows, expected_scores = top_k(*score(index, query), k=10)
+    rows, scores = max_score(index, query, k=10)
+    assert np.array_equal(rows, expected_rows) and np.allclose(scores, expected_scores)
+
+
+def test_top_k_breaks_ties_by_row():
+    rows = np.asarray([5, 3, 9, 1, 7])
+    scores = np.asarray([1.0, 2.0, 1.0, 1.0, 0.5])
+    top_rows, top_scores = top_k(rows, scores, k=3)
+    assert top_rows.tolist() == [3, 1, 5]
+    assert top_scores.tolist() == [2.0, 1.0, 1.0]
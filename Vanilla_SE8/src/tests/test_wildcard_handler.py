@@ -0,0 +1,44 @@
+import random
+import re
+
+import numpy as np
+
+from conftest import random_terms
+from util.binary_storage import SortedStringTable
+from util.wildcard_handler import build_permuterm, PermutermIndex, is_wildcard_term
+
+
+def __regex_lookup__(terms: list, pattern: str) -> list:
+    regex = re.compile('^' + '.*'.join(re.escape(part) for part in pattern.split('*')) + '$')
+    return [term_id for term_id, term in enumerate(terms) if is_wildcard_term(term) and regex.match(term)]
+
+
+def __random_pattern__(rng: random.Random, terms: list) -> str:
+    """Pieces of a term separated by wildcards, so that most patterns match something"""
+    term = rng.choice(terms)
+    cuts = sorted(rng.sample(range(len(term) + 1), rng.randint(1, min(3, len(term) + 1))))
+    pieces = [term[i:j] for i, j in zip([0] + cuts, cuts + [len(term)])]
+    # drop characters around the wildcards, patterns such as 'ab*', '*ab', 'a*b*c' or '*'
+    return '*'.join(piece[:rng.randint(0, len(piece))] if rng.random() < 0.5 else piece for piece in pieces)
+
+
+def test_lookup_matches_regex():
+    rng = random.Random(7)
+    terms = sorted(random_terms(rng, 2000) + ['u.s.', 'low-cost', 'x1', 'a', 'aa', 'aba', 'abab'])
+    table = SortedStringTable.from_strings(terms)
+    permuterm = PermutermIndex(build_permuterm(list(table)), terms=table)
+
+    patterns = [__random_pattern__(rng, terms) for _ in range(500)]
+    patterns += ['*', 'a*', '*a', 'a*a', 'ab*ab', 'a*b*a', '*b*', 'u*', 'l*t', 'x*', 'zzzz*', '*qqqq*']
+    for pattern in patterns:
+        term_ids = permuterm.lookup(pattern)
+        assert np.all(np.diff(term_ids) > 0), pattern
+        assert term_ids.tolist() == __regex_lookup__(terms, pattern), pattern
+
+
+def test_wildcard_terms_of_an_index(build_index):
+    index = build_index([('1', ['computer', 'oil']), ('2', ['computing', 'price']), ('3', ['compute', 'oil'])])
+    assert [index.terms[i] for i in index.get_term_ids_by_wildcard('comput*')] == \
+        ['compute', 'computer', 'computing']
+    assert [index.terms[i] for i in index.get_term_ids_by_wildcard('*o*')] == \
+        ['compute', 'computer', 'computing', 'oil']
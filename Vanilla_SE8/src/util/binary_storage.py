@@ -0,0 +1,201 @@
+import json
+import numpy as np
+
+"""
+Flat binary container for index data
+
+Layout: MAGIC | version (uint32) | header length (uint32) | json header | arrays
+The json header holds the meta data and the dtype, shape and offset of every array. Each array starts on an ALIGNMENT
+boundary so that it can be opened in place with np.memmap, loading then costs almost nothing and the pages are shared
+by every process mapping the same file.
+"""
+
+MAGIC = b'VSE8BIN\0'
+ALIGNMENT = 64
+_PREAMBLE_SIZE = len(MAGIC) + 4 + 4
+
+
+def _align(n: int) -> int:
+    return (n + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def save_arrays(path: str, arrays: dict, meta: dict, version: int) -> None:
+    """
+    Save arrays into a flat binary file
+    :param path:
+    :param arrays: k: name, v: np.ndarray
+    :param meta: json serializable dict
+    :param version: format version, checked at loading time
+    """
+    arrays = {name: np.ascontiguousarray(arr) for name, arr in arrays.items()}
+
+    array_headers = {}
+    offset = 0
+    for name, arr in arrays.items():
+        array_headers[name] = {'dtype': arr.dtype.str, 'shape': list(arr.shape), 'offset': offset}
+        offset = _align(offset + arr.nbytes)
+
+    header = json.dumps({'meta': meta, 'arrays': array_headers}).encode('utf-8')
+    data_start = _align(_PREAMBLE_SIZE + len(header))
+
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(np.uint32(version).tobytes())
+        f.write(np.uint32(len(header)).tobytes())
+        f.write(header)
+        for name, arr in arrays.items():
+            f.seek(data_start + array_headers[name]['offset'])
+            f.write(arr.tobytes())
+        f.truncate(data_start + offset)
+
+
+def read_header(path: str, version: int):
+    """
+    Read the header of a flat binary file
+    :return: (header dict, start of the data section), None if the file is not of the expected format and version
+    """
+    with open(path, 'rb') as f:
+        preamble = f.read(_PREAMBLE_SIZE)
+        if len(preamble) != _PREAMBLE_SIZE or preamble[:len(MAGIC)] != MAGIC:
+            return None
+        file_version = int(np.frombuffer(preamble, dtype=np.uint32, count=1, offset=len(MAGIC))[0])
+        header_len = int(np.frombuffer(preamble, dtype=np.uint32, count=1, offset=len(MAGIC) + 4)[0])
+        if file_version != version:
+            return None
+        header = json.loads(f.read(header_len).decode('utf-8'))
+    return header, _align(_PREAMBLE_SIZE + header_len)
+
+
+def load_arrays(path: str, version: int):
+    """
+    Open every array of a flat binary file as a read-only np.memmap
+    :return: (arrays dict, meta dict)
+    """
+    r = read_header(path, version)
+    if r is None:
+        raise ValueError('%s is not a valid binary file of version %s' % (path, version))
+    header, data_start = r
+
+    arrays = {}
+    for name, h in header['arrays'].items():
+        shape = tuple(h['shape'])
+        dtype = np.dtype(h['dtype'])
+        if int(np.prod(shape)) == 0:
+            # empty array cannot be mapped
+            arrays[name] = np.empty(shape, dtype=dtype)
+        else:
+            arrays[name] = np.memmap(path, dtype=dtype, mode='r', offset=data_start + h['offset'], shape=shape)
+    return arrays, header['meta']
+
+
+class StringTable:
+    """Immutable list of strings stored as one utf-8 buffer plus an offsets array"""
+
+    def __init__(self, buffer: np.ndarray, offsets: np.ndarray):
+        self.buffer = buffer  # uint8
+        self.offsets = offsets  # int64, len(strings) + 1
+
+    @staticmethod
+    def from_strings(strings) -> 'StringTable':
+        encoded = [s.encode('utf-8') for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        buffer = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        return StringTable(buffer=buffer, offsets=offsets)
+
+    @staticmethod
+    def from_arrays(arrays: dict, name: str) -> 'StringTable':
+        return StringTable(buffer=arrays[name + '_buffer'], offsets=arrays[name + '_offsets'])
+
+    def to_arrays(self, name: str) -> dict:
+        return {name + '_buffer': self.buffer, name + '_offsets': self.offsets}
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('string table index out of range')
+        return self.buffer[self.offsets[i]:self.offsets[i + 1]].tobytes().decode('utf-8')
+
+    def __iter__(self):
+        data = self.buffer.tobytes()
+        offsets = self.offsets.tolist()
+        for i in range(len(offsets) - 1):
+            yield data[offsets[i]:offsets[i + 1]].decode('utf-8')
+
+    def index(self, s: str) -> int:
+        for i, e in enumerate(self):
+            if e == s:
+                return i
+        raise ValueError('%s is not in string table' % s)
+
+    def __contains__(self, s: str) -> bool:
+        try:
+            self.index(s)
+            return True
+        except ValueError:
+            return False
+
+    def nbytes(self) -> int:
+        return self.buffer.nbytes + self.offsets.nbytes
+
+
+class SortedStringTable(StringTable):
+    """String table whose strings are sorted, lookups are binary searches instead of scans"""
+
+    @staticmethod
+    def from_strings(strings) -> 'SortedStringTable':
+        table = StringTable.from_strings(sorted(strings))
+        return SortedStringTable(buffer=table.buffer, offsets=table.offsets)
+
+    @staticmethod
+    def from_arrays(arrays: dict, name: str) -> 'SortedStringTable':
+        return SortedStringTable(buffer=arrays[name + '_buffer'], offsets=arrays[name + '_offsets'])
+
+    def find(self, s: str) -> int:
+        """Index of s, -1 if not found"""
+        # utf-8 byte order is the same as code point order, so comparing the encoded bytes is enough
+        target = s.encode('utf-8')
+        buffer, offsets = self.buffer, self.offsets
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if buffer[offsets[mid]:offsets[mid + 1]].tobytes() < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self) and buffer[offsets[lo]:offsets[lo + 1]].tobytes() == target:
+            return lo
+        return -1
+
+    def prefix_range(self, prefix: str) -> (int, int):
+        """Range [lo, hi) of the strings starting with prefix"""
+        target = prefix.encode('utf-8')
+        n = len(target)
+        buffer, offsets = self.buffer, self.offsets
+
+        def __bisect__(lo: int, hi: int, before) -> int:
+            """First position in [lo, hi) whose string is not before the target"""
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if before(buffer[offsets[mid]:offsets[mid + 1]].tobytes()):
+                    lo = mid + 1
+                else:
+                    hi = mid
+            return lo
+
+        lo = __bisect__(0, len(self), lambda s: s < target)
+        hi = __bisect__(lo, len(self), lambda s: s[:n] == target)
+        return lo, hi
+
+    def index(self, s: str) -> int:
+        i = self.find(s)
+        if i == -1:
+            raise ValueError('%s is not in string table' % s)
+        return i
+
+    def __contains__(self, s: str) -> bool:
+        return self.find(s) != -1
@@ -0,0 +1,75 @@
+import numpy as np
+from itertools import groupby
+
+from util.binary_storage import StringTable, SortedStringTable
+from global_variable import COMPLETION_LIMIT, COMPLETION_PREFIX_LENGTH
+
+"""
+Prefix completion index for query completion
+
+Terms are kept sorted, the terms starting with a prefix are then a contiguous range found with two binary searches,
+they are ranked by frequency over the corpus. Short prefixes match a large part of the vocabulary, so the best
+COMPLETION_LIMIT terms of every prefix of at most COMPLETION_PREFIX_LENGTH characters are precomputed. Longer prefixes
+only match a few terms, these are ranked at lookup time.
+"""
+
+
+def _rank(term_ids: np.ndarray, counts: np.ndarray, limit: int) -> np.ndarray:
+    """Term ids by decreasing count, alphabetically on ties, at most limit of them"""
+    if len(term_ids) > limit:
+        # the limit-th largest count, terms below it cannot be selected
+        kth = np.partition(counts[term_ids], len(term_ids) - limit)[len(term_ids) - limit]
+        term_ids = term_ids[counts[term_ids] >= kth]
+    return term_ids[np.lexsort((term_ids, -counts[term_ids]))][:limit]
+
+
+def build_completion_index(terms: list, counts: np.ndarray) -> dict:
+    """
+    Build the completion arrays of a sorted vocabulary
+    :param terms: position of a term is its term id
+    :param counts: frequency over the corpus, by term id
+    :return: arrays, see CompletionIndex
+    """
+    top_terms = {}  # k: prefix, v: ids of its best terms
+    for length in range(COMPLETION_PREFIX_LENGTH + 1):
+        # terms sharing a prefix are contiguous since terms are sorted
+        term_ids = (i for i, term in enumerate(terms) if len(term) >= length)
+        for prefix, group in groupby(term_ids, key=lambda i: terms[i][:length]):
+            top_terms[prefix] = _rank(np.fromiter(group, dtype=np.int64), counts, COMPLETION_LIMIT)
+    prefixes = sorted(top_terms.keys())
+
+    top_term_ids = np.full((len(prefixes), COMPLETION_LIMIT), -1, dtype=np.int32)
+    for i, prefix in enumerate(prefixes):
+        top_term_ids[i, :len(top_terms[prefix])] = top_terms[prefix]
+
+    arrays = {'completion_top_terms': top_term_ids}
+    arrays.update(StringTable.from_strings(prefixes).to_arrays('completion_prefixes'))
+    return arrays
+
+
+class CompletionIndex:
+
+    def __init__(self, arrays: dict, terms: SortedStringTable, counts: np.ndarray):
+        self.terms = terms
+        self.counts = counts  # frequency over the corpus, by term id
+        self.prefixes = SortedStringTable.from_arrays(arrays, 'completion_prefixes')
+        self.top_terms = arrays['completion_top_terms']  # best term ids of every prefix, padded with -1
+
+    def complete(self, prefix: str, limit: int = COMPLETION_LIMIT) -> list:
+        """Most frequent terms starting with prefix, by decreasing frequency"""
+        if len(prefix) <= COMPLETION_PREFIX_LENGTH and limit <= COMPLETION_LIMIT:
+            i = self.prefixes.find(prefix)
+            if i == -1:
+                return []
+            term_ids = self.top_terms[i][:limit]
+            term_ids = term_ids[term_ids != -1]
+        else:
+            lo, hi = self.terms.prefix_range(prefix)
+            term_ids = _rank(np.arange(lo, hi), self.counts, limit)
+        return [self.terms[int(term_id)] for term_id in term_ids]
+
+    def __len__(self):
+        return len(self.terms)
+
+    def nbytes(self) -> int:
+        return self.prefixes.nbytes() + self.top_terms.nbytes
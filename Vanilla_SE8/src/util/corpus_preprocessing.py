@@ -1,6 +1,9 @@
 import csv
 import os
+import re
 import sys
+from html import unescape
+from multiprocessing import Pool
 from bs4 import BeautifulSoup
 
 sys.path.append('..')
@@ -50,36 +53,83 @@ def preprocess_course_corpus():
                 writer.writerow([doc_id, name, course_description])
 
 
-def preprocess_reuters_corpus():
+# Reuters SGML is regular enough to be read with a few regular expressions, one document at a time
+_REUTERS_END = '</REUTERS>'
+_NEWID_RE = re.compile(r'<REUTERS[^>]*\bNEWID="(\d+)"', re.IGNORECASE)
+_TEXT_RE = re.compile(r'<TEXT[^>]*>(.*?)</TEXT>', re.IGNORECASE | re.DOTALL)
+_TITLE_RE = re.compile(r'<TITLE>(.*?)</TITLE>', re.IGNORECASE | re.DOTALL)
+_BODY_RE = re.compile(r'<BODY>(.*?)</BODY>', re.IGNORECASE | re.DOTALL)
+_TOPICS_RE = re.compile(r'<TOPICS>(.*?)</TOPICS>', re.IGNORECASE | re.DOTALL)
+_D_RE = re.compile(r'<D>(.*?)</D>', re.IGNORECASE | re.DOTALL)
+_BYTE_CHARREF_RE = re.compile(r'&#(\d+);')
+
+
+def _unescape(s: str) -> str:
+    """Unescape entities, character references below 256 are windows-1252 bytes, as BeautifulSoup reads them"""
+    pieces = _BYTE_CHARREF_RE.split(s)  # text and reference numbers alternately
+    for i in range(1, len(pieces), 2):
+        n = int(pieces[i])
+        if n < 256:
+            try:
+                pieces[i] = bytes([n]).decode('windows-1252')
+            except UnicodeDecodeError:
+                pieces[i] = chr(n)
+        else:
+            pieces[i] = unescape('&#%s;' % pieces[i])
+    pieces[::2] = [unescape(piece) for piece in pieces[::2]]
+    return ''.join(pieces)
+
+
+def _parse_reuters_document(sgml: str) -> list:
+    """:return: [doc_id, title, content, topics] of one <REUTERS> element"""
+    def __first__(regex, s: str) -> str:
+        m = regex.search(s) if s is not None else None
+        return _unescape(m.group(1)) if m is not None else ''
+
+    text = _TEXT_RE.search(sgml)
+    text = text.group(1) if text is not None else None
+    topics = _TOPICS_RE.search(sgml)
+    topics = [_unescape(d) for d in _D_RE.findall(topics.group(1))] if topics is not None else []
+    return [_NEWID_RE.search(sgml).group(1), __first__(_TITLE_RE, text), __first__(_BODY_RE, text).strip(), topics]
+
+
+def _parse_reuters_file(path: str) -> list:
+    """
+    Documents of one .sgm file, read line by line so that the raw sgml of only one document is buffered at a time,
+    the parsed documents of the whole file are returned together to the process pool
+    """
+    documents = []
+    lines = []
+    with open(path, 'r', encoding='ISO-8859-1') as f:
+        for line in f:
+            lines.append(line)
+            if _REUTERS_END in line:
+                documents.append(_parse_reuters_document(''.join(lines)))
+                lines = []
+    return documents
+
+
+def iter_reuters_documents(target_files: list, processes: int = None):
+    """
+    Parse .sgm files in a process pool, one file per task
+    :param target_files: paths of .sgm files
+    :param processes: number of worker processes, number of cores if None
+    :return: generator of [doc_id, title, content, topics], in file order
+    """
+    with Pool(processes=processes) as pool:
+        for documents in pool.imap(_parse_reuters_file, target_files):
+            yield from documents
+
+
+def preprocess_reuters_corpus(processes: int = None):
     target_files = [f for f in os.listdir('../' + RAW_RETUERS_DIR) if f.endswith('.sgm')]
     target_files = sorted(target_files)
 
-    # Extract information
-    doc_ids = []
-    contents = []
-    topics_lst = []
-    titles = []
-    for target_file in target_files:
-        with open('../' + RAW_RETUERS_DIR + target_file, 'r', encoding='ISO-8859-1') as f:
-            src_file = f.read()
-        soup = BeautifulSoup(src_file, 'html.parser')
-        for e in soup.find_all('reuters'):
-            doc_id = e.get('newid')
-            content = e.find('text')
-            main_content = (lambda x: x.string if x is not None else '')(content.find('body'))
-            topics = (lambda x: list(map(lambda y: y.string, x)) if x != [] else x)(e.find('topics').find_all('d'))
-            title = (lambda x: x.string if x is not None else '')(content.find('title'))
-
-            doc_ids.append(doc_id)
-            contents.append(main_content.strip())
-            topics_lst.append(topics)
-            titles.append(title)
-
-    # Write corpus
+    # Extract information and write corpus as documents come
     with open('../' + REUTERS_CORPUS, 'w', newline='') as o:
         writer = csv.writer(o)
-        for doc_id, title, content, topics in zip(doc_ids, titles, contents, topics_lst):
-            writer.writerow([doc_id, title, content, topics])
+        for document in iter_reuters_documents(['../' + RAW_RETUERS_DIR + f for f in target_files], processes):
+            writer.writerow(document)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,53 @@
+import pickle
+from os.path import exists
+
+from index_reader import IndexReader
+from util.lru_cache import LRUCache
+from util.spelling_correction import get_closest_term
+from global_variable import CORRECTION_CACHE_CAPACITY
+
+
+class CorrectionCache:
+    """
+    Spelling corrections already computed, shared by all retrieval models
+    Keys hold the name and build id of the index, so corrections of a rebuilt or updated index are never served
+    """
+
+    def __init__(self, capacity: int = CORRECTION_CACHE_CAPACITY):
+        self.__corrections__ = LRUCache(capacity=capacity)  # k: (index name, build id, word), v: correction
+
+    def get_correction(self, index: IndexReader, word: str) -> str:
+        """Closest term of index to word"""
+        key = (str(index), index.build_id, word)
+        correction = self.__corrections__.get(key)
+        if correction is None:
+            terms, candidate_index = index.get_spelling_candidates()
+            correction = get_closest_term(word=word, terms=terms, candidate_index=candidate_index)
+            self.__corrections__.put(key, correction)
+        return correction
+
+    def invalidate(self, index_name: str = None) -> None:
+        """Drop the corrections of an index, of all indexes if no name is given"""
+        if index_name is None:
+            self.__corrections__.clear()
+        else:
+            for key in self.__corrections__.keys():
+                if key[0] == index_name:
+                    self.__corrections__.pop(key)
+
+    def save(self, path: str) -> None:
+        with open(path, 'wb') as f:
+            pickle.dump(self.__corrections__.items(), f)
+
+    def load(self, path: str) -> None:
+        """Add the corrections saved in a file, entries of older builds are kept but can no longer be hit"""
+        if exists(path):
+            with open(path, 'rb') as f:
+                for key, correction in pickle.load(f):
+                    self.__corrections__.put(key, correction)
+
+    def stats(self) -> dict:
+        return self.__corrections__.stats()
+
+
+CORRECTION_CACHE = CorrectionCache()
@@ -0,0 +1,70 @@
+from collections import OrderedDict
+from threading import Lock
+
+
+class LRUCache:
+    """Size bounded mapping which evicts the least recently used entry, also counts hits and misses"""
+
+    def __init__(self, capacity: int, on_evict=None):
+        """
+        :param capacity: max number of entries
+        :param on_evict: optional callback(key, value) invoked for every evicted entry
+        """
+        assert capacity > 0
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.__on_evict__ = on_evict
+        self.__entries__ = OrderedDict()
+        self.__lock__ = Lock()
+
+    def get(self, key, default=None):
+        with self.__lock__:
+            if key in self.__entries__:
+                self.__entries__.move_to_end(key)
+                self.hits += 1
+                return self.__entries__[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value) -> None:
+        evicted = []
+        with self.__lock__:
+            self.__entries__[key] = value
+            self.__entries__.move_to_end(key)
+            while len(self.__entries__) > self.capacity:
+                evicted.append(self.__entries__.popitem(last=False))
+        if self.__on_evict__ is not None:
+            for k, v in evicted:
+                self.__on_evict__(k, v)
+
+    def pop(self, key, default=None):
+        with self.__lock__:
+            return self.__entries__.pop(key, default)
+
+    def clear(self) -> None:
+        with self.__lock__:
+            self.__entries__.clear()
+
+    def items(self) -> list:
+        """Entries from the least to the most recently used"""
+        with self.__lock__:
+            return list(self.__entries__.items())
+
+    def keys(self) -> list:
+        return [k for k, _ in self.items()]
+
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total != 0 else 0.0
+
+    def stats(self) -> dict:
+        return {'size': len(self), 'capacity': self.capacity, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hit_rate()}
+
+    def __contains__(self, key):
+        with self.__lock__:
+            return key in self.__entries__
+
+    def __len__(self):
+        return len(self.__entries__)
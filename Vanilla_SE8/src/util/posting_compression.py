@@ -0,0 +1,121 @@
+import numpy as np
+
+from global_variable import POSTING_BLOCK_SIZE
+
+"""
+Compressed posting lists
+
+Doc ids of a term are sorted numerically and stored as deltas (gap to the previous doc id of the same term, the first
+doc id as is) encoded with variable-byte: 7 bits per byte, least significant group first, the high bit marks the last
+byte of a value. Every POSTING_BLOCK_SIZE doc ids form a block, the last doc id and byte offset of each block act as
+skip pointers, so a block can be located with a binary search and decoded on its own.
+"""
+
+
+def vbyte_encode(values: np.ndarray) -> (np.ndarray, np.ndarray):
+    """
+    Variable-byte encode non-negative integers
+    :return: (encoded bytes as uint8 array, number of bytes of every value)
+    """
+    values = np.asarray(values, dtype=np.int64)
+    n_bytes = np.ones(len(values), dtype=np.int64)
+    remaining = values >> 7
+    while np.any(remaining):
+        n_bytes += remaining > 0
+        remaining >>= 7
+
+    starts = np.zeros(len(values), dtype=np.int64)
+    if len(values) > 1:
+        np.cumsum(n_bytes[:-1], out=starts[1:])
+    encoded = np.zeros(int(n_bytes.sum()), dtype=np.uint8)
+    for j in range(int(n_bytes.max()) if len(values) != 0 else 0):
+        has_byte = n_bytes > j
+        b = (values[has_byte] >> (7 * j)) & 0x7f
+        b |= np.where(n_bytes[has_byte] == j + 1, 0x80, 0)
+        encoded[starts[has_byte] + j] = b
+    return encoded, n_bytes
+
+
+def vbyte_decode(encoded: np.ndarray) -> np.ndarray:
+    """Decode a variable-byte encoded uint8 array"""
+    encoded = np.asarray(encoded, dtype=np.uint8)
+    if len(encoded) == 0:
+        return np.empty(0, dtype=np.int64)
+    is_last = (encoded & 0x80) != 0
+    value_starts = np.flatnonzero(np.concatenate(([True], is_last[:-1])))
+    value_idx = np.cumsum(np.concatenate(([0], is_last[:-1]))).astype(np.int64)
+    shift = 7 * (np.arange(len(encoded), dtype=np.int64) - value_starts[value_idx])
+    contributions = (encoded & 0x7f).astype(np.int64) << shift
+    return np.add.reduceat(contributions, value_starts)
+
+
+def compress_postings(postings: np.ndarray, indptr: np.ndarray) -> dict:
+    """
+    Compress numerically sorted posting lists of all terms
+    :param postings: doc ids of all terms concatenated, postings of term i are postings[indptr[i]:indptr[i + 1]]
+    :param indptr:
+    :return: arrays to be stored in index file, see PostingList
+    """
+    postings = np.asarray(postings, dtype=np.int64)
+    indptr = np.asarray(indptr, dtype=np.int64)
+    counts = np.diff(indptr)
+    n_terms = len(counts)
+
+    # gaps within each term, first doc id of a term is kept as is
+    deltas = postings.copy()
+    if len(postings) > 1:
+        deltas[1:] -= postings[:-1]
+    deltas[indptr[:-1][counts > 0]] = postings[indptr[:-1][counts > 0]]
+    encoded, n_bytes = vbyte_encode(deltas)
+    value_offsets = np.zeros(len(postings) + 1, dtype=np.int64)
+    np.cumsum(n_bytes, out=value_offsets[1:])
+
+    # blocks
+    n_blocks = (counts + POSTING_BLOCK_SIZE - 1) // POSTING_BLOCK_SIZE
+    block_indptr = np.zeros(n_terms + 1, dtype=np.int64)
+    np.cumsum(n_blocks, out=block_indptr[1:])
+    block_term = np.repeat(np.arange(n_terms), n_blocks)
+    block_rank = np.arange(int(block_indptr[-1]), dtype=np.int64) - block_indptr[:-1][block_term]
+    block_first = indptr[:-1][block_term] + block_rank * POSTING_BLOCK_SIZE
+    block_end = np.minimum(block_first + POSTING_BLOCK_SIZE, indptr[1:][block_term])
+
+    return {'postings_bytes': encoded,
+            'postings_df': counts.astype(np.int32),
+            'postings_block_indptr': block_indptr,
+            'postings_block_last': postings[block_end - 1].astype(np.int32),
+            'postings_block_offsets': np.concatenate((value_offsets[block_first], [len(encoded)])).astype(np.int64)}
+
+
+class PostingList:
+    """Compressed posting list of one term, decoded as a whole or block by block"""
+
+    def __init__(self, arrays: dict, term_id: int):
+        self.__bytes__ = arrays['postings_bytes']
+        self.__block_offsets__ = arrays['postings_block_offsets']
+        self.__first_block__ = int(arrays['postings_block_indptr'][term_id])
+        self.__end_block__ = int(arrays['postings_block_indptr'][term_id + 1])
+        self.block_last = arrays['postings_block_last'][self.__first_block__:self.__end_block__]  # skip pointers
+        self.df = int(arrays['postings_df'][term_id])
+
+    def __len__(self):
+        return self.df
+
+    def n_blocks(self) -> int:
+        return self.__end_block__ - self.__first_block__
+
+    def decode(self) -> np.ndarray:
+        """All doc ids of the term"""
+        start = self.__block_offsets__[self.__first_block__]
+        end = self.__block_offsets__[self.__end_block__]
+        return np.cumsum(vbyte_decode(self.__bytes__[start:end]))
+
+    def decode_block(self, b: int) -> np.ndarray:
+        """Doc ids of the b-th block of the term"""
+        start = self.__block_offsets__[self.__first_block__ + b]
+        end = self.__block_offsets__[self.__first_block__ + b + 1]
+        base = int(self.block_last[b - 1]) if b > 0 else 0
+        return np.cumsum(vbyte_decode(self.__bytes__[start:end])) + base
+
+    def find_block(self, doc_id: int, from_block: int = 0) -> int:
+        """Index of the first block, not before from_block, which may contain doc_id, n_blocks() if none"""
+        return from_block + int(np.searchsorted(self.block_last[from_block:], doc_id, side='left'))
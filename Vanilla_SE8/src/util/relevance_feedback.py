@@ -1,11 +1,11 @@
-import numpy as np
+from scipy.sparse import csr_matrix
 
 from global_variable import ALPHA, BETA, GAMMA
 
 
 class RelevanceFeedback:
-    def __init__(self, query_vec: np.ndarray, p_vec_list: list, n_vec_list: list):
-        # list of np.ndarray
+    def __init__(self, query_vec: csr_matrix, p_vec_list: list, n_vec_list: list):
+        # list of csr_matrix (1, v)
         self.query_vec = query_vec
         self.positive_doc_vec_list = p_vec_list
         self.negative_doc_vec_list = n_vec_list
@@ -24,35 +24,39 @@ class RelevanceFeedback:
 
     @staticmethod
     def merge(rf1, rf2):
-        assert np.array_equal(rf1.query_vec, rf2.query_vec)
+        assert (rf1.query_vec != rf2.query_vec).nnz == 0
         p_vec_list = rf1.positive_doc_vec_list + rf2.positive_doc_vec_list
         n_vec_list = rf1.negative_doc_vec_list + rf2.negative_doc_vec_list
         return RelevanceFeedback(rf1.query_vec, p_vec_list, n_vec_list)
 
     @staticmethod
-    def __get_vec_sum__(vec_list: list) -> np.ndarray:
+    def __get_vec_sum__(vec_list: list):
         if len(vec_list) > 0:
-            summation = np.zeros(vec_list[0].shape, dtype=vec_list[0].dtype)
-            for vec in vec_list:
-                summation += vec
+            summation = vec_list[0]
+            for vec in vec_list[1:]:
+                summation = summation + vec
             return summation
-        return np.asarray([])
+        return None
 
     @staticmethod
-    def __rocchio__(q0: np.ndarray, p_doc_count: int, n_doc_count: int,
-                    p_doc_vec_sum: np.ndarray, n_doc_vec_sum: np.ndarray) -> np.ndarray:
-        term1 = ALPHA * q0
-        term2 = BETA * (1 / p_doc_count) * p_doc_vec_sum if p_doc_count != 0 else 0
-        term3 = GAMMA * (1 / n_doc_count) * n_doc_vec_sum if n_doc_count != 0 else 0
-        return term1 + term2 - term3
+    def __rocchio__(q0: csr_matrix, p_doc_count: int, n_doc_count: int,
+                    p_doc_vec_sum: csr_matrix, n_doc_vec_sum: csr_matrix) -> csr_matrix:
+        expanded = ALPHA * q0
+        if p_doc_count != 0:
+            expanded = expanded + BETA * (1 / p_doc_count) * p_doc_vec_sum
+        if n_doc_count != 0:
+            expanded = expanded - GAMMA * (1 / n_doc_count) * n_doc_vec_sum
+        return csr_matrix(expanded)
 
 
 class RelevanceFeedbackSession:
 
     def __init__(self):
         self.relevance_memory = {}  # k: query: str, v: RelevanceFeedback obj
+        self.feedback_versions = {}  # k: query: str, v: number of feedbacks added
 
     def add_relevance_feedback(self, query: str, rf: RelevanceFeedback):
+        self.feedback_versions[query] = self.feedback_versions.get(query, 0) + 1
         if query not in self.relevance_memory.keys():
             self.relevance_memory[query] = rf
         else:
@@ -62,5 +66,9 @@ class RelevanceFeedbackSession:
     def exists_rf(self, query: str):
         return query in self.relevance_memory.keys()
 
-    def get_expanded_query(self, query: str) -> np.ndarray:
+    def get_feedback_version(self, query: str) -> int:
+        """Changes every time feedback is added for the query, 0 if there is none"""
+        return self.feedback_versions.get(query, 0)
+
+    def get_expanded_query(self, query: str) -> csr_matrix:
         return self.relevance_memory[query].get_expanded_query()
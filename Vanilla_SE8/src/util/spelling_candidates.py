@@ -0,0 +1,84 @@
+import numpy as np
+from collections import Counter
+
+from util.binary_storage import StringTable, SortedStringTable
+
+"""
+Candidate generation for spelling correction
+
+Character bigrams of every term padded with '$' are indexed, with their number of occurrences in the term. A string
+of length n has n + 1 padded bigrams and one edit changes at most 2 of them, so two strings within edit distance k
+share at least max(n1, n2) + 1 - 2k bigrams and their lengths differ by at most k. Counting the bigrams shared with a
+word gives all terms that may be within edit distance k of it, without comparing the word to every term.
+
+'n' is folded into 'm' since the two keys share a position in the keyboard weighted edit distance, substituting them
+is free. Every other edit costs at least 1, so the edit distance of the folded strings is a lower bound of the
+weighted distance.
+"""
+
+PADDING = '$'
+
+
+def fold(word: str) -> str:
+    return word.replace('n', 'm')
+
+
+def _padded_bigrams(word: str) -> list:
+    chars = PADDING + fold(word) + PADDING
+    return [chars[i:i + 2] for i in range(len(chars) - 1)]
+
+
+def build_spelling_candidates(terms: list) -> dict:
+    """
+    Build the bigram arrays of a sorted term list
+    :param terms: position of a term is its term id
+    :return: arrays to be stored in index file, see SpellingCandidateIndex
+    """
+    bigram_index = {}  # k: bigram, v: [(term id, occurrences in term)]
+    for term_id, term in enumerate(terms):
+        for bigram, count in Counter(_padded_bigrams(term)).items():
+            if bigram in bigram_index.keys():
+                bigram_index[bigram].append((term_id, count))
+            else:
+                bigram_index[bigram] = [(term_id, count)]
+    bigrams = sorted(bigram_index.keys())
+
+    indptr = np.zeros(len(bigrams) + 1, dtype=np.int64)
+    np.cumsum([len(bigram_index[b]) for b in bigrams], out=indptr[1:])
+    arrays = {'spelling_bigram_terms_indptr': indptr,
+              'spelling_bigram_terms': np.asarray([t for b in bigrams for t, _ in bigram_index[b]], dtype=np.int32),
+              'spelling_bigram_counts': np.asarray([c for b in bigrams for _, c in bigram_index[b]], dtype=np.int16),
+              'spelling_term_lengths': np.asarray([len(t) for t in terms], dtype=np.int32)}
+    arrays.update(StringTable.from_strings(bigrams).to_arrays('spelling_bigrams'))
+    return arrays
+
+
+class SpellingCandidateIndex:
+
+    def __init__(self, arrays: dict):
+        self.bigrams = SortedStringTable.from_arrays(arrays, 'spelling_bigrams')
+        self.bigram_terms_indptr = arrays['spelling_bigram_terms_indptr']
+        self.bigram_terms = arrays['spelling_bigram_terms']  # term ids of bigram i are in [indptr[i], indptr[i + 1])
+        self.bigram_counts = arrays['spelling_bigram_counts']  # occurrences of the bigram in each of these terms
+        self.term_lengths = arrays['spelling_term_lengths']
+
+    def candidates(self, word: str, max_distance: int) -> np.ndarray:
+        """
+        Ids of all terms whose folded edit distance to word may be at most max_distance, and a few more
+        :return: sorted term ids
+        """
+        common = np.zeros(len(self.term_lengths), dtype=np.int64)  # bigrams shared with word, by term id
+        for bigram, count in Counter(_padded_bigrams(word)).items():
+            i = self.bigrams.find(bigram)
+            if i != -1:
+                start, end = self.bigram_terms_indptr[i], self.bigram_terms_indptr[i + 1]
+                common[self.bigram_terms[start:end]] += np.minimum(self.bigram_counts[start:end], count)
+
+        lengths = self.term_lengths.astype(np.int64)
+        possible = (np.abs(lengths - len(word)) <= max_distance) & \
+                   (common >= np.maximum(lengths, len(word)) + 1 - 2 * max_distance)
+        return np.flatnonzero(possible)
+
+    def nbytes(self) -> int:
+        return self.bigrams.nbytes() + self.bigram_terms_indptr.nbytes + self.bigram_terms.nbytes + \
+            self.bigram_counts.nbytes + self.term_lengths.nbytes
@@ -1,7 +1,8 @@
+import numpy as np
 from math import sqrt
 from strsimpy.jaro_winkler import JaroWinkler
-from strsimpy.weighted_levenshtein import WeightedLevenshtein
-from strsimpy.weighted_levenshtein import CharacterSubstitutionInterface
+
+from util.spelling_candidates import SpellingCandidateIndex
 
 
 class SpellingCorrection:
@@ -44,25 +45,119 @@ for i in KEYBOARD_COOR.keys():
         WEIGHTS[(i, j)] = _euc_distance(i, j)
 
 
-class CharacterSubstitution(CharacterSubstitutionInterface):
-    def cost(self, c0, c1):
-        if c0 in KEYBOARD_COOR.keys() and c1 in KEYBOARD_COOR.keys():
-            return WEIGHTS[(c0, c1)]
-        else:
-            return 1
-
-
-WEIGHTED_LEVENSHTEIN = WeightedLevenshtein(CharacterSubstitution())
-
-
-# TODO: speed up?
-def get_closest_term(word: str, terms: list) -> str:
-    scores = []
-    for i, term in enumerate(terms):
-        score = WEIGHTED_LEVENSHTEIN.distance(word, term)
-        scores.append((score, term))
-    scores = sorted(scores, key=lambda tpl: tpl[0])
-    return scores[0][1]
+# Substitution cost between characters by index, letters of the keyboard first, any other character last
+KEYBOARD_CHARS = sorted(KEYBOARD_COOR.keys())
+OTHER_CHAR = len(KEYBOARD_CHARS)
+SUBSTITUTION_MATRIX = np.ones((OTHER_CHAR + 1, OTHER_CHAR + 1), dtype=np.float64)
+for i, c0 in enumerate(KEYBOARD_CHARS):
+    for j, c1 in enumerate(KEYBOARD_CHARS):
+        SUBSTITUTION_MATRIX[i, j] = WEIGHTS[(c0, c1)]
+
+# k: code point, v: index in SUBSTITUTION_MATRIX, for ascii only, any other code point is OTHER_CHAR
+_CHAR_INDEX = np.full(128, OTHER_CHAR, dtype=np.int64)
+for i, c in enumerate(KEYBOARD_CHARS):
+    _CHAR_INDEX[ord(c)] = i
+
+
+def _char_indexes(code_points: np.ndarray) -> np.ndarray:
+    return np.where(code_points < 128, _CHAR_INDEX[np.minimum(code_points, 127)], OTHER_CHAR)
+
+
+def distances(word: str, candidates: list, max_cost: float = None) -> np.ndarray:
+    """
+    Keyboard weighted Levenshtein distance from word to every candidate
+    Insertion and deletion cost 1, substituting different characters costs the distance between their keys (1 if one
+    of them is not a letter). Candidates of the same length are computed together, one DP row per character of word:
+    a row is the vertical and diagonal moves of all candidates at once, the horizontal moves (insertions) are a running
+    minimum along the row. Only cells within max_cost of the diagonal are kept and a candidate is abandoned as soon as
+    its whole row exceeds max_cost.
+    :param word:
+    :param candidates: list of str
+    :param max_cost: distances above it are not computed, no limit if None
+    :return: distances, np.inf for candidates farther than max_cost
+    """
+    result = np.full(len(candidates), np.inf)
+    if max_cost is None:
+        max_cost = np.inf
+    word_code_points = np.asarray([ord(c) for c in word], dtype=np.int64)
+    word_chars = _char_indexes(word_code_points)
+    n = len(word)
+
+    buckets = {}  # k: length, v: positions in candidates
+    for pos, candidate in enumerate(candidates):
+        if abs(len(candidate) - n) <= max_cost:
+            if len(candidate) in buckets.keys():
+                buckets[len(candidate)].append(pos)
+            else:
+                buckets[len(candidate)] = [pos]
+
+    for length, positions in buckets.items():
+        positions = np.asarray(positions, dtype=np.int64)
+        encoded = ''.join(candidates[pos] for pos in positions).encode('utf-32-le')
+        code_points = np.frombuffer(encoded, dtype=np.uint32).astype(np.int64).reshape(len(positions), length)
+        chars = _char_indexes(code_points)
+
+        columns = np.arange(length + 1)
+        offsets = columns.astype(np.float64)
+        row = np.tile(np.where(columns > max_cost, np.inf, offsets), (len(positions), 1))
+        for i in range(n):
+            cost = SUBSTITUTION_MATRIX[word_chars[i], chars]
+            cost[code_points == word_code_points[i]] = 0
+            moves = np.empty_like(row)
+            moves[:, 0] = row[:, 0] + 1
+            np.minimum(row[:, :-1] + cost, row[:, 1:] + 1, out=moves[:, 1:])
+            # insertions: row[j] = min over k <= j of moves[k] + (j - k)
+            row = np.minimum.accumulate(moves - offsets, axis=1) + offsets
+
+            row[:, np.abs(columns - (i + 1)) > max_cost] = np.inf
+            alive = row.min(axis=1) <= max_cost
+            if not np.all(alive):
+                row, code_points, chars, positions = row[alive], code_points[alive], chars[alive], positions[alive]
+                if len(positions) == 0:
+                    break
+
+        final = row[:, -1]
+        result[positions] = np.where(final <= max_cost, final, np.inf)
+    return result
+
+
+def get_closest_term(word: str, terms: list, candidate_index: SpellingCandidateIndex = None) -> str:
+    """
+    Term with the smallest keyboard weighted edit distance to word, the first one in terms order on ties
+    :param word:
+    :param terms:
+    :param candidate_index: built over terms, every term is compared to word if not provided
+    :return: word itself if there is no term
+    """
+    if len(terms) == 0:
+        return word
+    if candidate_index is None:
+        return terms[__closest__(word, terms, range(len(terms)))[0]]
+
+    # the folded edit distance is a lower bound of the weighted distance: once the closest candidate within radius r
+    # is found at distance d, closer terms can only be among the candidates within radius floor(d)
+    # every term is a candidate within the largest length
+    max_radius = max(len(word), int(candidate_index.term_lengths.max(initial=0)), 1)
+    radius = 1
+    while True:
+        term_ids = candidate_index.candidates(word, radius).tolist()
+        if len(term_ids) != 0:
+            term_id, distance = __closest__(word, terms, term_ids)
+            if distance > radius:
+                term_id, _ = __closest__(word, terms, candidate_index.candidates(word, int(distance)).tolist(),
+                                         max_cost=distance)
+            return terms[term_id]
+        if radius >= max_radius:
+            return word
+        radius = min(radius * 2, max_radius)
+
+
+def __closest__(word: str, terms: list, term_ids, max_cost: float = None) -> (int, float):
+    """(id, distance) of the closest term among term_ids, the smallest id on ties"""
+    term_ids = list(term_ids)
+    d = distances(word, [terms[term_id] for term_id in term_ids], max_cost=max_cost)
+    i = int(np.argmin(d))
+    return term_ids[i], float(d[i])
 
 
 JAROWINKLER = JaroWinkler()
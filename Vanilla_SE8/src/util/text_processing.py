@@ -1,19 +1,29 @@
+from functools import lru_cache
+
 import nltk
 from nltk.stem.porter import PorterStemmer
 from intermediate_class.index_configuration import IndexConfiguration
+from global_variable import STEM_CACHE_SIZE
 
 STEMMER = PorterStemmer()
+STOP_WORDS = frozenset(nltk.corpus.stopwords.words('english'))
 
 
 # PERIOD_RE = re.compile("(?<=[a-zA-Z])\.(?=[a-zA-Z])")
 
 
 def rm_stop_words(tokens: list) -> list:
-    return [t for t in tokens if t not in nltk.corpus.stopwords.words('english')]
+    return [t for t in tokens if t not in STOP_WORDS]
+
+
+@lru_cache(maxsize=STEM_CACHE_SIZE)
+def stem_token(token: str) -> str:
+    """Memoized Porter stemming, keyed by surface form"""
+    return STEMMER.stem(token)
 
 
 def stem(tokens: list) -> list:
-    return [STEMMER.stem(t) for t in tokens]
+    return [stem_token(t) for t in tokens]
 
 
 def normalize(s: str) -> str:
@@ -22,15 +32,18 @@ def normalize(s: str) -> str:
     return s
 
 
+def tokenize(string: str, normalization: bool) -> list:
+    if normalization:
+        string = normalize(string)
+    return nltk.word_tokenize(string)
+
+
 def process(string: str, config: IndexConfiguration) -> list:
     stop_words_removal = config.stop_words_removal
     stemming = config.stemming
     normalization = config.normalization
 
-    if normalization:
-        string = normalize(string)
-
-    tokens = nltk.word_tokenize(string)
+    tokens = tokenize(string, normalization)
 
     if stop_words_removal:
         tokens = rm_stop_words(tokens)
@@ -44,6 +57,11 @@ def process(string: str, config: IndexConfiguration) -> list:
     return tokens
 
 
+def process_many(strings: list, config: IndexConfiguration) -> list:
+    """Process a batch of strings with the same configuration, equivalent to [process(s, config) for s in strings]"""
+    return [process(string=string, config=config) for string in strings]
+
+
 def get_terms(content: str, config: IndexConfiguration) -> list:
     stop_words_removal = config.stop_words_removal
     stemming = config.stemming
@@ -55,10 +73,10 @@ def get_terms(content: str, config: IndexConfiguration) -> list:
         tokens = {normalize(t) for t in tokens}
 
     if stop_words_removal:
-        tokens = {t for t in tokens if t not in nltk.corpus.stopwords.words('english')}
+        tokens = {t for t in tokens if t not in STOP_WORDS}
 
     if stemming:
-        tokens = {STEMMER.stem(t) for t in tokens}
+        tokens = {stem_token(t) for t in tokens}
 
     tokens = tokens - {''}
 
@@ -1,4 +1,6 @@
 import pickle
+import numpy as np
+
 from global_variable import TOPIC_INVERTED_INDEX
 
 
@@ -9,16 +11,32 @@ class TopicHandler:
         with open(TOPIC_INVERTED_INDEX, 'rb') as f:
             self.topic_inverted_index = pickle.load(f)
 
-    def get_docids_with_topics(self, topic_list: list) -> set:
-        doc_ids_lst = [self.topic_inverted_index[topic] for topic in topic_list]
-
-        if len(doc_ids_lst) == 0:
-            return set()
+        # one bitmap per topic over integer doc ids, row i is the topic i of get_all_topics()
+        self.__topics__ = self.get_all_topics()
+        self.__topic_rows__ = {topic: i for i, topic in enumerate(self.__topics__)}  # k: topic, v: row in bitmaps
+        doc_ids = [[int(doc_id) for doc_id in self.topic_inverted_index[topic]] for topic in self.__topics__]
+        max_doc_id = max((max(lst) for lst in doc_ids if len(lst) != 0), default=-1)
+        self.bitmaps = np.zeros((len(self.__topics__), max_doc_id + 1), dtype=bool)
+        for i, lst in enumerate(doc_ids):
+            self.bitmaps[i, lst] = True
+
+        # (frozenset of topics, OR of their bitmaps) of the last selection, kept until the selection changes
+        # a single attribute, so a reader never pairs a selection with the bitmap of another one
+        self.__selection__ = (None, None)
+
+    def get_topic_mask(self, topic_list: list) -> np.ndarray:
+        """Bool array by integer doc id, True for the docs with any of the topics"""
+        selection = frozenset(topic_list)
+        cached_selection, bitmap = self.__selection__
+        if selection != cached_selection:
+            rows = [self.__topic_rows__[topic] for topic in selection]
+            bitmap = np.any(self.bitmaps[rows], axis=0) if len(rows) != 0 else \
+                np.zeros(self.bitmaps.shape[1], dtype=bool)
+            self.__selection__ = (selection, bitmap)
+        return bitmap
 
-        r = set(doc_ids_lst[0])
-        for i in range(1, len(topic_list)):
-            r = r.union(r, set(doc_ids_lst[i]))
-        return r
+    def get_docids_with_topics(self, topic_list: list) -> set:
+        return {str(doc_id) for doc_id in np.flatnonzero(self.get_topic_mask(topic_list))}
 
     def get_all_topics(self) -> list:
         all_topics = list(self.topic_inverted_index.keys())
@@ -1,23 +1,80 @@
-def get_bigrams(word: str) -> set:
-    chars = ['$'] + [char for char in word if char != '*'] + ['$']
-    bigrams = []
-    for i in range(0, len(chars) - 1):
-        bigrams.append(chars[i] + chars[i + 1])
-    if word[0] == '*':
-        bigrams.pop(0)
-    elif word[-1] == '*':
-        bigrams.pop()
-    elif word.find('*') == -1:
-        pass
-    else:
-        bigrams.pop(word.find('*'))
-    return set(bigrams)
-
-
-def bigram_term_matched(bigram: str, term: str) -> bool:
-    if bigram[0] == '$':
-        return term[0] == bigram[1]
-    elif bigram[-1] == '$':
-        return term[-1] == bigram[-2]
-    else:
-        return bigram in term
+import numpy as np
+
+from util.binary_storage import StringTable, SortedStringTable
+
+"""
+Permuterm index for wildcard queries
+
+Every rotation of term + '$' is kept in a sorted string table along with the id of the term it comes from. A pattern
+X*Y is rotated to Y$X, the matching terms are those owning a rotation which starts with Y$X: a contiguous range of the
+table found with two binary searches. Patterns with more wildcards X*M1*...*Y are looked up with Y$X as well, only the
+terms of that range are then checked for the middle parts.
+"""
+
+END_MARKER = '$'
+
+
+def is_wildcard_term(term: str) -> bool:
+    """Only such terms can be matched by a wildcard query"""
+    return term.isalpha() and len(term) >= 2
+
+
+def build_permuterm(terms: list) -> dict:
+    """
+    Build the permuterm arrays of a sorted term list
+    :param terms: position of a term is its term id
+    :return: arrays to be stored in index file, see PermutermIndex
+    """
+    rotations = []  # (rotation, term id)
+    for term_id, term in enumerate(terms):
+        if is_wildcard_term(term):
+            s = term + END_MARKER
+            rotations.extend((s[i:] + s[:i], term_id) for i in range(len(s)))
+    # str order is code point order, the same as the utf-8 byte order used by SortedStringTable
+    rotations.sort()
+
+    arrays = StringTable.from_strings([r for r, _ in rotations]).to_arrays('permuterm')
+    arrays['permuterm_terms'] = np.asarray([term_id for _, term_id in rotations], dtype=np.int32)
+    return arrays
+
+
+def _has_middle_parts(term: str, start: int, end: int, middle_parts: list) -> bool:
+    """Check if the middle parts appear in order, without overlapping, in term[start:end]"""
+    for part in middle_parts:
+        i = term.find(part, start, end)
+        if i == -1:
+            return False
+        start = i + len(part)
+    return True
+
+
+class PermutermIndex:
+
+    def __init__(self, arrays: dict, terms: SortedStringTable):
+        self.rotations = SortedStringTable.from_arrays(arrays, 'permuterm')
+        self.rotation_terms = arrays['permuterm_terms']  # term id of every rotation
+        self.__terms__ = terms
+
+    def lookup(self, pattern: str) -> np.ndarray:
+        """
+        Ids of the terms matching a wildcard pattern, '*' matches any sequence of characters
+        :return: sorted term ids
+        """
+        if END_MARKER in pattern:
+            return np.empty(0, dtype=np.int64)
+        parts = pattern.split('*')
+        head, tail = parts[0], parts[-1]
+        middle_parts = [p for p in parts[1:-1] if p != '']
+
+        # exactly one rotation of a term starts with tail + '$', so every term appears at most once in the range
+        lo, hi = self.rotations.prefix_range(tail + END_MARKER + head)
+        term_ids = np.sort(np.asarray(self.rotation_terms[lo:hi], dtype=np.int64))
+
+        if len(middle_parts) != 0:
+            keep = [_has_middle_parts(term, len(head), len(term) - len(tail), middle_parts)
+                    for term in (self.__terms__[int(term_id)] for term_id in term_ids)]
+            term_ids = term_ids[np.asarray(keep, dtype=bool)]
+        return term_ids
+
+    def nbytes(self) -> int:
+        return self.rotations.nbytes() + self.rotation_terms.nbytes